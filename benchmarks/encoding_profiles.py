@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark des profils d'encodage NetCDF (safran_fairy.encoding).
+
+Réécrit un fichier NetCDF SIM2 avec chaque profil puis mesure, pour chacun :
+la taille du fichier, la latence de lecture d'une carte complète pour un jour
+et la latence de lecture d'une chronique complète en un point de grille.
+
+Usage:
+    python benchmarks/encoding_profiles.py 04_data-output/T_QUOT_SIM2_latest-19580801-20260215.nc
+    python benchmarks/encoding_profiles.py FICHIER.nc --quantize pack --repeat 20
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import netCDF4
+import xarray as xr
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from safran_fairy.encoding import ENCODING_PROFILES, get_encoding, get_packing
+
+
+def rewrite(input_file, output_file, var, profile, quantize):
+    """Réécrit input_file avec l'encodage du profil donné"""
+    with xr.open_dataset(input_file) as ds:
+        ds = ds.load()
+    precision = ds[var].attrs.get('precision')
+    packing = None
+    if quantize == 'pack':
+        packing = get_packing(var, precision, (float(ds[var].min()), float(ds[var].max())))
+    encoding = {
+        var: {**get_encoding(profile, ds[var].shape, precision, quantize),
+              **(packing or {'dtype': 'float32'})},
+        'time': {'units': 'days since 1970-01-01 00:00:00',
+                 'calendar': 'standard', 'dtype': 'float64'}
+    }
+    ds.to_netcdf(output_file, encoding=encoding, unlimited_dims=['time'])
+
+
+def time_reads(file, var, repeat, rng):
+    """Latences moyennes (s) de lecture d'une carte et d'une chronique"""
+    with netCDF4.Dataset(file) as nc:
+        nt, ny, nx = nc.variables[var].shape
+        # Points de grille valides (hors masque) pour les chroniques
+        first_map = np.ma.getmaskarray(nc.variables[var][0])
+        valid_points = np.argwhere(~first_map)
+
+    map_times, series_times = [], []
+    for _ in range(repeat):
+        # Réouverture à chaque lecture : pas de cache de chunks HDF5 partagé
+        t = rng.integers(nt)
+        with netCDF4.Dataset(file) as nc:
+            start = time.perf_counter()
+            nc.variables[var][t, :, :]
+            map_times.append(time.perf_counter() - start)
+
+        y, x = valid_points[rng.integers(len(valid_points))]
+        with netCDF4.Dataset(file) as nc:
+            start = time.perf_counter()
+            nc.variables[var][:, y, x]
+            series_times.append(time.perf_counter() - start)
+
+    return np.mean(map_times), np.mean(series_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des profils d'encodage NetCDF")
+    parser.add_argument('file', type=Path, help='Fichier NetCDF SIM2 (une variable)')
+    parser.add_argument('--repeat', type=int, default=10, help='Nombre de lectures par motif')
+    parser.add_argument('--quantize', choices=['round', 'pack'], default=None,
+                        help='Quantification à la précision publiée')
+    args = parser.parse_args()
+
+    var = args.file.stem.split('_QUOT_SIM2')[0]
+    rng = np.random.default_rng(0)
+
+    print(f"{'profil':<12} {'taille (Mo)':>12} {'carte (ms)':>12} {'chronique (ms)':>15}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for profile in [None] + list(ENCODING_PROFILES):
+            output_file = Path(tmp_dir) / f"{profile or 'default'}.nc"
+            rewrite(args.file, output_file, var, profile, args.quantize)
+            size = output_file.stat().st_size / (1024**2)
+            map_latency, series_latency = time_reads(output_file, var, args.repeat, rng)
+            print(f"{profile or 'default':<12} {size:>12.2f} "
+                  f"{map_latency*1000:>12.2f} {series_latency*1000:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
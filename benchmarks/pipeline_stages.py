@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Benchmark des étapes du pipeline sur des archives SIM2 synthétiques
+(benchmarks/sim2_synthetic.py), sans réseau ni S3.
+
+Exécute decompress, split, convert, merge, aggregate, zarr et references
+sur le jeu généré et mesure pour chaque étape la durée, le temps CPU
+(workers inclus), le pic de mémoire et le débit (octets lus par seconde),
+avec les mesures par fonction de safran_fairy.metrics. Les résultats sont
+écrits en JSON ; comparés à un run de référence (--baseline), une étape
+plus lente ou plus gourmande au-delà de --tolerance fait échouer le
+benchmark (code de sortie 1).
+
+Le jeu de données est généré une fois dans WORK_DIR/00_data-download et
+réutilisé ; les dossiers des étapes sont recréés à chaque répétition.
+
+Usage:
+    python benchmarks/pipeline_stages.py /tmp/bench --years 3 --output bench-main.json
+    python benchmarks/pipeline_stages.py /tmp/bench --years 3 --workers 4 --baseline bench-main.json
+    python benchmarks/pipeline_stages.py /tmp/bench --stages split convert --stream --repeat 3
+"""
+
+import io
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import contextlib
+from pathlib import Path
+from datetime import date, datetime
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from safran_fairy import decompress, split, convert, merge, aggregate, write_zarr, generate_references
+from safran_fairy.metrics import RunMetrics, format_bytes
+from sim2_synthetic import generate_dataset, load_variables, RESOURCES_DIR, N_POINTS
+
+STAGES = ['decompress', 'split', 'convert', 'merge', 'aggregate', 'zarr', 'references']
+
+# Mesures comparées à la référence : (clé, libellé)
+COMPARED = [('wall', 'durée'), ('peak_rss', 'pic mémoire')]
+
+
+def get_dirs(WORK_DIR):
+    """Dossiers du pipeline dans WORK_DIR, nommés comme dans config.json.dist"""
+    WORK_DIR = Path(WORK_DIR)
+    return {
+        'DOWNLOAD_DIR':  WORK_DIR / "00_data-download",
+        'RAW_DIR':       WORK_DIR / "01_data-raw",
+        'SPLIT_DIR':     WORK_DIR / "02_data-split",
+        'CONVERT_DIR':   WORK_DIR / "03_data-convert",
+        'OUTPUT_DIR':    WORK_DIR / "04_data-output",
+        'AGGREGATE_DIR': WORK_DIR / "06_data-aggregate",
+        'ZARR_DIR':      WORK_DIR / "07_data-zarr",
+    }
+
+
+def run_stages(dirs, archives, stages, args, METADATA_VARIABLES_FILE):
+    """
+    Exécute les étapes demandées une fois, chacune mesurée.
+
+    Returns:
+        list: Mesures de chaque étape (voir RunMetrics.stage).
+    """
+    for key, directory in dirs.items():
+        if key != 'DOWNLOAD_DIR':
+            shutil.rmtree(directory, ignore_errors=True)
+
+    metrics = RunMetrics()
+    files = {'download': archives}
+    # Sortie des étapes masquée (sauf --verbose), les workers en héritent
+    output = sys.stdout if args.verbose else io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            for stage in stages:
+                with metrics.stage(stage):
+                    files[stage] = run_stage(stage, dirs, files, args, METADATA_VARIABLES_FILE)
+    finally:
+        metrics.close()
+    return metrics.stages
+
+
+def run_stage(stage, dirs, files, args, METADATA_VARIABLES_FILE):
+    """Appelle la fonction d'une étape sur les sorties de l'étape précédente"""
+    if stage == 'decompress':
+        return decompress(dirs['DOWNLOAD_DIR'], dirs['RAW_DIR'], files['download'],
+                          workers=args.workers)
+    if stage == 'split':
+        if args.stream:
+            return split(dirs['DOWNLOAD_DIR'], dirs['SPLIT_DIR'], files['download'],
+                         stream=True, workers=args.workers)
+        return split(dirs['RAW_DIR'], dirs['SPLIT_DIR'], files.get('decompress'),
+                     workers=args.workers)
+    if stage == 'convert':
+        return convert(dirs['SPLIT_DIR'], dirs['CONVERT_DIR'], METADATA_VARIABLES_FILE,
+                       files.get('split'), streaming=args.low_memory, workers=args.workers,
+                       profile=args.encoding, quantize=args.quantize, force=True)
+    if stage == 'merge':
+        return merge(dirs['CONVERT_DIR'], dirs['OUTPUT_DIR'], files.get('convert'),
+                     profile=args.encoding, engine=args.merge_engine,
+                     workers=args.workers, force=True)
+    if stage == 'aggregate':
+        return aggregate(dirs['OUTPUT_DIR'], dirs['AGGREGATE_DIR'], files.get('merge'),
+                         profile=args.encoding, force=True)
+    if stage == 'zarr':
+        return write_zarr(dirs['OUTPUT_DIR'], dirs['ZARR_DIR'], files.get('merge'),
+                          profile=args.encoding, force=True)
+    if stage == 'references':
+        return generate_references(dirs['OUTPUT_DIR'], "https://example.invalid/data",
+                                   files.get('merge'), force=True)
+    raise ValueError(f"Étape inconnue: {stage}")
+
+
+def get_best_runs(runs):
+    """
+    Meilleure mesure de chaque étape sur les répétitions : durée, CPU et pic
+    de mémoire minimaux, les moins perturbés par le reste de la machine (le
+    processus principal garde de la mémoire d'une répétition à l'autre).
+    Les durées de toutes les répétitions sont gardées dans 'walls'.
+    """
+    best = {}
+    for stages in runs:
+        for stage in stages:
+            name = stage['stage']
+            if name not in best:
+                best[name] = {**stage, 'walls': []}
+            elif stage['wall'] < best[name]['wall']:
+                best[name].update(stage, walls=best[name]['walls'],
+                                  cpu=min(stage['cpu'], best[name]['cpu']),
+                                  peak_rss=min(stage['peak_rss'], best[name]['peak_rss']))
+            else:
+                best[name]['cpu'] = min(stage['cpu'], best[name]['cpu'])
+                best[name]['peak_rss'] = min(stage['peak_rss'], best[name]['peak_rss'])
+            best[name]['walls'].append(round(stage['wall'], 3))
+    for stage in best.values():
+        stage['mb_per_s'] = stage['bytes_in'] / 1024**2 / stage['wall'] if stage['wall'] else None
+    return list(best.values())
+
+
+def compare(stages, baseline, tolerance):
+    """
+    Compare chaque étape à la référence.
+
+    Returns:
+        list: Régressions. Ex: ["convert : durée x1.32 (12.1s → 16.0s)"]
+    """
+    reference = {stage['stage']: stage for stage in baseline['stages']}
+    regressions = []
+    print(f"\n{'Étape':<12}" + ''.join(f"{label:>16}" for _, label in COMPARED))
+    for stage in stages:
+        if stage['stage'] not in reference:
+            continue
+        ratios = []
+        for key, label in COMPARED:
+            old, new = reference[stage['stage']][key], stage[key]
+            ratio = new / old if old else 1.0
+            flag = "❌" if ratio > 1 + tolerance else "  "
+            ratios.append(f"{flag} x{ratio:.2f}".rjust(16))
+            if ratio > 1 + tolerance:
+                regressions.append(f"{stage['stage']} : {label} x{ratio:.2f} ({old:.4g} → {new:.4g})")
+        print(f"{stage['stage']:<12}" + ''.join(ratios))
+    return regressions
+
+
+def print_results(stages):
+    """Tableau des mesures de chaque étape"""
+    print(f"\n{'Étape':<12}{'Durée':>9}{'CPU':>9}{'Pic mémoire':>14}{'Lu':>12}{'Produit':>12}{'Débit':>12}")
+    for stage in stages:
+        rate = f"{stage['mb_per_s']:.1f} Mo/s" if stage['mb_per_s'] else "-"
+        print(f"{stage['stage']:<12}{stage['wall']:>8.1f}s{stage['cpu']:>8.1f}s"
+              f"{format_bytes(stage['peak_rss']):>14}{format_bytes(stage['bytes_in']):>12}"
+              f"{format_bytes(stage['bytes_out']):>12}{rate:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark des étapes du pipeline sur des données synthétiques')
+    parser.add_argument('work_dir', type=Path, help='Dossier de travail (jeu de données et sorties des étapes)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help='Étapes mesurées')
+    parser.add_argument('--repeat', type=int, default=1, help='Nombre de répétitions (meilleure durée gardée)')
+    parser.add_argument('--output', type=Path, default=None, help='Fichier JSON des résultats')
+    parser.add_argument('--baseline', type=Path, default=None, help='Résultats de référence (JSON) à comparer')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='Dégradation tolérée par rapport à la référence (0.15 = +15%%)')
+    parser.add_argument('--verbose', action='store_true', help='Affiche la sortie des étapes')
+
+    # Jeu de données (voir sim2_synthetic.py)
+    parser.add_argument('--years', type=int, default=3, help="Nombre d'années générées")
+    parser.add_argument('--end', type=date.fromisoformat, default=date(2025, 10, 11), help='Dernier jour généré')
+    parser.add_argument('--variables', nargs='+', default=None, help='Variables générées (défaut : toutes)')
+    parser.add_argument('--points', type=int, default=N_POINTS, help='Nombre de points de grille')
+    parser.add_argument('--seed', type=int, default=0, help='Graine aléatoire')
+
+    # Options du pipeline (voir main.py)
+    parser.add_argument('--workers', type=int, default=1, help='Nombre de processus des étapes parallélisables')
+    parser.add_argument('--stream', action='store_true', help='Découpe directement les .csv.gz')
+    parser.add_argument('--low-memory', action='store_true', help='Conversion NetCDF par fenêtres temporelles')
+    parser.add_argument('--encoding', choices=['map', 'timeseries', 'balanced'], default=None,
+                        help="Profil d'encodage NetCDF")
+    parser.add_argument('--quantize', choices=['round', 'pack'], default=None, help='Quantification')
+    parser.add_argument('--merge-engine', choices=['native', 'nco'], default='native', help='Moteur de fusion')
+    args = parser.parse_args()
+
+    stages = [stage for stage in STAGES if stage in args.stages]
+    if args.stream and 'decompress' in stages:
+        stages.remove('decompress')
+
+    METADATA_VARIABLES_FILE = sorted(RESOURCES_DIR.glob("safran-variables_*.csv"))[-1]
+    dirs = get_dirs(args.work_dir)
+    archives = generate_dataset(dirs['DOWNLOAD_DIR'], args.years, args.end, args.variables,
+                                args.points, seed=args.seed,
+                                METADATA_VARIABLES_FILE=METADATA_VARIABLES_FILE)
+
+    runs = []
+    for i in range(args.repeat):
+        print(f"\n⏱️  Run {i + 1}/{args.repeat} : {', '.join(stages)}")
+        runs.append(run_stages(dirs, archives, stages, args, METADATA_VARIABLES_FILE))
+    results = get_best_runs(runs)
+    print_results(results)
+
+    report = {
+        'started_at': datetime.now().isoformat(),
+        'host': {'python': platform.python_version(), 'machine': platform.machine(),
+                 'cpu_count': len(os.sched_getaffinity(0))},
+        'dataset': {'years': args.years, 'end': args.end.isoformat(), 'points': args.points,
+                    'variables': args.variables or list(load_variables(METADATA_VARIABLES_FILE).index),
+                    'seed': args.seed,
+                    'archives': {f.name: f.stat().st_size for f in archives}},
+        'options': {key: value for key, value in vars(args).items()
+                    if key in ('workers', 'stream', 'low_memory', 'encoding', 'quantize',
+                               'merge_engine', 'repeat')},
+        'stages': results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, default=str))
+        print(f"\n📊 Résultats : {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get('dataset', {}).get('archives') != report['dataset']['archives']:
+            print("\n⚠️  Jeu de données différent de la référence : comparaison indicative")
+        changed = [key for key, value in report['options'].items()
+                   if key != 'repeat' and baseline.get('options', {}).get(key) != value]
+        if changed:
+            print(f"\n⚠️  Options différentes de la référence : {', '.join(changed)}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} régression(s) au-delà de +{args.tolerance:.0%} :")
+            for regression in regressions:
+                print(f"   - {regression}")
+            return 1
+        print(f"\n✅ Aucune régression au-delà de +{args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
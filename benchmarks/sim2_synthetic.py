@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Générateur d'archives SIM2 synthétiques (QUOT_SIM2_*.csv.gz), pour mesurer
+le pipeline hors ligne sans télécharger les archives de data.gouv.fr.
+
+Les fichiers ont la forme des archives réelles : colonnes LAMBX;LAMBY;DATE
+puis une colonne par variable de resources/safran-variables_*.csv, lignes
+triées par date puis par point, grille SIM2 de 9892 points à 8 km en
+Lambert II étendu (hectomètres), valeurs arrondies à la précision publiée.
+Le découpage suit celui de data.gouv.fr : archives historiques par
+décennie, un fichier previous (1er janvier → fin du mois précédent) et un
+fichier latest (mois en cours).
+
+Les valeurs sont plausibles (cycle saisonnier, gradient nord-sud, relief,
+jours secs, neige en montagne l'hiver) mais pas réelles : elles donnent des
+tailles et des taux de compression réalistes, pas des données à publier.
+Elles ne dépendent que de la graine et de la date : deux runs avec les mêmes
+options produisent les mêmes fichiers.
+
+Usage:
+    python benchmarks/sim2_synthetic.py /tmp/sim2 --years 3
+    python benchmarks/sim2_synthetic.py /tmp/sim2 --years 12 --end 2026-10-11 --variables T PRELIQ
+    python benchmarks/sim2_synthetic.py /tmp/sim2 --grid 00_data-download/QUOT_SIM2_latest-*.csv.gz
+    python benchmarks/sim2_synthetic.py /tmp/sim2 --multi-member
+"""
+
+import sys
+import gzip
+import argparse
+from pathlib import Path
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+RESOURCES_DIR = Path(__file__).resolve().parents[1] / "resources"
+
+# Grille SIM2 : 9892 points espacés de 8 km (80 hm), LAMBX de 600 à 11960 hm
+N_POINTS = 9892
+GRID_STEP = 80
+GRID_ORIGIN = (600, 16170)
+GRID_SHAPE = (143, 134)
+
+# Contour simplifié de la France métropolitaine et de la Corse (Lambert II
+# étendu, hm). La grille synthétique garde les N_POINTS points de la maille
+# les plus proches du contour (points intérieurs puis bande côtière).
+FRANCE_OUTLINE = [
+    (6150, 26775), (6611, 26366), (7294, 25909), (7813, 25767), (7848, 25367), (8488, 25080),
+    (8926, 25022), (9293, 24719), (9436, 24772), (9847, 24631), (10314, 24575), (10029, 24119),
+    (9910, 23465), (9948, 23010), (9477, 22825), (9127, 22304), (8885, 21791), (8942, 21405),
+    (9469, 21655), (9577, 21127), (9513, 21023), (9637, 20774), (9467, 20319), (9647, 19940),
+    (9676, 19440), (10269, 19177), (10159, 18779), (9772, 18499), (9231, 17967), (8930, 17953),
+    (8453, 18044), (7838, 18191), (7429, 18291), (6946, 18115), (6586, 17443), (6688, 17144),
+    (6135, 17162), (5705, 17051), (5269, 17222), (4901, 17394), (4657, 17510), (4081, 17469),
+    (3759, 17647), (3272, 17777), (2951, 17903), (2660, 18274), (2894, 18407), (3041, 18957),
+    (3152, 19620), (3317, 20669), (3218, 21063), (3230, 21341), (2826, 21750), (2580, 22153),
+    (2307, 22671), (2058, 22910), (1698, 23158), (997, 23325), (723, 23628), (721, 24019),
+    (967, 24276), (1710, 24328), (2229, 24035), (2805, 24145), (3172, 24104), (3111, 24352),
+    (3097, 24798), (2914, 25332), (3141, 25242), (3402, 25252), (3502, 24891), (4010, 24871),
+    (4377, 24970), (4457, 25247), (5075, 25478), (5401, 25674), (5439, 25953), (5479, 26398),
+    (5657, 26620), (6010, 26730),
+]
+CORSICA_OUTLINE = [
+    (11764, 18034), (11834, 17705), (11977, 17047), (11862, 16477), (11759, 16210),
+    (11403, 16437), (11210, 16757), (11133, 17198), (11275, 17489), (11635, 17631),
+]
+
+# Massifs (centre en hm, rayon en hm) : relief approché, pour la température et la neige
+MOUNTAINS = [
+    ((9500, 20600), 700),   # Alpes
+    ((4600, 17500), 600),   # Pyrénées
+    ((6700, 20300), 600),   # Massif central
+    ((9300, 23300), 350),   # Vosges
+    ((8900, 22000), 350),   # Jura
+    ((11500, 17200), 300),  # Corse
+]
+
+# Modèle de chaque variable : (type, paramètres)
+#   temperature : écart à la température moyenne (°C)
+#   precipitation : probabilité d'un jour non nul, échelle (mm)
+#   snow : échelle (unité de la variable), valeur nulle hors montagne l'hiver
+#   seasonal : moyenne, amplitude saisonnière (maximum en juillet), bruit, bornes
+VARIABLE_MODELS = {
+    'T':           ('temperature', (0.0,)),
+    'TINF_H':      ('temperature', (-5.0,)),
+    'TSUP_H':      ('temperature', (5.0,)),
+    'PRELIQ':      ('precipitation', (0.45, 5.0)),
+    'PE':          ('precipitation', (0.30, 4.0)),
+    'DRAINC':      ('precipitation', (0.25, 2.0)),
+    'RUNC':        ('precipitation', (0.10, 1.0)),
+    'PRENEI':      ('snow', (4.0,)),
+    'RESR_NEIGE':  ('snow', (60.0,)),
+    'RESR_NEIGE6': ('snow', (60.0,)),
+    'HTEURNEIGE':  ('snow', (0.3,)),
+    'HTEURNEIGE6': ('snow', (0.3,)),
+    'HTEURNEIGEX': ('snow', (0.35,)),
+    'SNOW_FRAC':   ('snow', (100.0,)),
+    'ECOULEMENT':  ('snow', (3.0,)),
+    'WGI_RACINE':  ('snow', (0.02,)),
+    'ETP':         ('seasonal', (1.8, 1.6, 0.5, 0, None)),
+    'EVAP':        ('seasonal', (1.5, 1.2, 0.5, 0, None)),
+    'FF':          ('seasonal', (3.5, -0.6, 1.5, 0, None)),
+    'Q':           ('seasonal', (7.0, 3.0, 1.0, 0, None)),
+    'DLI':         ('seasonal', (2900, 500, 200, 0, None)),
+    'SSI':         ('seasonal', (1300, 1000, 400, 0, None)),
+    'HU':          ('seasonal', (78, -10, 8, 0, 100)),
+    'SWI':         ('seasonal', (0.7, -0.25, 0.05, 0, 1.5)),
+    'SSWI_10J':    ('seasonal', (0.0, 0.5, 1.0, None, None)),
+    'WG_RACINE':   ('seasonal', (0.25, -0.06, 0.02, 0, None)),
+}
+DEFAULT_MODEL = ('seasonal', (1.0, 0.5, 0.2, 0, None))
+
+ID_COLUMNS = ['LAMBX', 'LAMBY', 'DATE']
+
+
+# ─── Grille ──────────────────────────────────────────────────────────────────
+
+def get_outline_distance(x, y, outline):
+    """Distance (hm) de chaque point au polygone, nulle pour les points intérieurs"""
+    polygon = np.asarray(outline, dtype='float64')
+    x0, y0 = polygon[:, 0], polygon[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+
+    inside = np.zeros(x.shape, dtype=bool)
+    distance = np.full(x.shape, np.inf)
+    for ax, ay, bx, by in zip(x0, y0, x1, y1):
+        # Parité du nombre de côtés traversés par une demi-droite horizontale
+        crosses = (ay > y) != (by > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inside ^= crosses & (x < (bx - ax) * (y - ay) / (by - ay) + ax)
+        # Distance au segment
+        dx, dy = bx - ax, by - ay
+        t = np.clip(((x - ax) * dx + (y - ay) * dy) / (dx * dx + dy * dy), 0, 1)
+        distance = np.minimum(distance, np.hypot(x - ax - t * dx, y - ay - t * dy))
+    return np.where(inside, 0.0, distance)
+
+
+def get_grid(n_points=N_POINTS, grid_file=None) -> pd.DataFrame:
+    """
+    Points de la grille SIM2, triés par LAMBX puis LAMBY.
+
+    Args:
+        n_points (int):             Nombre de points de la grille synthétique.
+        grid_file (Path, optional): Archive SIM2 réelle (.csv ou .csv.gz) dont la
+                                    grille est reprise. Ex: l'archive latest (la plus petite).
+
+    Returns:
+        pd.DataFrame: Colonnes LAMBX, LAMBY (hm).
+    """
+    if grid_file is not None:
+        points = pd.read_csv(grid_file, sep=';', usecols=['LAMBX', 'LAMBY'])
+        return (points.drop_duplicates()
+                .sort_values(['LAMBX', 'LAMBY']).reset_index(drop=True))
+
+    xs = GRID_ORIGIN[0] + GRID_STEP * np.arange(GRID_SHAPE[0])
+    ys = GRID_ORIGIN[1] + GRID_STEP * np.arange(GRID_SHAPE[1])
+    x, y = (a.ravel() for a in np.meshgrid(xs, ys, indexing='ij'))
+    distance = np.minimum(get_outline_distance(x, y, FRANCE_OUTLINE),
+                          get_outline_distance(x, y, CORSICA_OUTLINE))
+    keep = np.sort(np.argsort(distance, kind='stable')[:n_points])
+    return pd.DataFrame({'LAMBX': x[keep], 'LAMBY': y[keep]})
+
+
+def get_relief(grid) -> np.ndarray:
+    """Relief approché de chaque point, entre 0 (plaine) et 1 (haute montagne)"""
+    x, y = grid['LAMBX'].to_numpy('float64'), grid['LAMBY'].to_numpy('float64')
+    relief = np.zeros(len(grid))
+    for (cx, cy), radius in MOUNTAINS:
+        relief = np.maximum(relief, np.exp(-((x - cx)**2 + (y - cy)**2) / (2 * (radius / 2)**2)))
+    return relief
+
+
+# ─── Valeurs ─────────────────────────────────────────────────────────────────
+
+def load_variables(METADATA_VARIABLES_FILE=None) -> pd.DataFrame:
+    """Variables SIM2 (ordre des colonnes des archives), du CSV de resources/ le plus récent"""
+    if METADATA_VARIABLES_FILE is None:
+        METADATA_VARIABLES_FILE = sorted(RESOURCES_DIR.glob("safran-variables_*.csv"))[-1]
+    return pd.read_csv(METADATA_VARIABLES_FILE, index_col='variable')
+
+
+def get_decimals(var, metadata_variables) -> int:
+    """Décimales publiées : précision du CSV des variables (0.1 → 1), sinon 3"""
+    precision = metadata_variables.loc[var, 'precision'] if var in metadata_variables.index else None
+    if pd.notna(precision):
+        return max(0, int(round(-np.log10(float(precision)))))
+    return 3
+
+
+def generate_values(var, days, grid, relief, rng) -> np.ndarray:
+    """
+    Valeurs journalières d'une variable, tableau (jours, points).
+
+    Args:
+        var (str):          Nom de la variable. Ex: 'T'
+        days (DatetimeIndex): Jours à générer.
+        grid (DataFrame):   Points de la grille (voir get_grid).
+        relief (ndarray):   Relief de chaque point (voir get_relief).
+        rng (Generator):    Générateur aléatoire.
+    """
+    kind, params = VARIABLE_MODELS.get(var, DEFAULT_MODEL)
+    n_days, n_points = len(days), len(grid)
+    # Saison : +1 mi-juillet, -1 mi-janvier
+    season = np.cos(2 * np.pi * (days.dayofyear.to_numpy() - 196) / 365.25)[:, None]
+    north = ((grid['LAMBY'].to_numpy() - GRID_ORIGIN[1]) / (GRID_STEP * GRID_SHAPE[1]))[None, :]
+    # Anomalie du jour commune à tous les points + bruit local
+    weather = rng.normal(size=(n_days, 1))
+    noise = rng.normal(size=(n_days, n_points))
+
+    if kind == 'temperature':
+        (offset,) = params
+        return (11.5 + offset + 8 * season - 4 * north - 10 * relief[None, :]
+                + 2.5 * weather + 1.0 * noise)
+
+    if kind == 'precipitation':
+        probability, scale = params
+        wet = rng.random((n_days, n_points)) < probability * (1 + 0.5 * relief[None, :]) * (1 + 0.3 * weather)
+        return np.where(wet, rng.gamma(0.8, scale * (1 + relief[None, :]), (n_days, n_points)), 0.0)
+
+    if kind == 'snow':
+        (scale,) = params
+        cold = np.clip(-season, 0, 1) * relief[None, :] ** 2
+        snowy = rng.random((n_days, n_points)) < cold
+        return np.where(snowy, np.minimum(scale, scale * cold * rng.gamma(2.0, 0.5, (n_days, n_points))), 0.0)
+
+    mean, amplitude, sigma, lower, upper = params
+    values = mean + amplitude * season + sigma * (0.5 * weather + noise)
+    return np.clip(values, lower, upper)
+
+
+def generate_table(days, grid, relief, variables, metadata_variables, seed) -> pd.DataFrame:
+    """Lignes d'une période : jours x points, triées par date puis par point"""
+    rng = np.random.default_rng([seed, days[0].toordinal()])
+    table = {
+        'LAMBX': np.tile(grid['LAMBX'].to_numpy(), len(days)),
+        'LAMBY': np.tile(grid['LAMBY'].to_numpy(), len(days)),
+        'DATE':  np.repeat(days.strftime('%Y%m%d').astype('int64'), len(grid)),
+    }
+    for var in variables:
+        values = generate_values(var, days, grid, relief, rng)
+        table[var] = np.round(values, get_decimals(var, metadata_variables)).ravel()
+    return pd.DataFrame(table)
+
+
+# ─── Archives ────────────────────────────────────────────────────────────────
+
+def get_archive_plan(end: date, years: int) -> list:
+    """
+    Archives d'une période de years années se terminant à end, nommées et
+    découpées comme sur data.gouv.fr.
+
+    Returns:
+        list: (nom, premier jour, dernier jour).
+              Ex: [('QUOT_SIM2_2020-2024.csv.gz', date(2020, 1, 1), date(2024, 12, 31)),
+                   ('QUOT_SIM2_previous-2025-202509.csv.gz', date(2025, 1, 1), date(2025, 9, 30)),
+                   ('QUOT_SIM2_latest-20251001-20251011.csv.gz', date(2025, 10, 1), date(2025, 10, 11))]
+    """
+    latest_start = end.replace(day=1)
+    previous_start = date(end.year, 1, 1)
+    plan = []
+
+    # Historique : années complètes, une archive par décennie (bornée à la période)
+    first_year = end.year - years + 1
+    year = first_year
+    while year < previous_start.year:
+        last_year = min(year // 10 * 10 + 9, previous_start.year - 1)
+        plan.append((f"QUOT_SIM2_{year}-{last_year}.csv.gz",
+                     date(year, 1, 1), date(last_year, 12, 31)))
+        year = last_year + 1
+
+    if previous_start < latest_start:
+        previous_end = latest_start - timedelta(days=1)
+        plan.append((f"QUOT_SIM2_previous-{previous_start.year}-{previous_end.strftime('%Y%m')}.csv.gz",
+                     previous_start, previous_end))
+    plan.append((f"QUOT_SIM2_latest-{latest_start.strftime('%Y%m%d')}-{end.strftime('%Y%m%d')}.csv.gz",
+                 latest_start, end))
+    return plan
+
+
+def write_archive(output_file, start: date, end: date, grid, variables,
+                  metadata_variables, seed=0, COMPRESSION_LEVEL=6, multi_member=False):
+    """
+    Écrit une archive .csv.gz, mois par mois (mémoire bornée à un mois de données).
+    Avec multi_member, chaque mois est un membre gzip distinct (comme une
+    archive produite par bgzip ou pigz --independent).
+
+    Returns:
+        int: Nombre de lignes écrites.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pv
+
+    output_file = Path(output_file)
+    relief = get_relief(grid)
+    tmp_file = output_file.with_name(output_file.name + '.tmp')
+    n_rows = 0
+    with open(tmp_file, 'wb') as raw:
+        f = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=COMPRESSION_LEVEL)
+        f.write((';'.join(ID_COLUMNS + list(variables)) + '\n').encode())
+        for month_start in pd.date_range(start.replace(day=1), end, freq='MS'):
+            days = pd.date_range(max(month_start.date(), start),
+                                 min((month_start + pd.offsets.MonthEnd(0)).date(), end))
+            table = generate_table(days, grid, relief, variables, metadata_variables, seed)
+            pv.write_csv(pa.Table.from_pandas(table, preserve_index=False), f,
+                         pv.WriteOptions(include_header=False, delimiter=';'))
+            n_rows += len(table)
+            if multi_member:
+                f.close()
+                f = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=COMPRESSION_LEVEL)
+        f.close()
+    tmp_file.replace(output_file)
+    return n_rows
+
+
+def generate_dataset(OUTPUT_DIR, years=3, end=date(2025, 10, 11), variables=None,
+                     n_points=N_POINTS, grid_file=None, seed=0, COMPRESSION_LEVEL=6,
+                     METADATA_VARIABLES_FILE=None, multi_member=False, force=False) -> list:
+    """
+    Écrit un jeu d'archives SIM2 synthétiques dans OUTPUT_DIR.
+
+    Args:
+        OUTPUT_DIR (Path):           Dossier des archives (comme DOWNLOAD_DIR).
+        years (int):                 Nombre d'années couvertes, jusqu'à end.
+        end (date):                  Dernier jour (fin du fichier latest).
+        variables (list, optional):  Variables à générer. Défaut: toutes celles du CSV des variables.
+        n_points (int):              Nombre de points de la grille synthétique.
+        grid_file (Path, optional):  Archive réelle dont la grille est reprise (voir get_grid).
+        seed (int):                  Graine : mêmes options, mêmes fichiers.
+        COMPRESSION_LEVEL (int):     Niveau gzip (6 : celui de gzip par défaut).
+        multi_member (bool):         Un membre gzip par mois (décompression parallèle).
+        force (bool):                Réécrit les archives existantes.
+
+    Returns:
+        list[Path]: Archives, dans l'ordre chronologique.
+    """
+    OUTPUT_DIR = Path(OUTPUT_DIR)
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    metadata_variables = load_variables(METADATA_VARIABLES_FILE)
+    variables = list(variables or metadata_variables.index)
+    grid = get_grid(n_points, grid_file)
+    print(f"🗺️  Grille : {len(grid)} points | {len(variables)} variables")
+
+    archives = []
+    for name, start, stop in get_archive_plan(end, years):
+        output_file = OUTPUT_DIR / name
+        archives.append(output_file)
+        if output_file.exists() and not force:
+            print(f"   ⏭️  {name} existe déjà")
+            continue
+        n_rows = write_archive(output_file, start, stop, grid, variables,
+                               metadata_variables, seed, COMPRESSION_LEVEL, multi_member)
+        print(f"   💾 {name} ({n_rows} lignes, {output_file.stat().st_size / 1024**2:.1f} Mo)")
+    return archives
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère des archives SIM2 synthétiques")
+    parser.add_argument('output_dir', type=Path, help='Dossier des archives .csv.gz')
+    parser.add_argument('--years', type=int, default=3, help="Nombre d'années couvertes")
+    parser.add_argument('--end', type=date.fromisoformat, default=date(2025, 10, 11),
+                        help='Dernier jour (fin du fichier latest). Ex: 2025-10-11')
+    parser.add_argument('--variables', nargs='+', default=None,
+                        help='Variables à générer (défaut : toutes)')
+    parser.add_argument('--points', type=int, default=N_POINTS, help='Nombre de points de grille')
+    parser.add_argument('--grid', type=Path, default=None,
+                        help='Archive SIM2 réelle dont la grille est reprise')
+    parser.add_argument('--seed', type=int, default=0, help='Graine aléatoire')
+    parser.add_argument('--compresslevel', type=int, default=6, help='Niveau de compression gzip')
+    parser.add_argument('--multi-member', action='store_true', help='Un membre gzip par mois')
+    parser.add_argument('--force', action='store_true', help='Réécrit les archives existantes')
+    args = parser.parse_args()
+
+    generate_dataset(args.output_dir, args.years, args.end, args.variables,
+                     args.points, args.grid, args.seed, args.compresslevel,
+                     multi_member=args.multi_member, force=args.force)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -35,6 +35,9 @@ RESOURCES_DIR = Path("resources")
 WELCOME_FILE = RESOURCES_DIR / config['WELCOME_FILE']
 METADATA_VARIABLES_FILE = RESOURCES_DIR / config['METADATA_VARIABLES_FILE']
 STATE_FILE = config['STATE_FILE']
+STATE_DB = config.get('STATE_DB', 'pipeline_state.sqlite')
+RUN_REPORT_FILE = config.get('RUN_REPORT_FILE', 'run_report.json')
+PROMETHEUS_TEXTFILE = config.get('PROMETHEUS_TEXTFILE')
 INDEX_PATH = config['INDEX_PATH']
 DOWNLOAD_DIR = config['DOWNLOAD_DIR']
 RAW_DIR = config['RAW_DIR']
@@ -42,6 +45,8 @@ SPLIT_DIR = config['SPLIT_DIR']
 CONVERT_DIR = config['CONVERT_DIR']
 OUTPUT_DIR = config['OUTPUT_DIR']
 CATALOG_DIR = config['CATALOG_DIR']
+AGGREGATE_DIR = config.get('AGGREGATE_DIR', '06_data-aggregate')
+ZARR_DIR = config.get('ZARR_DIR', '07_data-zarr')
 METEO_BASE_URL = config['METEO_BASE_URL']
 METEO_DATASET_ID = config['METEO_DATASET_ID']
 RDG_BASE_URL = config['RDG_BASE_URL']
@@ -65,21 +70,31 @@ if MODE == "dev":
 
 from safran_fairy import (apply_s3_bucket_policy, apply_s3_bucket_cors,
                           list_s3_files, download, decompress, split, convert,
-                          merge, upload_s3, delete_s3_files,
+                          merge, run_pipeline, aggregate, write_zarr, generate_references,
+                          StateStore, print_stats, RunMetrics,
+                          get_s3_client, S3Inventory, upload_s3, publish_s3,
+                          delete_s3_files,
                           generate_stac_catalog, generate_index,
-                          clean_local, clean_s3)
+                          clean_local, clean_s3, clean_zarr_s3)
 
 S3_CREDENTIALS = dict(S3_ACCESS_KEY=S3_ACCESS_KEY,
                       S3_SECRET_KEY=S3_SECRET_KEY,
                       S3_ENDPOINT=S3_ENDPOINT,
                       S3_REGION=S3_REGION)
 
+# URL publique des NetCDF publiés (lue par les clients des index de références)
+if S3_ENDPOINT:
+    S3_DATA_URL = f"{S3_ENDPOINT.rstrip('/')}/{S3_BUCKET}/data/{S3_DATA_PREFIX}"
+else:
+    S3_DATA_URL = f"https://{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/data/{S3_DATA_PREFIX}"
+
 
 def main():
     parser = argparse.ArgumentParser(description='SAFRAN Fairy - Pipeline de traitement')
 
     # Setup bucket (hors pipeline)
     parser.add_argument('--setup',      action='store_true', help='Configure le bucket S3 (policy + CORS)')
+    parser.add_argument('--stats',      action='store_true', help="Affiche les statistiques des données (état du pipeline)")
 
     # Pipeline complet
     parser.add_argument('--all',        action='store_true', help='Exécute le pipeline complet')
@@ -90,29 +105,91 @@ def main():
     parser.add_argument('--split',      action='store_true', help='Découpe les CSV par variable')
     parser.add_argument('--convert',    action='store_true', help='Convertit en NetCDF')
     parser.add_argument('--merge',      action='store_true', help='Fusionne temporellement')
+    parser.add_argument('--aggregate',  action='store_true', help='Calcule les agrégats mensuels et annuels')
+    parser.add_argument('--zarr',       action='store_true', help='Écrit les stores Zarr des fichiers mergés')
+    parser.add_argument('--references', action='store_true', help='Génère les index de références (kerchunk) des NetCDF mergés')
     parser.add_argument('--upload',     action='store_true', help='Upload sur le S3')
     parser.add_argument('--ui',         action='store_true', help='Génère et uploade le catalogue STAC')
     parser.add_argument('--clean',      action='store_true', help='Nettoie les anciennes versions')
 
     # Options
     parser.add_argument('--overwrite',  action='store_true', help='Écrase les fichiers existants')
-    parser.add_argument('--process',    action='store_true', help='Traite uniquement (decompress + split + convert + merge)')
+    parser.add_argument('--process',    action='store_true', help='Traite uniquement (decompress + split + convert + merge + aggregate + zarr + references)')
+    parser.add_argument('--stream',     action='store_true', help='Découpe directement les .csv.gz, sans décompression sur disque')
+    parser.add_argument('--low-memory', action='store_true', help='Convertit en NetCDF par fenêtres temporelles (mémoire bornée)')
+    parser.add_argument('--encoding',   choices=['map', 'timeseries', 'balanced'], default=None,
+                        help="Profil d'encodage NetCDF (chunking + compression) des fichiers convertis et mergés")
+    parser.add_argument('--quantize',   nargs='?', const='round', choices=['round', 'pack'], default=None,
+                        help='Quantifie les valeurs à la précision publiée : round (arrondi, défaut) ou pack (entiers int16 ou int32 selon les valeurs, float32 au-delà)')
+    parser.add_argument('--merge-engine', choices=['native', 'nco'], default='native',
+                        help='Moteur de fusion temporelle : native (netCDF4, ajout des nouveaux jours) ou nco (ncrcat)')
+    parser.add_argument('--workers',    type=int, default=1, help='Nombre de processus pour les étapes parallélisables')
+    parser.add_argument('--upload-workers', type=int, default=4, help='Nombre de fichiers uploadés simultanément sur S3')
+    parser.add_argument('--no-diff',    action='store_true',
+                        help='Uploade tous les fichiers, même ceux déjà identiques sur S3 (taille et ETag)')
+    parser.add_argument('--download-workers', type=int, default=4, help='Nombre de fichiers téléchargés simultanément')
+    parser.add_argument('--publish',    choices=['dated', 'stable'], default='dated',
+                        help='Clés S3 des NetCDF mergés : dated (une clé par version datée) ou stable '
+                             '(T_QUOT_SIM2_latest.nc + manifeste, envoi des seules parts modifiées)')
 
     args = parser.parse_args()
 
-    if not any([args.all, args.setup, args.download, args.decompress, args.split,
-                args.convert, args.merge, args.upload, args.ui,
+    if args.stats:
+        print_stats(STATE_DB)
+        return
+
+    if not any([args.all, args.setup, args.download, args.process, args.decompress, args.split,
+                args.convert, args.merge, args.aggregate, args.zarr, args.references, args.upload, args.ui,
                 args.clean, args.overwrite]):
         args.all = True
         args.overwrite = True
 
+    # Mesures de chaque étape : rapport JSON (et Prometheus) écrit même en cas d'échec
+    metrics = RunMetrics(options=vars(args))
+    # État du pipeline : fichiers produits par chaque étape (remplace download_state.json),
+    # fermé même en cas d'échec ou d'arrêt (sys.exit)
+    state = StateStore(STATE_DB)
+    status = 'failed'
+    try:
+        run(args, metrics, state)
+        status = 'success'
+    finally:
+        state.close()
+        metrics.write_report(RUN_REPORT_FILE, status)
+        if PROMETHEUS_TEXTFILE:
+            metrics.write_prometheus(PROMETHEUS_TEXTFILE, status)
+        metrics.close()
+
+
+def run(args, metrics, state):
+    """Exécute les étapes demandées, chacune mesurée par metrics et enregistrée dans state"""
     print_welcome(WELCOME_FILE)
 
+    # Client S3 partagé par les uploads (pool : fichiers x parts simultanés)
+    s3_client = get_s3_client(**S3_CREDENTIALS,
+                              MAX_POOL_CONNECTIONS=args.upload_workers * 4 + 2)
+    # Seuls les fichiers absents ou modifiés sur S3 sont envoyés (sauf --no-diff,
+    # indépendant de --overwrite qui ne concerne que les étapes locales)
+    UPLOAD_OPTIONS = dict(workers=args.upload_workers, s3=s3_client,
+                          diff=not args.no_diff)
+
+    # Inventaire du bucket : listé une fois, tenu à jour par les uploads et
+    # suppressions, et partagé par toutes les étapes S3
+    inventory = None
+    if args.all or args.upload or args.ui or args.clean:
+        inventory = S3Inventory(s3_client, S3_BUCKET,
+                                ["data/"+S3_DATA_PREFIX, "stac-data/"+S3_DATA_PREFIX])
+        UPLOAD_OPTIONS['inventory'] = inventory
+
     downloaded_files  = None
     decompressed_files = None
     splited_files     = None
     converted_files   = None
     merged_files      = None
+    aggregated_files  = None
+    zarr_files        = None
+    reference_files   = None
+    merged_uploaded   = False
 
     # 0. SETUP BUCKET (une seule fois)
     if args.setup:
@@ -121,82 +198,229 @@ def main():
 
     # 1. TÉLÉCHARGEMENT
     if args.all or args.download:
-        downloaded_files = download(STATE_FILE, DOWNLOAD_DIR,
-                                    METEO_BASE_URL, METEO_DATASET_ID)
-        clean_local(DOWNLOAD_DIR)
-        if not downloaded_files:
-            return
+        with metrics.stage('download'):
+            downloaded_files = download(STATE_FILE, DOWNLOAD_DIR,
+                                        METEO_BASE_URL, METEO_DATASET_ID,
+                                        workers=args.download_workers,
+                                        state=state)
+            clean_local(DOWNLOAD_DIR)
+            # Archives téléchargées lors d'un run interrompu avant la fin du merge
+            unprocessed = [f for f in state.get_unprocessed('download')
+                           if f not in (downloaded_files or []) and f.exists()]
+            if unprocessed:
+                print(f"\n↪️  Reprise de {len(unprocessed)} archive(s) non traitée(s)")
+                downloaded_files = sorted((downloaded_files or []) + unprocessed)
+            if not downloaded_files:
+                return
+
+    # Upload d'une liste de fichiers mergés (clés datées ou stables)
+    def upload_merged(files, workers=args.upload_workers):
+        if args.publish == 'stable':
+            return publish_s3(local_paths=files,
+                              S3_BUCKET=S3_BUCKET,
+                              S3_PREFIX="data/"+S3_DATA_PREFIX,
+                              **S3_CREDENTIALS,
+                              workers=workers,
+                              s3=s3_client,
+                              inventory=inventory)
+        return upload_s3(local_paths=files,
+                         S3_BUCKET=S3_BUCKET,
+                         s3_paths=[Path(p).relative_to(OUTPUT_DIR) for p in files],
+                         S3_PREFIX="data/"+S3_DATA_PREFIX,
+                         **S3_CREDENTIALS,
+                         **{**UPLOAD_OPTIONS, 'workers': workers})
+    not_uploaded = []
+
+    # 2-5. TRAITEMENT : graphe de tâches, chaque archive et chaque variable
+    # enchaînant decompress → split → convert → merge (→ upload) sans attendre
+    # les autres
+    if args.all or args.process:
+        with metrics.stage('process'):
+            merged_files, not_uploaded = run_pipeline(
+                DOWNLOAD_DIR, RAW_DIR, SPLIT_DIR, CONVERT_DIR, OUTPUT_DIR,
+                METADATA_VARIABLES_FILE, downloaded_files,
+                stream=args.stream,
+                streaming=args.low_memory,
+                profile=args.encoding,
+                quantize=args.quantize,
+                engine=args.merge_engine,
+                workers=args.workers,
+                force=args.overwrite,
+                upload=(lambda files: upload_merged(files, workers=1)) if args.all else None,
+                upload_workers=args.upload_workers,
+                state=state)
+            merged_uploaded = args.all
+            state.mark_processed(downloaded_files or state.get_unprocessed('download'))
+            clean_local(RAW_DIR)
+            clean_local(SPLIT_DIR)
+            clean_local(CONVERT_DIR)
+            clean_local(OUTPUT_DIR,
+                        patterns={'historical': r'historical-(\d{8})-(\d{8})',
+                                  'latest':     r'latest-(\d{8})-(\d{8})',
+                                  'previous':   r'previous-(\d{8})-(\d{8})'})
 
     # 2. DÉCOMPRESSION
-    if args.all or args.process or args.decompress:
-        decompressed_files = decompress(DOWNLOAD_DIR, RAW_DIR, downloaded_files)
-        clean_local(RAW_DIR)
+    if args.decompress and not args.stream:
+        with metrics.stage('decompress'):
+            decompressed_files = decompress(DOWNLOAD_DIR, RAW_DIR, downloaded_files,
+                                            workers=args.workers,
+                                            state=state, force=args.overwrite)
+            clean_local(RAW_DIR)
 
     # 3. SPLIT
-    if args.all or args.process or args.split:
-        splited_files = split(RAW_DIR, SPLIT_DIR, decompressed_files)
-        clean_local(SPLIT_DIR)
+    if args.split:
+        with metrics.stage('split'):
+            if args.stream:
+                splited_files = split(DOWNLOAD_DIR, SPLIT_DIR, downloaded_files,
+                                      stream=True, workers=args.workers,
+                                      state=state, force=args.overwrite)
+            else:
+                splited_files = split(RAW_DIR, SPLIT_DIR, decompressed_files,
+                                      workers=args.workers,
+                                      state=state, force=args.overwrite)
+            clean_local(SPLIT_DIR)
 
     # 4. CONVERSION
-    if args.all or args.process or args.convert:
-        converted_files = convert(SPLIT_DIR, CONVERT_DIR,
-                                  METADATA_VARIABLES_FILE, splited_files)
-        clean_local(CONVERT_DIR)
+    if args.convert:
+        with metrics.stage('convert'):
+            converted_files = convert(SPLIT_DIR, CONVERT_DIR,
+                                      METADATA_VARIABLES_FILE, splited_files,
+                                      streaming=args.low_memory,
+                                      workers=args.workers,
+                                      profile=args.encoding,
+                                      quantize=args.quantize,
+                                      state=state,
+                                      force=args.overwrite)
+            clean_local(CONVERT_DIR)
 
     # 5. MERGE
-    if args.all or args.process or args.merge:
-        merged_files = merge(CONVERT_DIR, OUTPUT_DIR, converted_files)
-        clean_local(OUTPUT_DIR,
-                    patterns={'historical': r'historical-(\d{8})-(\d{8})',
-                              'latest':     r'latest-(\d{8})-(\d{8})',
-                              'previous':   r'previous-(\d{8})-(\d{8})'})
-
-    # 6. UPLOAD
+    if args.merge:
+        with metrics.stage('merge'):
+            merged_files = merge(CONVERT_DIR, OUTPUT_DIR, converted_files,
+                                 profile=args.encoding,
+                                 engine=args.merge_engine,
+                                 workers=args.workers,
+                                 force=args.overwrite,
+                                 state=state)
+            merged_uploaded = False
+            state.mark_processed(state.get_unprocessed('download'))
+            clean_local(OUTPUT_DIR,
+                        patterns={'historical': r'historical-(\d{8})-(\d{8})',
+                                  'latest':     r'latest-(\d{8})-(\d{8})',
+                                  'previous':   r'previous-(\d{8})-(\d{8})'})
+
+    # 6. AGRÉGATS
+    if args.all or args.process or args.aggregate:
+        with metrics.stage('aggregate'):
+            aggregated_files = aggregate(OUTPUT_DIR, AGGREGATE_DIR, merged_files,
+                                         profile=args.encoding,
+                                         force=args.overwrite)
+
+    # 7. ZARR
+    if args.all or args.process or args.zarr:
+        with metrics.stage('zarr'):
+            zarr_files = write_zarr(OUTPUT_DIR, ZARR_DIR, merged_files,
+                                    profile=args.encoding,
+                                    force=args.overwrite)
+
+    # 8. INDEX DE RÉFÉRENCES
+    if args.all or args.process or args.references:
+        with metrics.stage('references'):
+            reference_files = generate_references(OUTPUT_DIR, S3_DATA_URL, merged_files,
+                                                  force=args.overwrite,
+                                                  stable=args.publish == 'stable')
+
+    # 9. UPLOAD
     if args.all or args.upload:
-        if merged_files is None:
-            merged_files = list(Path(OUTPUT_DIR).glob("*.nc"))
-        s3_paths = [Path(p).relative_to(OUTPUT_DIR) for p in merged_files]
-
-        not_uploaded = upload_s3(local_paths=merged_files,
-                                 S3_BUCKET=S3_BUCKET,
-                                 s3_paths=s3_paths,
-                                 S3_PREFIX="data/"+S3_DATA_PREFIX,
-                                 **S3_CREDENTIALS)
-        clean_s3(S3_BUCKET=S3_BUCKET,
-                 S3_PREFIX="data/"+S3_DATA_PREFIX,
-                 **S3_CREDENTIALS)
+        with metrics.stage('upload'):
+            # Fichiers mergés : déjà uploadés au fil du graphe avec --all
+            if not merged_uploaded:
+                if merged_files is None:
+                    merged_files = list(Path(OUTPUT_DIR).glob("*.nc"))
+                not_uploaded += upload_merged(merged_files)
+
+            if aggregated_files is None:
+                aggregated_files = list(Path(AGGREGATE_DIR).glob("*.nc"))
+            s3_paths = [Path(p).relative_to(AGGREGATE_DIR) for p in aggregated_files]
+
+            not_uploaded += upload_s3(local_paths=aggregated_files,
+                                      S3_BUCKET=S3_BUCKET,
+                                      s3_paths=s3_paths,
+                                      S3_PREFIX="data/"+S3_DATA_PREFIX+"/aggregates",
+                                      **S3_CREDENTIALS,
+                                      **UPLOAD_OPTIONS)
+
+            # Stores Zarr : uniquement les objets modifiés par ce run
+            if zarr_files is None:
+                zarr_files = [f for f in Path(ZARR_DIR).rglob("*") if f.is_file()]
+            s3_paths = [Path(p).relative_to(ZARR_DIR) for p in zarr_files]
+
+            not_uploaded += upload_s3(local_paths=zarr_files,
+                                      S3_BUCKET=S3_BUCKET,
+                                      s3_paths=s3_paths,
+                                      S3_PREFIX="data/"+S3_DATA_PREFIX+"/zarr",
+                                      **S3_CREDENTIALS,
+                                      **UPLOAD_OPTIONS)
+            # Objets des stores réécrits qui n'existent plus localement
+            clean_zarr_s3(ZARR_DIR, S3_BUCKET, "data/"+S3_DATA_PREFIX+"/zarr",
+                          s3=s3_client, inventory=inventory)
+
+            if reference_files is None:
+                reference_files = list((Path(OUTPUT_DIR) / "references").glob("*.nc.json"))
+            s3_paths = [Path(p).relative_to(Path(OUTPUT_DIR) / "references") for p in reference_files]
+
+            not_uploaded += upload_s3(local_paths=reference_files,
+                                      S3_BUCKET=S3_BUCKET,
+                                      s3_paths=s3_paths,
+                                      S3_PREFIX="data/"+S3_DATA_PREFIX+"/references",
+                                      **S3_CREDENTIALS,
+                                      **UPLOAD_OPTIONS)
+            clean_s3(S3_BUCKET=S3_BUCKET,
+                     S3_PREFIX="data/"+S3_DATA_PREFIX,
+                     **S3_CREDENTIALS,
+                     s3=s3_client,
+                     inventory=inventory)
 
         if not_uploaded:
             sys.exit(1)
 
-    # 7. CATALOGUE STAC
+    # 10. CATALOGUE STAC
     if args.all or args.ui:
-        stac_files = generate_stac_catalog(CATALOG_DIR=CATALOG_DIR,
-                                           S3_BUCKET=S3_BUCKET,
-                                           S3_PREFIX="data/"+S3_DATA_PREFIX,
-                                           METADATA_VARIABLES_FILE=METADATA_VARIABLES_FILE,
-                                           **S3_CREDENTIALS)
-        s3_paths = [Path(p).relative_to(CATALOG_DIR) for p in stac_files]
-
-        upload_s3(local_paths=stac_files,
-                  S3_BUCKET=S3_BUCKET,
-                  s3_paths=s3_paths,
-                  S3_PREFIX="stac-data/"+S3_DATA_PREFIX,
-                  **S3_CREDENTIALS)
-
-    # 8. NETTOYAGE
+        with metrics.stage('ui'):
+            stac_files = generate_stac_catalog(CATALOG_DIR=CATALOG_DIR,
+                                               S3_BUCKET=S3_BUCKET,
+                                               S3_PREFIX="data/"+S3_DATA_PREFIX,
+                                               METADATA_VARIABLES_FILE=METADATA_VARIABLES_FILE,
+                                               **S3_CREDENTIALS,
+                                               inventory=inventory)
+            s3_paths = [Path(p).relative_to(CATALOG_DIR) for p in stac_files]
+
+            upload_s3(local_paths=stac_files,
+                      S3_BUCKET=S3_BUCKET,
+                      s3_paths=s3_paths,
+                      S3_PREFIX="stac-data/"+S3_DATA_PREFIX,
+                      **S3_CREDENTIALS,
+                      **UPLOAD_OPTIONS)
+
+    # 11. NETTOYAGE
     if args.clean:
-        clean_local(directory=DOWNLOAD_DIR)
-        clean_local(directory=RAW_DIR)
-        clean_local(directory=SPLIT_DIR)
-        clean_local(directory=CONVERT_DIR)
-        clean_local(directory=OUTPUT_DIR,
-                    patterns={'historical': r'historical-(\d{8})-(\d{8})',
-                              'latest':     r'latest-(\d{8})-(\d{8})',
-                              'previous':   r'previous-(\d{8})-(\d{8})'})
-        clean_s3(S3_BUCKET=S3_BUCKET,
-                 S3_PREFIX="data/"+S3_DATA_PREFIX,
-                 **S3_CREDENTIALS)
+        with metrics.stage('clean'):
+            clean_local(directory=DOWNLOAD_DIR)
+            clean_local(directory=RAW_DIR)
+            clean_local(directory=SPLIT_DIR)
+            clean_local(directory=CONVERT_DIR)
+            clean_local(directory=OUTPUT_DIR,
+                        patterns={'historical': r'historical-(\d{8})-(\d{8})',
+                                  'latest':     r'latest-(\d{8})-(\d{8})',
+                                  'previous':   r'previous-(\d{8})-(\d{8})'})
+            clean_s3(S3_BUCKET=S3_BUCKET,
+                     S3_PREFIX="data/"+S3_DATA_PREFIX,
+                     **S3_CREDENTIALS,
+                     s3=s3_client,
+                     inventory=inventory)
+
+    # Fichiers supprimés par les nettoyages
+    state.prune()
 
     print("\n✨ Pipeline terminé avec succès!")
 
@@ -3,6 +3,12 @@ from .decompress import decompress
 from .split import split
 from .convert import convert
 from .merge import merge
-from .upload_s3 import apply_s3_bucket_policy, apply_s3_bucket_cors, list_s3_files, upload_s3, delete_s3_files
+from .aggregate import aggregate
+from .zarr_store import write_zarr, clean_zarr_s3
+from .reference import generate_references
+from .pipeline import run_pipeline
+from .state import StateStore, print_stats
+from .metrics import RunMetrics
+from .upload_s3 import apply_s3_bucket_policy, apply_s3_bucket_cors, list_s3_files, get_s3_client, S3Inventory, upload_s3, publish_s3, delete_s3_files
 from .generate_ui import generate_stac_catalog, generate_index
 from .clean import clean_local, clean_s3
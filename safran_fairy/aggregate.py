@@ -0,0 +1,266 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import xarray as xr
+from art import tprint
+
+from .convert import TIME_UNITS
+from .encoding import get_encoding
+from .merge import get_merge_base, get_merge_build
+from .metrics import instrument
+
+
+# Méthode d'agrégation temporelle par variable : cumul pour les flux
+# journaliers (précipitations, évaporation, écoulements, rayonnements),
+# extrêmes pour les variables déjà définies comme min/max, moyenne sinon.
+AGGREGATION_METHODS = {
+    'PRENEI': 'sum',
+    'PRELIQ': 'sum',
+    'DLI': 'sum',
+    'SSI': 'sum',
+    'EVAP': 'sum',
+    'ETP': 'sum',
+    'PE': 'sum',
+    'DRAINC': 'sum',
+    'RUNC': 'sum',
+    'ECOULEMENT': 'sum',
+    'TINF_H': 'min',
+    'TSUP_H': 'max',
+    'HTEURNEIGEX': 'max',
+}
+
+# Fréquences d'agrégation : code du nom de fichier → fréquence pandas
+AGGREGATION_FREQUENCIES = {
+    'MENS': 'MS',
+    'ANNU': 'YS',
+}
+
+
+def get_aggregation_method(var):
+    """Méthode d'agrégation d'une variable ('sum', 'min', 'max' ou 'mean')"""
+    return AGGREGATION_METHODS.get(var, 'mean')
+
+
+def get_latest_sources(OUTPUT_DIR):
+    """
+    Fichiers latest mergés de OUTPUT_DIR, le plus récent par variable.
+    Ex: {'T': OUTPUT_DIR/T_QUOT_SIM2_latest-19580801-20261011.nc, ...}
+    """
+    pattern = r'^(?P<variable>.+)_QUOT_SIM2_latest-(\d{8})-(?P<date_fin>\d{8})\.nc$'
+    sources = {}
+    for file in sorted(Path(OUTPUT_DIR).glob("*_QUOT_SIM2_latest-*.nc")):
+        match = re.match(pattern, file.name)
+        if not match:
+            continue
+        var = match.group('variable')
+        previous = sources.get(var)
+        if previous is None or match.group('date_fin') > re.match(pattern, previous.name).group('date_fin'):
+            sources[var] = file
+    return sources
+
+
+def get_aggregate_file(AGGREGATE_DIR, var, frequency):
+    """Agrégat existant d'une variable à une fréquence, ou None"""
+    files = sorted(Path(AGGREGATE_DIR).glob(f"{var}_{frequency}_SIM2_latest-*.nc"))
+    return files[-1] if files else None
+
+
+def get_period_start(date, frequency):
+    """
+    Début de la période (mois ou année) contenant date.
+    Ex: 2026-10-11, 'MENS' → 2026-10-01 ; 2026-10-11, 'ANNU' → 2026-01-01
+    """
+    date = pd.Timestamp(date)
+    if frequency == 'ANNU':
+        return pd.Timestamp(year=date.year, month=1, day=1)
+    return pd.Timestamp(year=date.year, month=date.month, day=1)
+
+
+def reduce_period(data, frequency, method):
+    """Agrège une tranche journalière (time, y, x) par mois ou par année"""
+    resampled = data.resample(time=AGGREGATION_FREQUENCIES[frequency])
+    if method == 'sum':
+        # min_count=1 : les mailles hors domaine (toujours NaN) restent NaN
+        reduced = resampled.sum(min_count=1)
+    else:
+        reduced = getattr(resampled, method)()
+    n_days = data['time'].resample(time=AGGREGATION_FREQUENCIES[frequency]).count()
+    return reduced.astype('float32'), n_days.astype('int16')
+
+
+def aggregate_range(ds, var, start, frequency, method):
+    """
+    Agrège ds[var] à partir de start, année par année pour borner la mémoire
+    (une année SIM2 ≈ 365 x 134 x 143 valeurs).
+    """
+    end = pd.Timestamp(ds['time'].values[-1])
+    values, counts = [], []
+    for year in range(start.year, end.year + 1):
+        slab_start = max(start, pd.Timestamp(year=year, month=1, day=1))
+        slab = ds[var].sel(time=slice(slab_start, pd.Timestamp(year=year, month=12, day=31))).load()
+        if slab.sizes['time'] == 0:
+            continue
+        reduced, n_days = reduce_period(slab, frequency, method)
+        values.append(reduced)
+        counts.append(n_days)
+    return xr.concat(values, dim='time'), xr.concat(counts, dim='time')
+
+
+def write_aggregate(ds, var, values, n_days, method, source_file, source_base,
+                    source_build, output_file, profile=None):
+    """Écrit un agrégat (var + nombre de jours agrégés par période) en NetCDF"""
+    out = xr.Dataset({var: values, 'n_days': n_days})
+    out[var].attrs = {k: v for k, v in ds[var].attrs.items()
+                      if k not in ('precision', 'aggregation_period')}
+    out[var].attrs['cell_methods'] = f"time: {method}"
+    out['n_days'].attrs = {'long_name': "Nombre de jours agrégés"}
+    if 'crs' in ds:
+        out['crs'] = ds['crs']
+    for coord in ('x', 'y', 'time'):
+        out[coord].attrs = ds[coord].attrs
+
+    dates = pd.to_datetime(ds['time'].values[[0, -1]])
+    out.attrs = dict(ds.attrs)
+    out.attrs.update({
+        'aggregation_method': method,
+        'source_file': Path(source_file).name,
+        'source_base': source_base,
+        'source_build': source_build,
+        'source_start': dates[0].strftime('%Y%m%d'),
+        'source_end': dates[1].strftime('%Y%m%d'),
+    })
+
+    shape = out[var].shape
+    encoding = {var: {**get_encoding(profile, shape), 'dtype': 'float32'},
+                'n_days': {'dtype': 'int16'},
+                'time': {'units': TIME_UNITS, 'calendar': 'standard'}}
+    tmp_file = output_file.with_suffix('.nc.tmp')
+    out.to_netcdf(tmp_file, encoding=encoding, unlimited_dims=['time'])
+    os.replace(tmp_file, output_file)
+
+
+@instrument()
+def aggregate_variable(source_file, var, frequency, AGGREGATE_DIR, OUTPUT_DIR,
+                       profile=None, force=False):
+    """
+    Agrégat mensuel ou annuel d'une variable depuis son fichier latest mergé.
+
+    Le calcul est incrémental : seules les périodes touchées par les jours
+    ajoutés depuis le dernier agrégat (source_end) sont recalculées, les
+    périodes antérieures sont reprises de l'agrégat existant.
+
+    Args:
+        source_file (Path):   Fichier latest mergé. Ex: T_QUOT_SIM2_latest-19580801-20261011.nc
+        var (str):            Nom de la variable. Ex: 'T'
+        frequency (str):      'MENS' (mensuel) ou 'ANNU' (annuel).
+        AGGREGATE_DIR (Path): Dossier des agrégats.
+        OUTPUT_DIR (Path):    Dossier des fichiers mergés (manifestes de merge).
+        profile (str, optional): Profil d'encodage NetCDF. Voir encoding.ENCODING_PROFILES.
+        force (bool):         Recalcule toutes les périodes.
+
+    Returns:
+        Path: Fichier agrégé. Ex: AGGREGATE_DIR/T_MENS_SIM2_latest-19580801-20261011.nc
+
+    Notes:
+        Le merge latest ne fait qu'ajouter des jours en fin de fichier, sauf
+        quand il est reconstruit sur un nouveau previous (mensuel) : les
+        données déjà publiées peuvent alors changer. Le previous utilisé est
+        lu dans le manifeste de merge et conservé dans l'agrégat (source_base,
+        vide sans previous) ; s'il a changé, toutes les périodes sont recalculées.
+        De même si le merge a été reconstruit sur la même base, par exemple
+        pour des jours révisés (source_build, voir merge.get_merge_build).
+    """
+    method = get_aggregation_method(var)
+    source_base = get_merge_base(OUTPUT_DIR, var, 'latest')
+    source_build = get_merge_build(OUTPUT_DIR, var, 'latest')
+    existing_file = get_aggregate_file(AGGREGATE_DIR, var, frequency)
+
+    with xr.open_dataset(source_file) as ds:
+        dates = pd.to_datetime(ds['time'].values[[0, -1]])
+        output_file = (Path(AGGREGATE_DIR) / f"{var}_{frequency}_SIM2_latest-"
+                       f"{dates[0].strftime('%Y%m%d')}-{dates[1].strftime('%Y%m%d')}.nc")
+
+        previous = None
+        if existing_file is not None and not force:
+            with xr.open_dataset(existing_file) as existing:
+                if (existing.attrs.get('source_start') == dates[0].strftime('%Y%m%d')
+                        and existing.attrs.get('source_base') == source_base
+                        and existing.attrs.get('source_build') == source_build):
+                    previous = existing.load()
+
+        if previous is not None and pd.Timestamp(previous.attrs['source_end']) >= dates[1]:
+            print(f"   ⏭️  {existing_file.name} à jour")
+            return existing_file
+
+        if previous is not None:
+            start = get_period_start(pd.Timestamp(previous.attrs['source_end']) + pd.Timedelta(days=1),
+                                     frequency)
+            values, n_days = aggregate_range(ds, var, start, frequency, method)
+            kept = previous.sel(time=previous['time'] < np.datetime64(start))
+            values = xr.concat([kept[var], values], dim='time')
+            n_days = xr.concat([kept['n_days'], n_days], dim='time')
+            print(f"   🔄 {var} {frequency} : recalcul depuis {start.strftime('%Y-%m-%d')}")
+        else:
+            start = get_period_start(dates[0], frequency)
+            values, n_days = aggregate_range(ds, var, start, frequency, method)
+            print(f"   🧮 {var} {frequency} : calcul complet ({method})")
+
+        write_aggregate(ds, var, values, n_days, method, source_file, source_base,
+                        source_build, output_file, profile)
+
+    if existing_file is not None and existing_file != output_file:
+        existing_file.unlink()
+    print(f"   💾 {output_file.name}")
+    return output_file
+
+
+def aggregate(OUTPUT_DIR, AGGREGATE_DIR, merged_files=None, profile=None, force=False):
+    """
+    Calcule les agrégats mensuels et annuels de chaque variable à partir des
+    fichiers latest mergés.
+
+    Args:
+        OUTPUT_DIR (str):                 Dossier des fichiers mergés.
+        AGGREGATE_DIR (str):              Dossier de sortie des agrégats.
+        merged_files (list, optional):    Fichiers produits par merge(). Seuls les fichiers
+                                          latest sont agrégés. Si None, tous les fichiers
+                                          latest de OUTPUT_DIR.
+        profile (str, optional):          Profil d'encodage NetCDF des agrégats.
+        force (bool):                     Recalcule toutes les périodes.
+
+    Returns:
+        list: Fichiers agrégés, vide si aucun fichier latest.
+              Ex: [AGGREGATE_DIR/T_MENS_SIM2_latest-19580801-20261011.nc,
+                   AGGREGATE_DIR/T_ANNU_SIM2_latest-19580801-20261011.nc, ...]
+    """
+    tprint("aggregate", "small")
+    OUTPUT_DIR = Path(OUTPUT_DIR)
+    AGGREGATE_DIR = Path(AGGREGATE_DIR)
+    AGGREGATE_DIR.mkdir(parents=True, exist_ok=True)
+
+    sources = get_latest_sources(OUTPUT_DIR)
+    if merged_files is not None:
+        merged_names = {Path(f).name for f in merged_files}
+        sources = {var: file for var, file in sources.items() if file.name in merged_names}
+
+    if not sources:
+        print("\n⚠️  Aucun fichier latest à agréger")
+        return []
+
+    aggregated_files = []
+    for var, source_file in sorted(sources.items()):
+        print(f"\n📊 {var} ({get_aggregation_method(var)}) ← {source_file.name}")
+        for frequency in AGGREGATION_FREQUENCIES:
+            aggregated_files.append(
+                aggregate_variable(source_file, var, frequency, AGGREGATE_DIR,
+                                   OUTPUT_DIR, profile, force))
+
+    print(f"\n{'='*50}")
+    print("RÉSUMÉ")
+    print(f"{'='*50}")
+    print(f"📊 Variables agrégées : {len(sources)}")
+    print(f"💾 Fichiers produits  : {len(aggregated_files)}")
+
+    return aggregated_files
@@ -7,10 +7,12 @@ from art import tprint
 import boto3
 
 from .tools import parse_filename
+from .upload_s3 import delete_s3_keys
+from .dataverse_tools import DataverseClient
 
 
 def clean_local(directory,
-                extensions=['.csv', '.csv.gz', '.parquet', '.nc'],
+                extensions=['.csv', '.csv.gz', '.csv.index', '.parquet', '.nc'],
                 patterns={
                     'latest': r'latest-(\d{8})-(\d{8})',
                     'previous': r'previous-(\d{4})-(\d{6})'
@@ -42,59 +44,55 @@ def clean_local(directory,
 
 def clean_dataverse(dataset_DOI: str,
                     RDG_BASE_URL: str = os.getenv("RDG_BASE_URL"),
-                    RDG_API_TOKEN: str = os.getenv("RDG_API_TOKEN")):
+                    RDG_API_TOKEN: str = os.getenv("RDG_API_TOKEN"),
+                    workers: int = 4,
+                    client: DataverseClient = None):
     """
     Supprime les fichiers NetCDF obsolètes d'un dataset Dataverse
     en ne gardant que le plus récent par couple (variable, version).
+
+    Les fichiers sont lus dans la liste en cache de client (voir
+    dataverse_tools.DataverseClient) et supprimés workers à la fois.
     """
     print("\nNETTOYAGE DATAVERSE")
     print(f"   Dataset: {dataset_DOI}")
 
-    url = f"{RDG_BASE_URL}/api/datasets/:persistentId/?persistentId={dataset_DOI}"
-    headers = {'X-Dataverse-key': RDG_API_TOKEN}
-    response = requests.get(url, headers=headers)
-
-    if response.status_code != 200:
-        print(f"   ❌ Impossible de récupérer les fichiers: {response.text}")
-        return
-
-    files_data = response.json()['data']['latestVersion']['files']
+    if client is None:
+        client = DataverseClient(dataset_DOI, RDG_BASE_URL, RDG_API_TOKEN, workers)
+    try:
+        files_data = client.list_files()
+    except requests.RequestException as e:
+        print(f"   ❌ Impossible de récupérer les fichiers: {str(e)}")
+        return []
 
     from collections import defaultdict
     groups = defaultdict(list)
-    for file_info in files_data:
-        filename = file_info['dataFile']['filename']
+    for filename, data_file in files_data.items():
         if not filename.endswith('.nc'):
             continue
         parsed = parse_filename(filename)
         if not parsed:
             continue
-        group_key = (parsed['variable'], parsed['version'])
+        group_key = (parsed['variable'], parsed['frequency'], parsed['version'])
         groups[group_key].append({
-            'id': file_info['dataFile']['id'],
+            'id': data_file['id'],
             'filename': filename,
             'date_fin': int(parsed['date_fin'])
         })
 
-    total_deleted = 0
-    for (variable, version), files in sorted(groups.items()):
+    to_delete = []
+    for (variable, frequency, version), files in sorted(groups.items()):
         if len(files) <= 1:
             continue
         max_date = max(f['date_fin'] for f in files)
-        to_delete = [f for f in files if f['date_fin'] < max_date]
-        print(f"\n{variable}/{version} — {len(to_delete)} obsolète(s)")
-        for f in to_delete:
-            del_response = requests.delete(
-                f"{RDG_BASE_URL}/api/files/{f['id']}",
-                headers=headers
-            )
-            if del_response.status_code in [200, 204]:
-                print(f"   🗑️  {f['filename']}")
-                total_deleted += 1
-            else:
-                print(f"   ❌ {f['filename']} : {del_response.text}")
-
-    print(f"\n📊 Total supprimé : {total_deleted} fichier(s)")
+        obsolete = [f['filename'] for f in files if f['date_fin'] < max_date]
+        print(f"\n{variable}/{frequency}/{version} — {len(obsolete)} obsolète(s)")
+        to_delete.extend(obsolete)
+
+    deleted = client.delete_files(to_delete) if to_delete else []
+
+    print(f"\n📊 Total supprimé : {len(deleted)} fichier(s)")
+    return deleted
     
 
 def clean_s3(S3_BUCKET: str,
@@ -102,54 +100,70 @@ def clean_s3(S3_BUCKET: str,
              S3_ACCESS_KEY: str = os.getenv("S3_ACCESS_KEY"),
              S3_SECRET_KEY: str = os.getenv("S3_SECRET_KEY"),
              S3_ENDPOINT: str = os.getenv("S3_ENDPOINT"),
-             S3_REGION: str = os.getenv("S3_REGION", "eu-west-1")):
+             S3_REGION: str = os.getenv("S3_REGION", "eu-west-1"),
+             s3=None,
+             inventory=None):
     """
-    Supprime les fichiers obsolètes par variable et par version.
-    Garde uniquement le fichier le plus récent pour chaque couple (variable, version).
+    Supprime les fichiers obsolètes par dossier, variable, fréquence et version.
+    Garde uniquement le fichier le plus récent pour chaque groupe (NetCDF, agrégats,
+    index de références .nc.json).
+
+    Les clés sont lues dans inventory (voir upload_s3.S3Inventory) s'il couvre
+    S3_PREFIX, sinon listées ; les suppressions partent par lots de 1000.
     """
-    s3 = boto3.client('s3',
-                      aws_access_key_id=S3_ACCESS_KEY,
-                      aws_secret_access_key=S3_SECRET_KEY,
-                      endpoint_url=S3_ENDPOINT,
-                      region_name=S3_REGION)
+    if s3 is None:
+        s3 = boto3.client('s3',
+                          aws_access_key_id=S3_ACCESS_KEY,
+                          aws_secret_access_key=S3_SECRET_KEY,
+                          endpoint_url=S3_ENDPOINT,
+                          region_name=S3_REGION)
     print("\nNETTOYAGE S3")
     print(f"   Bucket: {S3_BUCKET}/{S3_PREFIX or ''}")
 
-    all_keys = []
-    paginator = s3.get_paginator('list_objects_v2')
-    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=S3_PREFIX):
-        for obj in page.get('Contents', []):
-            all_keys.append(obj['Key'])
+    if inventory is not None and inventory.covers(S3_PREFIX):
+        all_keys = inventory.keys(S3_PREFIX)
+    else:
+        all_keys = []
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=S3_PREFIX):
+            for obj in page.get('Contents', []):
+                all_keys.append(obj['Key'])
 
     from collections import defaultdict
     groups = defaultdict(list)
     for key in all_keys:
         filename = Path(key).name
-        if not filename.endswith('.nc'):
+        # Index de références (references/<fichier>.nc.json) : même version que le NetCDF
+        nc_name = filename[:-len('.json')] if filename.endswith('.nc.json') else filename
+        if not nc_name.endswith('.nc'):
             continue
-        parsed = parse_filename(filename)
+        parsed = parse_filename(nc_name)
         if not parsed:
             continue
-        group_key = (parsed['variable'], parsed['version'])
+        group_key = (str(Path(key).parent), parsed['variable'], parsed['frequency'], parsed['version'])
         groups[group_key].append({
             'key': key,
             'filename': filename,
             'date_fin': int(parsed['date_fin'])
         })
 
-    total_deleted = 0
-    for (variable, version), files in sorted(groups.items()):
+    obsolete = []
+    for (_, variable, frequency, version), files in sorted(groups.items()):
         if len(files) <= 1:
             continue
         max_date = max(f['date_fin'] for f in files)
         to_delete = [f for f in files if f['date_fin'] < max_date]
-        print(f"\n{variable}/{version} — {len(to_delete)} obsolète(s)")
+        print(f"\n{variable}/{frequency}/{version} — {len(to_delete)} obsolète(s)")
         for f in to_delete:
-            try:
-                s3.delete_object(Bucket=S3_BUCKET, Key=f['key'])
-                print(f"   🗑️  {f['filename']}")
-                total_deleted += 1
-            except Exception as e:
-                print(f"   ❌ {f['filename']} : {str(e)}")
-    print(f"\n📊 Total supprimé : {total_deleted} fichier(s)")
+            print(f"   🗑️  {f['filename']}")
+        obsolete.extend(f['key'] for f in to_delete)
+
+    deleted = []
+    if obsolete:
+        try:
+            deleted = delete_s3_keys(s3, S3_BUCKET, obsolete, inventory)
+        except Exception as e:
+            print(f"   ❌ {str(e)}")
+    print(f"\n📊 Total supprimé : {len(deleted)}/{len(obsolete)} fichier(s)")
+    return deleted
 
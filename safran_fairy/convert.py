@@ -1,15 +1,125 @@
 import os
+import time
+import numpy as np
 import pandas as pd
 from pathlib import Path
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import xarray as xr
 from art import tprint
 
 from .clean import clean_local
+from .state import get_stage_files
+from .metrics import instrument
+from .encoding import get_encoding, get_packing
 
 
-def create_netcdf(file, CONVERT_DIR, METADATA_VARIABLES_FILE):
-    metadata_variables = pd.read_csv(METADATA_VARIABLES_FILE,
-                                     index_col='variable')
+# Métadonnées globales
+GLOBAL_ATTRS = {
+    'crs': 'EPSG:27572',
+    'grid_mapping_name': 'lambert_conformal_conic',
+    'spatial_resolution': '8 km (0.072°)',
+    'projection': 'Lambert II étendu',
+    'source': 'SAFRAN-ISBA-MODCOU (SIM2)',
+    'institution': 'Météo-France'
+}
+
+# Métadonnées des coordonnées
+X_ATTRS = {
+    'standard_name': 'projection_x_coordinate',
+    'long_name': 'x coordinate of projection (Lambert II étendu)',
+    'units': 'm',
+    'axis': 'X'
+}
+
+Y_ATTRS = {
+    'standard_name': 'projection_y_coordinate',
+    'long_name': 'y coordinate of projection (Lambert II étendu)',
+    'units': 'm',
+    'axis': 'Y'
+}
+
+TIME_ATTRS = {
+    'standard_name': 'time',
+    'long_name': 'time',
+    'axis': 'T'
+}
+
+TIME_UNITS = 'days since 1970-01-01 00:00:00'
+
+# Variable CRS
+CRS_ATTRS = {
+    'grid_mapping_name': 'lambert_conformal_conic',
+    'longitude_of_central_meridian': 2.337229,
+    'latitude_of_projection_origin': 46.8,
+    'standard_parallel': [45.898919, 47.696014],
+    'false_easting': 600000.0,
+    'false_northing': 2200000.0,
+    'semi_major_axis': 6378249.2,
+    'semi_minor_axis': 6356515.0,
+    'inverse_flattening': 293.46602,
+    'spatial_ref': 'EPSG:27572'
+}
+
+
+@lru_cache(maxsize=None)
+def load_metadata_variables(METADATA_VARIABLES_FILE):
+    """
+    Charge le CSV des variables une seule fois par processus.
+    Chaque worker du pool de conversion garde ainsi sa propre copie en cache.
+    """
+    return pd.read_csv(METADATA_VARIABLES_FILE, index_col='variable')
+
+
+def get_variable_attrs(var, metadata_variables):
+    """Métadonnées d'une variable depuis le CSV des variables"""
+    attrs = {}
+    if var in metadata_variables.index:
+        var_meta = metadata_variables.loc[var]
+        attrs['long_name'] = var_meta['description']
+        attrs['units'] = var_meta['unite']
+        if pd.notna(var_meta['precision']):
+            attrs['precision'] = var_meta['precision']
+        if pd.notna(var_meta['periode_agregation']):
+            attrs['aggregation_period'] = var_meta['periode_agregation']
+        attrs['grid_mapping'] = 'crs'
+    return attrs
+
+
+def get_grid_index(values):
+    """
+    Coordonnées uniques triées d'un axe et indice de chaque ligne sur cet axe.
+
+    Les valeurs sont dédupliquées par hachage (pd.unique) avant tri, puis
+    chaque ligne est positionnée par recherche dichotomique sur l'axe.
+    """
+    coords = np.sort(pd.unique(values))
+    return coords, np.searchsorted(coords, values)
+
+
+def grid_data(data, var):
+    """
+    Construit directement le cube dense (time, y, x) d'une variable.
+
+    Chaque ligne est placée dans un tableau float32 préalloué à partir de
+    ses indices entiers sur les trois axes, sans passer par un MultiIndex.
+    Les cellules absentes du fichier (hors grille SIM2) restent à NaN.
+    """
+    time, it = get_grid_index(data['time'].to_numpy())
+    y, iy = get_grid_index(data['L2_Y'].to_numpy())
+    x, ix = get_grid_index(data['L2_X'].to_numpy())
+
+    cube = np.full((len(time), len(y), len(x)), np.nan, dtype='float32')
+    cube[it, iy, ix] = data[var].to_numpy(dtype='float32')
+
+    return xr.Dataset({var: (('time', 'y', 'x'), cube)},
+                      coords={'time': time, 'y': y, 'x': x})
+
+
+@instrument()
+def create_netcdf(file, CONVERT_DIR, METADATA_VARIABLES_FILE,
+                  profile=None, quantize=None):
+    metadata_variables = load_metadata_variables(METADATA_VARIABLES_FILE)
     
     var = file.stem.split('_QUOT_SIM2')[0]
     print(f"\n🌐 Conversion NetCDF: {file.name}")
@@ -21,73 +131,28 @@ def create_netcdf(file, CONVERT_DIR, METADATA_VARIABLES_FILE):
     data['L2_Y'] = data['L2_Y'] * 100
     data['time'] = pd.to_datetime(data['time'], format='%Y%m%d')
     
-    print(f"   → {len(data['time'].unique())} pas de temps | {data['L2_X'].nunique()}x{data['L2_Y'].nunique()} points de grille")
+    ds = grid_data(data, var)
+    del data
+    print(f"   → {ds.sizes['time']} pas de temps | {ds.sizes['x']}x{ds.sizes['y']} points de grille")
     
-    ds = (data.set_index(['time', 'L2_Y', 'L2_X'])
-              .to_xarray()
-              .rename({'L2_Y': 'y', 'L2_X': 'x'}))
+    ds.attrs.update(GLOBAL_ATTRS)
+    ds['x'].attrs = dict(X_ATTRS)
+    ds['y'].attrs = dict(Y_ATTRS)
+    ds['time'].attrs = dict(TIME_ATTRS)
+    ds['crs'] = xr.DataArray(data=0, attrs=dict(CRS_ATTRS))
+    var_attrs = get_variable_attrs(var, metadata_variables)
+    ds[var].attrs.update(var_attrs)
     
-    # Métadonnées globales
-    ds.attrs['crs'] = 'EPSG:27572'
-    ds.attrs['grid_mapping_name'] = 'lambert_conformal_conic'
-    ds.attrs['spatial_resolution'] = '8 km (0.072°)'
-    ds.attrs['projection'] = 'Lambert II étendu'
-    ds.attrs['source'] = 'SAFRAN-ISBA-MODCOU (SIM2)'
-    ds.attrs['institution'] = 'Météo-France'
-    
-    # Métadonnées des coordonnées
-    ds['x'].attrs = {
-        'standard_name': 'projection_x_coordinate',
-        'long_name': 'x coordinate of projection (Lambert II étendu)',
-        'units': 'm',
-        'axis': 'X'
-    }
-    
-    ds['y'].attrs = {
-        'standard_name': 'projection_y_coordinate',
-        'long_name': 'y coordinate of projection (Lambert II étendu)',
-        'units': 'm',
-        'axis': 'Y'
-    }
-    
-    ds['time'].attrs = {
-        'standard_name': 'time',
-        'long_name': 'time',
-        'axis': 'T'
-    }
-    
-    # Variable CRS
-    ds['crs'] = xr.DataArray(
-        data=0,
-        attrs={
-            'grid_mapping_name': 'lambert_conformal_conic',
-            'longitude_of_central_meridian': 2.337229,
-            'latitude_of_projection_origin': 46.8,
-            'standard_parallel': [45.898919, 47.696014],
-            'false_easting': 600000.0,
-            'false_northing': 2200000.0,
-            'semi_major_axis': 6378249.2,
-            'semi_minor_axis': 6356515.0,
-            'inverse_flattening': 293.46602,
-            'spatial_ref': 'EPSG:27572'
-        }
-    )
-    
-    # Métadonnées de la variable depuis le CSV
-    if var in metadata_variables.index:
-        var_meta = metadata_variables.loc[var]
-        ds[var].attrs['long_name'] = var_meta['description']
-        ds[var].attrs['units'] = var_meta['unite']
-        if pd.notna(var_meta['precision']):
-            ds[var].attrs['precision'] = var_meta['precision']
-        if pd.notna(var_meta['periode_agregation']):
-            ds[var].attrs['aggregation_period'] = var_meta['periode_agregation']
-        ds[var].attrs['grid_mapping'] = 'crs'
-    
-    output_file = CONVERT_DIR / file.with_suffix('.nc').name
+    output_file = get_converted_file(file, CONVERT_DIR)
+    var_encoding = get_encoding(profile, ds[var].shape,
+                                var_attrs.get('precision'), quantize)
+    packing = None
+    if quantize == 'pack':
+        packing = get_packing(var, var_attrs.get('precision'),
+                              (np.nanmin(ds[var].values), np.nanmax(ds[var].values)))
     encoding = {
-        var: {'zlib': True, 'complevel': 4, 'dtype': 'float32'},
-        'time': {'units': 'days since 1970-01-01 00:00:00',
+        var: {**var_encoding, **(packing or {'dtype': 'float32'})},
+        'time': {'units': TIME_UNITS,
                  'calendar': 'standard', 'dtype': 'float64'}
     }
     
@@ -97,8 +162,215 @@ def create_netcdf(file, CONVERT_DIR, METADATA_VARIABLES_FILE):
     return output_file
 
 
+def scan_parquet_grid(parquet_file):
+    """
+    Parcourt un fichier Parquet groupe de lignes par groupe de lignes pour
+    récupérer les axes (time, y, x) sans charger la variable en mémoire.
+    """
+    times, ys, xs = set(), set(), set()
+    for i in range(parquet_file.num_row_groups):
+        table = parquet_file.read_row_group(i, columns=['LAMBX', 'LAMBY', 'DATE'])
+        times.update(pd.unique(table['DATE'].to_numpy()))
+        ys.update(pd.unique(table['LAMBY'].to_numpy()))
+        xs.update(pd.unique(table['LAMBX'].to_numpy()))
+    return np.sort(list(times)), np.sort(list(ys)), np.sort(list(xs))
+
+
+def get_row_group_dates(parquet_file):
+    """Bornes (min, max) de DATE de chaque groupe de lignes, depuis les statistiques Parquet."""
+    date_col = parquet_file.schema_arrow.get_field_index('DATE')
+    bounds = []
+    for i in range(parquet_file.num_row_groups):
+        stats = parquet_file.metadata.row_group(i).column(date_col).statistics
+        if stats is not None and stats.has_min_max:
+            bounds.append((stats.min, stats.max))
+        else:
+            bounds.append((None, None))
+    return bounds
+
+
+def get_parquet_range(parquet_file, column):
+    """(min, max) d'une colonne depuis les statistiques Parquet, sans lire les données."""
+    col = parquet_file.schema_arrow.get_field_index(column)
+    vmin, vmax = np.nan, np.nan
+    for i in range(parquet_file.num_row_groups):
+        stats = parquet_file.metadata.row_group(i).column(col).statistics
+        if stats is None or not stats.has_min_max:
+            # Statistiques absentes : lecture de la colonne pour ce groupe de lignes
+            values = parquet_file.read_row_group(i, columns=[column])[column].to_numpy(zero_copy_only=False)
+            rg_min, rg_max = np.nanmin(values), np.nanmax(values)
+        else:
+            rg_min, rg_max = stats.min, stats.max
+        vmin = np.nanmin([vmin, rg_min])
+        vmax = np.nanmax([vmax, rg_max])
+    return vmin, vmax
+
+
+@instrument()
+def create_netcdf_streaming(file, CONVERT_DIR, METADATA_VARIABLES_FILE,
+                            profile=None, quantize=None, WINDOW_DAYS=366):
+    """
+    Convertit un fichier Parquet en NetCDF par fenêtres temporelles.
+
+    Le fichier Parquet est lu groupe de lignes par groupe de lignes et chaque
+    fenêtre de WINDOW_DAYS pas de temps est écrite dans une variable NetCDF
+    à dimension time illimitée. La mémoire reste bornée par la taille d'une
+    fenêtre (WINDOW_DAYS x y x x en float32), quelle que soit la période.
+
+    Les statistiques Parquet sur DATE permettent d'ignorer les groupes de
+    lignes hors fenêtre : un fichier trié par date n'est lu qu'une fois.
+    """
+    import netCDF4
+    import pyarrow.parquet as pq
+
+    metadata_variables = load_metadata_variables(METADATA_VARIABLES_FILE)
+
+    var = file.stem.split('_QUOT_SIM2')[0]
+    print(f"\n🌐 Conversion NetCDF (streaming): {file.name}")
+    print(f"   → variable: {var}")
+
+    parquet_file = pq.ParquetFile(file)
+    dates, lamby, lambx = scan_parquet_grid(parquet_file)
+    row_group_dates = get_row_group_dates(parquet_file)
+    time = pd.to_datetime(dates.astype(str), format='%Y%m%d')
+    print(f"   → {len(dates)} pas de temps | {len(lambx)}x{len(lamby)} points de grille")
+
+    output_file = get_converted_file(file, CONVERT_DIR)
+    tmp_file = output_file.with_suffix('.nc.tmp')
+
+    with netCDF4.Dataset(tmp_file, 'w', format='NETCDF4') as nc:
+        nc.setncatts(GLOBAL_ATTRS)
+        nc.createDimension('time', None)
+        nc.createDimension('y', len(lamby))
+        nc.createDimension('x', len(lambx))
+
+        nc_time = nc.createVariable('time', 'f8', ('time',))
+        nc_time.setncatts({**TIME_ATTRS, 'units': TIME_UNITS,
+                           'calendar': 'standard'})
+        nc_y = nc.createVariable('y', 'i8', ('y',))
+        nc_y.setncatts(Y_ATTRS)
+        nc_y[:] = lamby * 100
+        nc_x = nc.createVariable('x', 'i8', ('x',))
+        nc_x.setncatts(X_ATTRS)
+        nc_x[:] = lambx * 100
+
+        var_attrs = get_variable_attrs(var, metadata_variables)
+        var_encoding = get_encoding(profile, (len(dates), len(lamby), len(lambx)),
+                                    var_attrs.get('precision'), quantize)
+        packing = None
+        if quantize == 'pack':
+            packing = get_packing(var, var_attrs.get('precision'),
+                                  get_parquet_range(parquet_file, var))
+        if packing:
+            nc_var = nc.createVariable(var, packing['dtype'], ('time', 'y', 'x'),
+                                       fill_value=packing['_FillValue'],
+                                       **var_encoding)
+            nc_var.scale_factor = packing['scale_factor']
+            nc_var.add_offset = packing['add_offset']
+        else:
+            nc_var = nc.createVariable(var, 'f4', ('time', 'y', 'x'),
+                                       fill_value=np.float32(np.nan),
+                                       **var_encoding)
+        nc_var.setncatts(var_attrs)
+
+        nc_crs = nc.createVariable('crs', 'i8', ())
+        nc_crs.setncatts(CRS_ATTRS)
+        nc_crs.assignValue(0)
+
+        for start in range(0, len(dates), WINDOW_DAYS):
+            window = dates[start:start + WINDOW_DAYS]
+            slab = np.full((len(window), len(lamby), len(lambx)), np.nan,
+                           dtype='float32')
+
+            for i, (dmin, dmax) in enumerate(row_group_dates):
+                if dmin is not None and (dmax < window[0] or dmin > window[-1]):
+                    continue
+                table = parquet_file.read_row_group(i, columns=['LAMBX', 'LAMBY', 'DATE', var])
+                date_values = table['DATE'].to_numpy()
+                mask = (date_values >= window[0]) & (date_values <= window[-1])
+                if not mask.any():
+                    continue
+                it = np.searchsorted(window, date_values[mask])
+                iy = np.searchsorted(lamby, table['LAMBY'].to_numpy()[mask])
+                ix = np.searchsorted(lambx, table['LAMBX'].to_numpy()[mask])
+                slab[it, iy, ix] = table[var].to_numpy(zero_copy_only=False)[mask]
+
+            window_time = time[start:start + WINDOW_DAYS]
+            nc_time[start:start + len(window)] = netCDF4.date2num(
+                window_time.to_pydatetime(), TIME_UNITS, 'standard')
+            missing = np.isnan(slab)
+            nc_var[start:start + len(window)] = np.ma.masked_array(
+                np.where(missing, 0, slab), mask=missing)
+
+    tmp_file.replace(output_file)
+    print(f"   💾 {output_file.name}")
+
+    return output_file
+
+
+def get_available_memory():
+    """Mémoire disponible en octets (MemAvailable sous Linux), ou None si inconnue."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def estimate_conversion_memory(file, streaming=False, WINDOW_DAYS=366):
+    """
+    Estime le pic mémoire d'une conversion à partir des métadonnées Parquet.
+
+    En mode complet : DataFrame des 4 colonnes (8 octets chacune, ~2 copies
+    pendant la préparation) + cube float32, la grille dense faisant environ
+    deux fois le nombre de points SIM2. En streaming : une fenêtre temporelle
+    + un groupe de lignes.
+    """
+    import pyarrow.parquet as pq
+    parquet_file = pq.ParquetFile(file)
+    metadata = parquet_file.metadata
+    num_rows = metadata.num_rows
+    if not streaming:
+        return num_rows * 4 * 8 * 2 + num_rows * 2 * 4
+
+    largest_row_group = max((metadata.row_group(i).num_rows
+                             for i in range(metadata.num_row_groups)), default=0)
+    dates = [d for bounds in get_row_group_dates(parquet_file)
+             for d in bounds if d is not None]
+    if dates:
+        span = pd.to_datetime(str(max(dates))) - pd.to_datetime(str(min(dates)))
+        n_points = num_rows / (span.days + 1)
+    else:
+        n_points = num_rows
+    return int(WINDOW_DAYS * n_points * 2 * 4 + largest_row_group * 4 * 8 * 2)
+
+
+def get_max_workers(files, workers, streaming=False, MEMORY_FRACTION=0.8):
+    """
+    Limite le nombre de conversions simultanées à ce que la mémoire permet,
+    en supposant que les plus gros fichiers tournent en même temps.
+    """
+    available = get_available_memory()
+    if available is None or not files:
+        return workers
+    peak = max(estimate_conversion_memory(f, streaming) for f in files)
+    return max(1, min(workers, int(available * MEMORY_FRACTION // max(1, peak))))
+
+
+def get_converted_file(parquet_file, CONVERT_DIR):
+    """NetCDF converti d'un fichier Parquet. Ex: CONVERT_DIR/T_QUOT_SIM2_1958-1959.nc"""
+    return Path(CONVERT_DIR) / Path(parquet_file).with_suffix('.nc').name
+
+
 def convert(SPLIT_DIR, CONVERT_DIR, METADATA_VARIABLES_FILE,
-            splited_files=None):
+            splited_files=None, streaming=False, workers=1,
+            profile=None, quantize=None, state=None, force=False):
     """
     Convertit les fichiers Parquet en fichiers NetCDF géoréférencés.
 
@@ -107,7 +379,21 @@ def convert(SPLIT_DIR, CONVERT_DIR, METADATA_VARIABLES_FILE,
         CONVERT_DIR (str | Path):          Dossier de sortie pour les fichiers NetCDF.
                                            Créé automatiquement s'il n'existe pas.
         splited_files (list[Path], optional): Fichiers Parquet à convertir.
-                                              Si None, traite tous les *.parquet de SPLIT_DIR.
+                                              Si None, traite tous les Parquet découpés
+                                              (état, ou *.parquet de SPLIT_DIR).
+        streaming (bool):                  Convertit par fenêtres temporelles (mémoire bornée)
+                                           via create_netcdf_streaming().
+        workers (int):                     Nombre maximal de conversions en parallèle (processus).
+                                           Réduit automatiquement selon la mémoire disponible.
+                                           Défaut: 1 (séquentiel).
+        profile (str, optional):           Profil d'encodage NetCDF ('map', 'timeseries',
+                                           'balanced'). Voir encoding.ENCODING_PROFILES.
+        quantize (str, optional):          Quantification à la précision publiée de la variable :
+                                           'round' (arrondi, float32) ou 'pack' (entiers
+                                           int16/int32 avec scale_factor). Si None, aucune.
+        state (StateStore, optional):      État du pipeline : les NetCDF à jour ne sont pas
+                                           reconvertis.
+        force (bool):                      Reconvertit même les NetCDF à jour.
 
     Returns:
         list[Path]: Chemins des fichiers NetCDF créés.
@@ -115,7 +401,8 @@ def convert(SPLIT_DIR, CONVERT_DIR, METADATA_VARIABLES_FILE,
 
     Notes:
         - CRS : EPSG:27572 (Lambert II étendu).
-        - Compression : zlib niveau 4, variables en float32, time en float64.
+        - Compression : zlib niveau 4 par défaut (ou selon le profil),
+          variables en float32, time en float64.
     """
         
     SPLIT_DIR = Path(SPLIT_DIR)
@@ -123,19 +410,64 @@ def convert(SPLIT_DIR, CONVERT_DIR, METADATA_VARIABLES_FILE,
     CONVERT_DIR.mkdir(parents=True, exist_ok=True)
 
     if splited_files is None:
-        splited_files = list(Path(SPLIT_DIR).glob("*.parquet"))
+        splited_files = get_stage_files(state, 'split', SPLIT_DIR, "*.parquet")
     else:
         splited_files = [f for sublist in splited_files for f in sublist]
 
     tprint("convert", "small")
     print("CONVERSION")
+
+    fresh = {}
+    if state is not None:
+        splited_files, fresh = state.get_pending(
+            splited_files, 'convert',
+            lambda file: get_converted_file(file, CONVERT_DIR), force)
+        if fresh:
+            print(f"   ⏭️  {len(fresh)} fichier(s) déjà converti(s)")
         
+    convert_file = create_netcdf_streaming if streaming else create_netcdf
+    if workers > 1 and len(splited_files) > 1:
+        workers = get_max_workers(splited_files, workers, streaming)
+        print(f"   → {workers} conversion(s) en parallèle")
+
     converted_files = []
-    for i, file in enumerate(splited_files, start=1):
-        print(f"\n[{i}/{len(splited_files)}]")
-        output_file = create_netcdf(file, CONVERT_DIR,
-                                    METADATA_VARIABLES_FILE)       
-        converted_files.append(output_file)
+    if workers > 1 and len(splited_files) > 1:
+        # Un fichier Parquet par tâche, résultats remis dans l'ordre d'entrée
+        converted_files = [None] * len(splited_files)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(convert_file, file, CONVERT_DIR,
+                                       METADATA_VARIABLES_FILE,
+                                       profile, quantize): i
+                       for i, file in enumerate(splited_files)}
+            for done, future in enumerate(as_completed(futures), 1):
+                i = futures[future]
+                try:
+                    converted_files[i] = future.result()
+                except Exception as e:
+                    if state is not None:
+                        state.record_failure(get_converted_file(splited_files[i], CONVERT_DIR),
+                                             'convert', [splited_files[i]], e)
+                    raise
+                print(f"\n[{done}/{len(splited_files)}] ✅ {splited_files[i].name}")
+                if state is not None:
+                    state.record(converted_files[i], 'convert', [splited_files[i]])
+    else:
+        for i, file in enumerate(splited_files, start=1):
+            print(f"\n[{i}/{len(splited_files)}]")
+            started_at = time.time()
+            try:
+                output_file = convert_file(file, CONVERT_DIR,
+                                           METADATA_VARIABLES_FILE,
+                                           profile, quantize)
+            except Exception as e:
+                if state is not None:
+                    state.record_failure(get_converted_file(file, CONVERT_DIR), 'convert',
+                                         [file], e, started_at, time.time() - started_at)
+                raise
+            if state is not None:
+                state.record(output_file, 'convert', [file], started_at, time.time() - started_at)
+            converted_files.append(output_file)
+    converted_files += [outputs[0] for outputs in fresh.values()]
         
     print("\nRÉSUMÉ")
     print(f"   - {len(converted_files)} fichier(s) converti(s)")
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import threading
+import requests
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class DataverseClient:
+    """
+    Client d'un dataset Dataverse : une session HTTP (connexions réutilisées,
+    reprises sur erreurs transitoires) et la liste des fichiers du dataset,
+    téléchargée une fois puis tenue à jour après chaque ajout ou suppression.
+
+    Args:
+        dataset_DOI (str):   DOI du dataset. Ex: "doi:10.57745/BAZ12C"
+        RDG_BASE_URL (str):  URL de l'entrepôt. Ex: "https://entrepot.recherche.data.gouv.fr"
+        RDG_API_TOKEN (str): Jeton d'API Dataverse.
+        workers (int):       Nombre de suppressions simultanées (les ajouts, sérialisés
+                             par Dataverse, sont faits un par un).
+        RETRIES (int):       Nombre de reprises d'un ajout ou d'un remplacement refusé car
+                             le dataset est verrouillé (ex: ingestion d'un ajout précédent
+                             en cours).
+    """
+
+    def __init__(self, dataset_DOI: str,
+                 RDG_BASE_URL: str = os.getenv("RDG_BASE_URL"),
+                 RDG_API_TOKEN: str = os.getenv("RDG_API_TOKEN"),
+                 workers: int = 4,
+                 RETRIES: int = 3):
+        self.dataset_DOI = dataset_DOI
+        self.base_url = RDG_BASE_URL.rstrip("/")
+        self.workers = max(1, workers)
+        self.retries = RETRIES
+
+        self.session = requests.Session()
+        self.session.headers['X-Dataverse-key'] = RDG_API_TOKEN
+        # GET et DELETE sont repris sur 429/5xx ; les POST sont gérés par _post_file
+        adapter = HTTPAdapter(pool_maxsize=self.workers + 2,
+                              max_retries=Retry(total=3, backoff_factor=1,
+                                                status_forcelist=[429, 502, 503, 504]))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._files = None
+        self._lock = threading.Lock()
+
+    def list_files(self, refresh: bool = False) -> dict:
+        """
+        Fichiers du dataset (dernière version), par nom.
+        Ex: {'T_QUOT_SIM2_latest-19580801-20261011.nc': {'id': 123, 'filename': ..., ...}}
+        """
+        with self._lock:
+            if self._files is None or refresh:
+                response = self.session.get(f"{self.base_url}/api/datasets/:persistentId/",
+                                            params={"persistentId": self.dataset_DOI})
+                response.raise_for_status()
+                files_data = response.json()['data']['latestVersion']['files']
+                self._files = {file_info['dataFile']['filename']: file_info['dataFile']
+                               for file_info in files_data}
+            return dict(self._files)
+
+    def invalidate(self):
+        """Oublie la liste en cache : elle sera relue au prochain list_files()"""
+        with self._lock:
+            self._files = None
+
+    def get_existing_files(self) -> set:
+        """Noms des fichiers du dataset"""
+        return set(self.list_files())
+
+    def delete_file(self, filename: str) -> bool:
+        """
+        Supprime un fichier par son nom, sans relire le dataset.
+
+        Returns:
+            bool: True si supprimé, False si absent du dataset.
+        """
+        data_file = self.list_files().get(filename)
+        if data_file is None:
+            return False
+        response = self.session.delete(f"{self.base_url}/api/files/{data_file['id']}")
+        if response.status_code not in [200, 204]:
+            raise RuntimeError(f"{response.status_code} - {response.text}")
+        with self._lock:
+            if self._files is not None:
+                self._files.pop(filename, None)
+        return True
+
+    def _post_file(self, url, file_path, json_data: dict, params: dict = None,
+                   mime_type: str = None):
+        """
+        Envoie un fichier au dataset, en reprenant les refus dus à un verrou
+        du dataset (409, ou verrou/OptimisticLock signalé dans la réponse).
+        """
+        path_obj = Path(file_path)
+        for attempt in range(self.retries + 1):
+            with open(path_obj, 'rb') as f:
+                file_field = (path_obj.name, f, mime_type) if mime_type else (path_obj.name, f)
+                response = self.session.post(url, params=params, files={
+                    'file': file_field,
+                    'jsonData': (None, json.dumps(json_data), 'application/json')
+                })
+            if response.status_code in [200, 201]:
+                return response
+            locked = response.status_code == 409 or 'lock' in response.text.lower()
+            if not locked or attempt == self.retries:
+                break
+            time.sleep(2 ** attempt)
+        raise RuntimeError(f"{response.status_code} - {response.text}")
+
+    def _cache_response_file(self, response, replaced: str = None):
+        """Met à jour la liste en cache avec le fichier renvoyé par l'API"""
+        try:
+            data_file = response.json()['data']['files'][0]['dataFile']
+            with self._lock:
+                if self._files is not None:
+                    if replaced is not None:
+                        self._files.pop(replaced, None)
+                    self._files[data_file['filename']] = data_file
+        except (ValueError, KeyError, IndexError):
+            self.invalidate()
+
+    def add_file(self, file_path, json_data: dict, mime_type: str = None) -> tuple:
+        """
+        Ajoute un fichier au dataset. Dataverse sérialisant les modifications
+        d'un dataset, les ajouts sont à faire un par un.
+
+        Returns:
+            tuple: (taille en octets, durée en secondes)
+        """
+        start_time = time.time()
+        response = self._post_file(f"{self.base_url}/api/datasets/:persistentId/add",
+                                   file_path, json_data,
+                                   params={"persistentId": self.dataset_DOI},
+                                   mime_type=mime_type)
+        # Le fichier ajouté est renvoyé par l'API : la liste en cache reste à jour
+        self._cache_response_file(response)
+        return os.path.getsize(file_path), time.time() - start_time
+
+    def replace_file(self, filename: str, file_path, json_data: dict,
+                     mime_type: str = None) -> tuple:
+        """
+        Remplace le fichier filename du dataset par file_path, en une requête :
+        l'ancienne version reste en place si le remplacement échoue.
+
+        Returns:
+            tuple: (taille en octets, durée en secondes)
+
+        Raises:
+            KeyError: Si filename n'est pas dans le dataset.
+        """
+        data_file = self.list_files()[filename]
+        start_time = time.time()
+        response = self._post_file(f"{self.base_url}/api/files/{data_file['id']}/replace",
+                                   file_path, {**json_data, "forceReplace": True},
+                                   mime_type=mime_type)
+        self._cache_response_file(response, replaced=filename)
+        return os.path.getsize(file_path), time.time() - start_time
+
+    def delete_files(self, filenames: list) -> list:
+        """
+        Supprime plusieurs fichiers par leur nom, workers à la fois.
+
+        Returns:
+            list: Noms des fichiers supprimés.
+        """
+        deleted = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.delete_file, filename): filename
+                       for filename in filenames}
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    if future.result():
+                        print(f"   🗑️  {filename}")
+                        deleted.append(filename)
+                except Exception as e:
+                    print(f"   ❌ {filename} : {str(e)}")
+        return deleted
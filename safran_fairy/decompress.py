@@ -1,27 +1,239 @@
 import os
+import json
+import time
 import gzip
-import shutil
+import zlib
 import requests
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from art import tprint
 
 from .clean import clean_local
+from .state import get_stage_files
+from .metrics import instrument
+from .tools import file_fingerprint
 
 
-def decompress_file(gz_file, RAW_DIR):
-    """Dézippe un fichier .gz dans le dossier RAW_DIR"""
-    output_file = Path(RAW_DIR) / gz_file.stem
+GZIP_MAGIC = b'\x1f\x8b'
+GZIP_WBITS = 16 + zlib.MAX_WBITS    # en-tête et CRC gzip vérifiés par zlib
 
-    print(f"\n📦 Décompression: {gz_file.name}")            
+
+@instrument()
+def decompress_file(gz_file, RAW_DIR, workers=1, BUFFER_SIZE=4*1024*1024):
+    """
+    Dézippe un fichier .gz dans le dossier RAW_DIR.
+
+    Le CSV est écrit dans un fichier .part, renommé une fois complet. Chaque
+    membre gzip décompressé est ajouté à l'index de l'archive (voir
+    get_index_file) : une décompression interrompue reprend après le dernier
+    membre complet, et une archive multi-membre déjà entièrement indexée
+    (décompressée une première fois en entier) est décompressée par plages
+    de membres en parallèle.
+
+    Args:
+        gz_file (Path):      Archive .csv.gz.
+        RAW_DIR (Path):      Dossier de destination.
+        workers (int):       Nombre de plages de membres décompressées en parallèle
+                             (threads : zlib libère le GIL). Défaut: 1.
+        BUFFER_SIZE (int):   Taille des lectures de l'archive, en octets.
+
+    Returns:
+        Path: CSV décompressé. Ex: RAW_DIR/QUOT_SIM2_1958-1959.csv
+
+    Notes:
+        Les archives data.gouv.fr sont en général d'un seul membre : la
+        reprise et le parallélisme ne s'appliquent qu'aux archives
+        multi-membres (gzip concaténés, bgzip, pigz --independent...).
+        La première décompression d'une archive est toujours séquentielle
+        (c'est elle qui construit l'index) : les plages parallèles n'accélèrent
+        que les décompressions suivantes, ex. après suppression du CSV ou avec
+        --overwrite. decompress() et run_pipeline parallélisent par archive
+        (workers=1 ici), sauf pour une archive seule.
+    """
+    gz_file = Path(gz_file)
+    output_file = get_decompressed_file(gz_file, RAW_DIR)
+    part_file = output_file.with_name(output_file.name + '.part')
+    index_file = get_index_file(gz_file, RAW_DIR)
+
+    print(f"\n📦 Décompression: {gz_file.name}")
     print(f"   → {output_file}")
-    
-    with gzip.open(gz_file, 'rb') as f_in:
-        with open(output_file, 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)  
+
+    members = load_index(gz_file, index_file)
+    archive_size = gz_file.stat().st_size
+    indexed = members[-1]['offset'] + members[-1]['length'] if members else 0
+
+    blocks = [member for member in members if not member.get('padding')]
+    if indexed == archive_size and workers > 1 and len(blocks) > 1:
+        # Archive entièrement indexée : plages de membres en parallèle
+        print(f"   ⚡ {len(blocks)} membres, {min(workers, len(blocks))} threads")
+        decompress_parallel(gz_file, part_file, blocks, workers, BUFFER_SIZE)
+    else:
+        raw_size = members[-1]['raw_offset'] + members[-1]['raw_length'] if members else 0
+        if members and indexed < archive_size and part_file.exists() \
+                and part_file.stat().st_size >= raw_size:
+            print(f"   ↪️  Reprise après {len(members)} membre(s) ({raw_size / 1024**2:.0f} Mo)")
+        else:
+            members, indexed, raw_size = [], 0, 0
+        write_index(gz_file, index_file, members)
+        with open(part_file, 'r+b' if indexed else 'wb') as f_out, \
+                open(index_file, 'a') as f_index:
+            f_out.truncate(raw_size)
+            f_out.seek(raw_size)
+
+            def on_member(member):
+                # Membre complet : écrit sur disque avant d'être indexé
+                f_out.flush()
+                f_index.write(json.dumps(member) + '\n')
+                f_index.flush()
+
+            with open(gz_file, 'rb') as f_in:
+                decompress_members(f_in, f_out.write, indexed, raw_size,
+                                   BUFFER_SIZE=BUFFER_SIZE, on_member=on_member)
+
+    os.replace(part_file, output_file)
     return output_file
 
 
-def decompress(DOWNLOAD_DIR, RAW_DIR, downloaded_files=None):
+def decompress_members(f_in, write, offset=0, raw_offset=0, end=None,
+                       BUFFER_SIZE=4*1024*1024, on_member=None):
+    """
+    Décompresse les membres gzip successifs de f_in, de offset jusqu'à end
+    (fin de l'archive par défaut).
+
+    Args:
+        f_in (file):            Archive ouverte en binaire.
+        write (callable):       Reçoit les données décompressées.
+        offset (int):           Début du premier membre dans l'archive.
+        raw_offset (int):       Position du premier membre dans le CSV.
+        end (int, optional):    Fin du dernier membre à décompresser.
+        BUFFER_SIZE (int):      Taille des lectures, en octets.
+        on_member (callable):   Appelé à la fin de chaque membre avec son entrée d'index.
+                                Ex: {'offset': 0, 'length': 1048576,
+                                     'raw_offset': 0, 'raw_length': 7340032}
+
+    Returns:
+        int: Nombre d'octets décompressés.
+
+    Raises:
+        EOFError:            Archive tronquée.
+        gzip.BadGzipFile:    Données qui ne sont pas du gzip après un membre.
+    """
+    f_in.seek(offset)
+    position, raw_position = offset, raw_offset
+    member_start, raw_start = offset, raw_offset
+    decompressor = None     # créé au premier octet de chaque membre
+    while end is None or position < end:
+        data = f_in.read(BUFFER_SIZE if end is None else min(BUFFER_SIZE, end - position))
+        if not data:
+            break
+        position += len(data)
+        while data:
+            if decompressor is None:
+                if data[:1] == b'\x00':
+                    # Bourrage de zéros en fin d'archive, ignoré comme par gzip
+                    # (indexé pour que l'index couvre toute l'archive)
+                    if data.strip(b'\x00') or f_in.read().strip(b'\x00'):
+                        raise gzip.BadGzipFile("Données inattendues après un membre gzip")
+                    if on_member is not None:
+                        on_member({'offset': member_start, 'length': f_in.tell() - member_start,
+                                   'raw_offset': raw_position, 'raw_length': 0, 'padding': True})
+                    return raw_position - raw_offset
+                if not GZIP_MAGIC.startswith(data[:2]):
+                    raise gzip.BadGzipFile("Données inattendues après un membre gzip")
+                decompressor = zlib.decompressobj(GZIP_WBITS)
+            output = decompressor.decompress(data)
+            write(output)
+            raw_position += len(output)
+            if not decompressor.eof:
+                break
+            data = decompressor.unused_data
+            member_end = position - len(data)
+            if on_member is not None:
+                on_member({'offset': member_start, 'length': member_end - member_start,
+                           'raw_offset': raw_start, 'raw_length': raw_position - raw_start})
+            member_start, raw_start = member_end, raw_position
+            decompressor = None
+    if position > member_start:
+        raise EOFError(f"Archive tronquée : membre commencé à l'octet {member_start} incomplet")
+    return raw_position - raw_offset
+
+
+def decompress_range(gz_file, part_file, members, BUFFER_SIZE):
+    """Décompresse une plage de membres consécutifs à sa position dans part_file"""
+    first, last = members[0], members[-1]
+    with open(gz_file, 'rb') as f_in, open(part_file, 'r+b') as f_out:
+        f_out.seek(first['raw_offset'])
+        size = decompress_members(f_in, f_out.write, first['offset'], first['raw_offset'],
+                                  last['offset'] + last['length'], BUFFER_SIZE)
+    if size != last['raw_offset'] + last['raw_length'] - first['raw_offset']:
+        raise ValueError(f"Index incohérent pour {Path(gz_file).name}")
+    return size
+
+
+def decompress_parallel(gz_file, part_file, members, workers, BUFFER_SIZE):
+    """
+    Décompresse les membres d'une archive indexée (hors bourrage) en plages
+    de membres consécutifs, de tailles compressées équilibrées, chacune
+    écrite à sa position dans part_file (préalloué à la taille finale).
+    """
+    groups, target = [[]], sum(m['length'] for m in members) / workers
+    for member in members:
+        if groups[-1] and sum(m['length'] for m in groups[-1]) >= target:
+            groups.append([])
+        groups[-1].append(member)
+
+    with open(part_file, 'wb') as f_out:
+        f_out.truncate(members[-1]['raw_offset'] + members[-1]['raw_length'])
+    with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+        futures = [executor.submit(decompress_range, gz_file, part_file, group, BUFFER_SIZE)
+                   for group in groups]
+        for future in as_completed(futures):
+            future.result()
+
+
+def get_index_file(gz_file, RAW_DIR):
+    """Index des membres d'une archive. Ex: RAW_DIR/QUOT_SIM2_1958-1959.csv.index"""
+    return Path(RAW_DIR) / (Path(gz_file).stem + '.index')
+
+
+def write_index(gz_file, index_file, members=()):
+    """
+    Écrit un index : empreinte de l'archive indexée puis un membre par
+    ligne (les membres suivants y sont ajoutés au fil de la décompression).
+    """
+    with open(index_file, 'w') as f:
+        f.write(json.dumps(file_fingerprint(gz_file)) + '\n')
+        for member in members:
+            f.write(json.dumps(member) + '\n')
+
+
+def load_index(gz_file, index_file) -> list:
+    """
+    Membres indexés d'une archive, dans l'ordre. Liste vide si l'index
+    n'existe pas ou a été construit pour une autre version de l'archive.
+    """
+    if not Path(index_file).exists():
+        return []
+    with open(index_file) as f:
+        lines = [json.loads(line) for line in f if line.endswith('\n')]
+    if not lines or lines[0] != file_fingerprint(gz_file):
+        return []
+    members = lines[1:]
+    # Membres contigus depuis le début de l'archive (une ligne partielle est ignorée)
+    if members and members[0]['offset'] != 0:
+        return []
+    for previous, member in zip(members, members[1:]):
+        if member['offset'] != previous['offset'] + previous['length']:
+            return []
+    return members
+
+
+def get_decompressed_file(gz_file, RAW_DIR):
+    """CSV décompressé d'une archive. Ex: RAW_DIR/QUOT_SIM2_1958-1959.csv"""
+    return Path(RAW_DIR) / Path(gz_file).stem
+
+
+def decompress(DOWNLOAD_DIR, RAW_DIR, downloaded_files=None, workers=1, state=None, force=False):
     """
     Décompresse les fichiers .csv.gz en fichiers CSV bruts.
 
@@ -30,7 +242,16 @@ def decompress(DOWNLOAD_DIR, RAW_DIR, downloaded_files=None):
         RAW_DIR (str | Path):              Dossier de destination pour les fichiers décompressés.
                                            Créé automatiquement s'il n'existe pas.
         downloaded_files (list[str], optional): Noms des fichiers à traiter.
-                                                Si None, traite tous les *.csv.gz de DOWNLOAD_DIR.
+                                                Si None, traite toutes les archives téléchargées
+                                                (état, ou *.csv.gz de DOWNLOAD_DIR).
+        workers (int):                     Nombre d'archives décompressées en parallèle (processus).
+                                           Une archive seule est décompressée par plages de
+                                           membres si elle est déjà entièrement indexée, par
+                                           une décompression précédente (voir decompress_file).
+                                           Défaut: 1 (séquentiel).
+        state (StateStore, optional):      État du pipeline : les CSV à jour ne sont pas
+                                           décompressés à nouveau.
+        force (bool):                      Décompresse même les CSV à jour.
 
     Returns:
         list[Path]: Chemins des fichiers CSV décompressés.
@@ -41,15 +262,51 @@ def decompress(DOWNLOAD_DIR, RAW_DIR, downloaded_files=None):
 
     Path(RAW_DIR).mkdir(parents=True, exist_ok=True)    
     if downloaded_files is None:
-        downloaded_files = list(Path(DOWNLOAD_DIR).glob("*.csv.gz"))
+        downloaded_files = get_stage_files(state, 'download', DOWNLOAD_DIR, "*.csv.gz")
         
     print("DÉCOMPRESSION")
+
+    fresh = {}
+    if state is not None:
+        downloaded_files, fresh = state.get_pending(
+            downloaded_files, 'decompress',
+            lambda file: get_decompressed_file(file, RAW_DIR), force)
+        if fresh:
+            print(f"   ⏭️  {len(fresh)} fichier(s) déjà décompressé(s)")
     
-    decompressed_files = []    
-    for i, file in enumerate(downloaded_files, start=1):
-        print(f"\n[{i}/{len(downloaded_files)}]")
-        output_file = decompress_file(file, RAW_DIR)
-        decompressed_files.append(output_file)
+    decompressed_files = [outputs[0] for outputs in fresh.values()]
+    if workers > 1 and len(downloaded_files) > 1:
+        # Décompression limitée par le CPU : une archive par processus
+        with ProcessPoolExecutor(max_workers=min(workers, len(downloaded_files))) as executor:
+            futures = {executor.submit(decompress_file, file, RAW_DIR): file
+                       for file in downloaded_files}
+            for done, future in enumerate(as_completed(futures), 1):
+                file = futures[future]
+                try:
+                    output_file = future.result()
+                except Exception as e:
+                    if state is not None:
+                        state.record_failure(get_decompressed_file(file, RAW_DIR),
+                                             'decompress', [file], e)
+                    raise
+                print(f"\n[{done}/{len(downloaded_files)}] ✅ {Path(file).name}")
+                if state is not None:
+                    state.record(output_file, 'decompress', [file])
+                decompressed_files.append(output_file)
+    else:
+        for i, file in enumerate(downloaded_files, start=1):
+            print(f"\n[{i}/{len(downloaded_files)}]")
+            started_at = time.time()
+            try:
+                output_file = decompress_file(file, RAW_DIR, workers=workers)
+            except Exception as e:
+                if state is not None:
+                    state.record_failure(get_decompressed_file(file, RAW_DIR), 'decompress',
+                                         [file], e, started_at, time.time() - started_at)
+                raise
+            if state is not None:
+                state.record(output_file, 'decompress', [file], started_at, time.time() - started_at)
+            decompressed_files.append(output_file)
         
     print("\nRÉSUMÉ")
     print(f"   - {len(decompressed_files)} fichier(s) décompressés")
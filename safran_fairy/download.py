@@ -1,11 +1,16 @@
 import json
 import os
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 from art import tprint
 
 from .clean import clean_local
+from .metrics import instrument
 
 
 def load_state(STATE_FILE):
@@ -57,48 +62,168 @@ def has_changed(resource, state, DOWNLOAD_DIR):
     return False
 
 
-def download_file(resource, DOWNLOAD_DIR):
-    """Télécharge un fichier"""
+def get_session(workers=4):
+    """
+    Crée une session HTTP partagée entre les workers.
+
+    Le pool de connexions est dimensionné sur le nombre de workers pour que
+    chaque téléchargement garde sa connexion keep-alive, et les erreurs
+    transitoires (5xx, coupures) sont rejouées automatiquement.
+    """
+    retry = Retry(total=5, backoff_factor=2,
+                  status_forcelist=[500, 502, 503, 504],
+                  allowed_methods=["GET", "HEAD"])
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def load_part_info(part_path):
+    """Version de la ressource dont un .part est le début, ou {} si inconnue"""
+    info_path = part_path + '.json'
+    if os.path.exists(info_path):
+        with open(info_path, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_part_info(part_path, resource, response):
+    """
+    Enregistre à côté du .part la version de la ressource téléchargée
+    (last_modified de l'API, ETag et Last-Modified HTTP), pour ne reprendre
+    le .part que sur la même version.
+    """
+    with open(part_path + '.json', 'w') as f:
+        json.dump({'last_modified': resource.get('last_modified'),
+                   'etag': response.headers.get('ETag'),
+                   'http_last_modified': response.headers.get('Last-Modified')}, f)
+
+
+def remove_part(part_path):
+    """Supprime un .part et sa version enregistrée"""
+    for path in (part_path, part_path + '.json'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def get_range_total(response):
+    """
+    Taille complète de la ressource annoncée par une réponse 206
+    (Content-Range: bytes 100-199/1000 → (100, 1000)), total None si inconnu.
+    """
+    content_range = response.headers.get('Content-Range', '')
+    try:
+        _, spec = content_range.split(' ', 1)
+        byte_range, total = spec.split('/')
+        start = int(byte_range.split('-')[0])
+    except ValueError:
+        return None, None
+    return start, (int(total) if total != '*' else None)
+
+
+@instrument(inputs=lambda args, kwargs: None,
+            outputs=lambda result, args, kwargs: result['size_bytes'] if result else 0)
+def download_file(resource, DOWNLOAD_DIR, session=None, CHUNK_SIZE=1024*1024):
+    """
+    Télécharge un fichier, en reprenant un éventuel .part existant.
+
+    Le fichier est écrit dans <filename>.part puis renommé une fois sa taille
+    vérifiée. Si un .part d'un run précédent existe pour la même version de la
+    ressource (last_modified, enregistré dans <filename>.part.json), le
+    téléchargement reprend là où il s'était arrêté via un en-tête HTTP Range,
+    conditionné par If-Range : si la ressource a changé entre-temps, le
+    serveur la renvoie en entier. Un .part d'une autre version est supprimé.
+    """
+    if session is None:
+        session = requests
     url = resource.get('url')
     
     filename = url.split('/')[-1].split('?')[0]
     filepath = os.path.join(DOWNLOAD_DIR, filename)
+    part_path = filepath + '.part'
+    name = resource.get('title', filename)
     
-    print(f"\n📥 Téléchargement: {resource.get('title', filename)}")
+    print(f"\n📥 Téléchargement: {name}")
     print(f"   → {filepath}")
     
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded = 0
-        
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    if total_size > 0:
-                        percent = (downloaded / total_size) * 100
-                        print(f"   Progression: {percent:.1f}%", end='\r')
+        part_info = load_part_info(part_path)
+        if os.path.exists(part_path) and part_info.get('last_modified') != resource.get('last_modified'):
+            # .part d'une version précédente de la ressource : inutilisable
+            remove_part(part_path)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {}
+        validator = part_info.get('etag') or part_info.get('http_last_modified')
+        if offset and validator:
+            headers = {'Range': f'bytes={offset}-', 'If-Range': validator}
+        elif offset:
+            # Sans validateur HTTP, la reprise ne peut pas être vérifiée
+            offset = 0
+
+        with session.get(url, stream=True, headers=headers, timeout=60) as response:
+            if response.status_code == 416:
+                # Le .part couvre déjà tout le fichier (ou est invalide) : on repart de zéro
+                remove_part(part_path)
+                return download_file(resource, DOWNLOAD_DIR, session, CHUNK_SIZE)
+            response.raise_for_status()
+
+            content_length = int(response.headers.get('content-length', 0))
+            if offset and response.status_code == 206:
+                range_start, total_size = get_range_total(response)
+                if range_start != offset:
+                    raise IOError(f"plage inattendue ({response.headers.get('Content-Range')})")
+                print(f"   ↪️  Reprise à {offset / (1024*1024):.2f} Mo")
+                mode = 'ab'
+            else:
+                # Ressource modifiée (If-Range) ou Range ignoré : fichier renvoyé en entier
+                offset = 0
+                total_size = content_length or None
+                mode = 'wb'
+                save_part_info(part_path, resource, response)
+
+            expected_size = total_size or resource.get('filesize') or 0
+            downloaded = offset
+            last_percent = -10
+
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if chunk:
+                        f.write(chunk)
+                        downloaded += len(chunk)
+                        if expected_size > 0:
+                            percent = (downloaded / expected_size) * 100
+                            if percent - last_percent >= 10:
+                                last_percent = percent
+                                print(f"   {filename}: {percent:.0f}%")
+
+        # Vérification de la taille avant de valider le fichier
+        actual_size = os.path.getsize(part_path)
+        if expected_size and actual_size != expected_size:
+            raise IOError(f"taille incohérente ({actual_size} octets au lieu de {expected_size})")
+
+        os.replace(part_path, filepath)
+        remove_part(part_path)
         
-        size_mb = downloaded / (1024*1024)
-        print(f"\n   ✅ Téléchargé: {size_mb:.2f} Mo")
+        size_mb = actual_size / (1024*1024)
+        print(f"   ✅ Téléchargé: {filename} ({size_mb:.2f} Mo)")
         
         return {
             'filename': filename,
             'last_modified': resource.get('last_modified'),
             'downloaded_at': datetime.now().isoformat(),
-            'size_bytes': downloaded
+            'size_bytes': actual_size
         }
         
     except Exception as e:
-        print(f"   ❌ Erreur: {e}")
+        print(f"   ❌ Erreur ({filename}): {e}")
         return None
 
 
-def download(STATE_FILE, DOWNLOAD_DIR, METEO_BASE_URL, METEO_DATASET_ID):
+def download(STATE_FILE, DOWNLOAD_DIR, METEO_BASE_URL, METEO_DATASET_ID,
+             workers=4, state=None):
     """
     Synchronise les fichiers depuis l'API en téléchargeant uniquement ceux qui ont changé.
 
@@ -111,6 +236,9 @@ def download(STATE_FILE, DOWNLOAD_DIR, METEO_BASE_URL, METEO_DATASET_ID):
                             Créé automatiquement au premier appel.
         DOWNLOAD_DIR (str): Dossier de destination pour les fichiers téléchargés.
                             Créé automatiquement s'il n'existe pas.
+        workers (int):      Nombre de téléchargements simultanés. Défaut: 4.
+        state (StateStore, optional): État du pipeline (voir state.StateStore), à la place
+                            de STATE_FILE, qui n'est alors lu qu'une fois pour être importé.
 
     Returns:
         list[str] | None: Noms des fichiers téléchargés avec succès,
@@ -118,13 +246,23 @@ def download(STATE_FILE, DOWNLOAD_DIR, METEO_BASE_URL, METEO_DATASET_ID):
                           Ex: ['QUOT_SIM2_1958-1959.csv.gz', ...]
 
     Notes:
-        - L'état est sauvegardé après chaque téléchargement réussi.
+        - L'état est sauvegardé après chaque téléchargement réussi,
+          une fois la taille du fichier vérifiée.
+        - Les téléchargements interrompus sont repris depuis le fichier .part.
+        - Avec state, chaque archive est aussi enregistrée avec son checksum,
+          pour être reprise par le run suivant si son traitement est interrompu.
+          Un premier téléchargement qui échoue y est enregistré en échec.
     """
   
     tprint("download", "small")
 
     os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-    state = load_state(STATE_FILE)    
+    store = state
+    if store is not None:
+        store.import_json(STATE_FILE, DOWNLOAD_DIR)
+        state = store.load_downloads()
+    else:
+        state = load_state(STATE_FILE)
     API_URL = METEO_BASE_URL + METEO_DATASET_ID + "/"
     resources = get_resources(API_URL)
     
@@ -151,23 +289,41 @@ def download(STATE_FILE, DOWNLOAD_DIR, METEO_BASE_URL, METEO_DATASET_ID):
     failed = 0
     downloaded_files = []
     
-    for i, resource in enumerate(to_download, 1):
-        print(f"\n[{i}/{len(to_download)}]")
-        result = download_file(resource, DOWNLOAD_DIR)
-        
-        if result:
-            state[resource['id']] = result
-            save_state(state, STATE_FILE)
-            success += 1
-            downloaded_files.append(Path(DOWNLOAD_DIR) / result['filename'])
-        else:
-            failed += 1
+    session = get_session(workers)
+    started_at = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(download_file, resource, DOWNLOAD_DIR, session): resource
+                   for resource in to_download}
+        for i, future in enumerate(as_completed(futures), 1):
+            resource = futures[future]
+            result = future.result()
+            print(f"   [{i}/{len(to_download)}] terminé(s)")
+            
+            if result:
+                state[resource['id']] = result
+                if store is not None:
+                    store.save_download(resource['id'], result)
+                    store.record(Path(DOWNLOAD_DIR) / result['filename'], 'download',
+                                 started_at=started_at, duration=time.time() - started_at,
+                                 checksum=True)
+                else:
+                    save_state(state, STATE_FILE)
+                success += 1
+                downloaded_files.append(Path(DOWNLOAD_DIR) / result['filename'])
+            else:
+                failed += 1
+                filepath = Path(DOWNLOAD_DIR) / resource['url'].split('/')[-1].split('?')[0]
+                if store is not None and not filepath.exists():
+                    # Une version précédente de l'archive reste utilisable
+                    store.record_failure(filepath, 'download',
+                                         error="téléchargement échoué (voir le journal)")
+    session.close()
             
     print("\nRÉSUMÉ")
     print(f"   - ✅ Réussis: {success}")
     print(f"   - ❌ Échecs: {failed}")
     print(f"   - 📁 Dossier: {os.path.abspath(DOWNLOAD_DIR)}")
 
-    downloaded_files = [f for f in downloaded_files if f.name.endswith('.csv.gz')]
+    downloaded_files = sorted(f for f in downloaded_files if f.name.endswith('.csv.gz'))
     return downloaded_files
 
@@ -0,0 +1,175 @@
+import math
+import pandas as pd
+
+
+# Profils d'encodage NetCDF selon l'usage principal des fichiers :
+#   - map :        lecture de cartes complètes pour un jour donné
+#   - timeseries : lecture de longues chroniques en un point de grille
+#   - balanced :   compromis entre les deux
+# Les tailles de chunks sont données pour (time, y, x) et bornées par la
+# taille des dimensions fixes (la grille SIM2 fait ~134 x 143 mailles).
+ENCODING_PROFILES = {
+    'map': {
+        'chunksizes': (1, 1000, 1000),
+        'shuffle': True,
+        'complevel': 4,
+    },
+    'timeseries': {
+        'chunksizes': (3650, 8, 8),
+        'shuffle': True,
+        'complevel': 5,
+    },
+    'balanced': {
+        'chunksizes': (128, 32, 32),
+        'shuffle': True,
+        'complevel': 4,
+    },
+}
+
+
+def get_profile(profile):
+    """Retourne la définition d'un profil d'encodage, ou None si profile est None."""
+    if profile is None:
+        return None
+    if profile not in ENCODING_PROFILES:
+        raise ValueError(f"Profil d'encodage inconnu: {profile} "
+                         f"(choix: {', '.join(ENCODING_PROFILES)})")
+    return ENCODING_PROFILES[profile]
+
+
+def get_chunksizes(profile, shape):
+    """
+    Tailles de chunks (time, y, x) d'un profil, bornées par la forme des données.
+    """
+    chunks = get_profile(profile)['chunksizes']
+    return (max(1, min(chunks[0], shape[0])),
+            max(1, min(chunks[1], shape[1])),
+            max(1, min(chunks[2], shape[2])))
+
+
+# Modes de quantification à la précision publiée (colonne precision du CSV) :
+#   - round : arrondi à la précision avant compression, stockage float32
+#   - pack :  stockage en entiers (scale_factor = précision, add_offset = 0)
+QUANTIZE_MODES = ('round', 'pack')
+
+# Valeurs de remplissage des entiers packés (valeurs par défaut netCDF)
+PACK_FILL_VALUES = {'int16': -32767, 'int32': -2147483647}
+
+
+def get_least_significant_digit(precision):
+    """
+    Nombre de décimales à conserver pour une précision donnée.
+    Ex: 0.1 → 1, 0.01 → 2, 1 → 0
+    """
+    if precision is None or pd.isna(precision) or precision <= 0:
+        return None
+    return max(0, -math.floor(math.log10(precision)))
+
+
+def get_encoding(profile=None, shape=None, precision=None, quantize=None):
+    """
+    Encodage NetCDF d'une variable (time, y, x).
+
+    Les clés retournées sont communes à xarray (encoding de to_netcdf) et à
+    netCDF4.Dataset.createVariable.
+
+    Args:
+        profile (str, optional):  Nom du profil ('map', 'timeseries', 'balanced').
+                                  Si None, encodage historique : zlib niveau 4,
+                                  chunks par défaut de la librairie.
+        shape (tuple, optional):  Forme (time, y, x) des données, pour borner les chunks.
+        precision (float, optional): Précision publiée de la variable (CSV des variables).
+        quantize (str, optional): 'round' arrondit les valeurs à la précision publiée
+                                  avant compression (least_significant_digit).
+                                  Le mode 'pack' est géré par get_packing().
+
+    Returns:
+        dict: Ex: {'zlib': True, 'complevel': 4, 'shuffle': True, 'chunksizes': (128, 32, 32)}
+    """
+    encoding = {'zlib': True, 'complevel': 4}
+
+    if profile is not None:
+        definition = get_profile(profile)
+        encoding['complevel'] = definition['complevel']
+        encoding['shuffle'] = definition['shuffle']
+        if shape is not None:
+            encoding['chunksizes'] = get_chunksizes(profile, shape)
+
+    if quantize == 'round':
+        digits = get_least_significant_digit(precision)
+        if digits is not None:
+            encoding['least_significant_digit'] = digits
+
+    return encoding
+
+
+# Variables packées au moins en int32 : leurs valeurs dépassent en général la
+# plage int16 à la précision publiée (équivalent en eau du manteau neigeux sur
+# les glaciers). Fixer leur type évite de mélanger int16 et int32 d'un fichier
+# à l'autre ; les autres partent de int16.
+PACK_INT32_VARIABLES = {'RESR_NEIGE', 'RESR_NEIGE6'}
+
+# Types entiers candidats, du plus compact au plus large
+PACK_DTYPES = ('int16', 'int32')
+
+
+def get_packing(var, precision, value_range=None):
+    """
+    Paramètres de packing entier d'une variable à sa précision publiée.
+
+    Les valeurs sont stockées en entiers avec scale_factor = précision et
+    add_offset = 0. Le type est le plus compact dont la plage contient les
+    valeurs observées (value_range), à partir de int32 pour
+    PACK_INT32_VARIABLES et de int16 sinon. Si même int32 ne suffit pas, la
+    variable n'est pas packée (float32).
+
+    Args:
+        var (str):                    Nom de la variable. Ex: 'T'
+        precision (float):            Précision publiée de la variable. Ex: 0.1
+        value_range (tuple, optional): (min, max) des valeurs à stocker. Si None,
+                                       le type de départ est retenu.
+
+    Returns:
+        dict | None: Clés d'encodage xarray ('dtype', 'scale_factor', 'add_offset',
+                     '_FillValue'), ou None si la variable n'a pas de précision publiée
+                     ou si ses valeurs dépassent la plage int32.
+
+    Notes:
+        Les fichiers d'une même variable peuvent ainsi avoir des types
+        différents : le merge natif retient le plus large (voir
+        merge.get_merged_dtype), ou float32 si un fichier n'est pas packé.
+    """
+    if precision is None or pd.isna(precision) or precision <= 0:
+        return None
+
+    dtypes = PACK_DTYPES[PACK_DTYPES.index('int32'):] if var in PACK_INT32_VARIABLES else PACK_DTYPES
+    dtype = dtypes[0]
+    if value_range is not None and not (pd.isna(value_range[0]) or pd.isna(value_range[1])):
+        max_value = max(abs(value_range[0]), abs(value_range[1])) / precision
+        # Plage utile : ±(fill + 1), la valeur la plus basse étant réservée au _FillValue
+        dtype = next((d for d in dtypes if max_value <= -PACK_FILL_VALUES[d] - 1), None)
+        if dtype is None:
+            print(f"   ⚠️  {var} : valeurs hors de la plage int32 à la précision "
+                  f"{precision} {tuple(value_range)}, stockage float32 sans packing")
+            return None
+
+    return {'dtype': dtype,
+            'scale_factor': float(precision),
+            'add_offset': 0.0,
+            '_FillValue': PACK_FILL_VALUES[dtype]}
+
+
+def get_ncrcat_options(profile, shape):
+    """
+    Options NCO (ncrcat) appliquant le chunking et la compression d'un profil
+    au fichier concaténé. Liste vide si profile est None.
+    """
+    if profile is None:
+        return []
+    definition = get_profile(profile)
+    time_chunk, y_chunk, x_chunk = get_chunksizes(profile, shape)
+    return ['-4', '-L', str(definition['complevel']),
+            '--cnk_plc=g3d', '--cnk_map=dmn',
+            f'--cnk_dmn=time,{time_chunk}',
+            f'--cnk_dmn=y,{y_chunk}',
+            f'--cnk_dmn=x,{x_chunk}']
@@ -1,4 +1,5 @@
 import os
+import re
 import requests
 import json
 import time
@@ -25,26 +26,31 @@ def generate_index(S3_BUCKET: str,
                    S3_ACCESS_KEY: str = None,
                    S3_SECRET_KEY: str = None,
                    S3_ENDPOINT: str = None,
-                   S3_REGION: str = None):
+                   S3_REGION: str = None,
+                   inventory=None):
     """
     Génère un fichier HTML listant les liens S3 groupés par variable et type.
-    Les fichiers NC sont listés directement depuis le bucket S3.
+    Les fichiers NC sont lus dans inventory (voir upload_s3.S3Inventory) s'il
+    couvre S3_PREFIX, sinon listés directement depuis le bucket S3.
     """
 
-    # Lister les fichiers NC depuis S3
-    s3 = boto3.client('s3',
-                      aws_access_key_id=S3_ACCESS_KEY,
-                      aws_secret_access_key=S3_SECRET_KEY,
-                      endpoint_url=S3_ENDPOINT,
-                      region_name=S3_REGION)
-
-    paginator = s3.get_paginator('list_objects_v2')
-    file_names = []
-    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=S3_PREFIX):
-        for obj in page.get('Contents', []):
-            key = obj['Key']
-            if key.endswith('.nc'):
-                file_names.append(Path(key).name)
+    if inventory is not None and inventory.covers(S3_PREFIX):
+        file_names = [Path(key).name for key in inventory.keys(S3_PREFIX, extension='.nc')]
+    else:
+        # Lister les fichiers NC depuis S3
+        s3 = boto3.client('s3',
+                          aws_access_key_id=S3_ACCESS_KEY,
+                          aws_secret_access_key=S3_SECRET_KEY,
+                          endpoint_url=S3_ENDPOINT,
+                          region_name=S3_REGION)
+
+        paginator = s3.get_paginator('list_objects_v2')
+        file_names = []
+        for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=S3_PREFIX):
+            for obj in page.get('Contents', []):
+                key = obj['Key']
+                if key.endswith('.nc'):
+                    file_names.append(Path(key).name)
 
     if not file_names:
         print("\n⚠️  Aucun fichier NC trouvé sur S3")
@@ -347,7 +353,13 @@ def generate_stac_catalog(CATALOG_DIR,
                           S3_ACCESS_KEY: str = os.getenv("S3_ACCESS_KEY"),
                           S3_SECRET_KEY: str = os.getenv("S3_SECRET_KEY"),
                           S3_ENDPOINT: str = os.getenv("S3_ENDPOINT"),
-                          S3_REGION: str = os.getenv("S3_REGION", "eu-west-1")):
+                          S3_REGION: str = os.getenv("S3_REGION", "eu-west-1"),
+                          inventory=None):
+    """
+    Génère le catalogue STAC (collection mère, sous-collection et items par
+    variable) à partir des objets du préfixe, lus dans inventory (voir
+    upload_s3.S3Inventory) s'il couvre S3_PREFIX, sinon listés sur le bucket.
+    """
 
     # Base URL racine du bucket
     if S3_ENDPOINT:
@@ -370,11 +382,15 @@ def generate_stac_catalog(CATALOG_DIR,
                       endpoint_url=S3_ENDPOINT,
                       region_name=S3_REGION)
 
-    all_keys = []
-    paginator = s3.get_paginator('list_objects_v2')
-    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=S3_PREFIX):
-        for obj in page.get('Contents', []):
-            all_keys.append(obj['Key'])
+    if inventory is not None and inventory.covers(S3_PREFIX):
+        all_keys = inventory.keys(S3_PREFIX)
+    else:
+        all_keys = []
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=S3_PREFIX):
+            for obj in page.get('Contents', []):
+                all_keys.append(obj['Key'])
+    key_set = set(all_keys)
 
     # Métadonnées variables
     var_meta = {}
@@ -390,7 +406,7 @@ def generate_stac_catalog(CATALOG_DIR,
         if not filename.endswith('.nc'):
             continue
         parsed = parse_filename(filename)
-        if not parsed:
+        if not parsed or parsed['frequency'] != 'QUOT':
             continue
         variable = parsed['variable']
         version  = parsed['version']
@@ -405,6 +421,22 @@ def generate_stac_catalog(CATALOG_DIR,
                 'date_fin_int': date_fin
             }
 
+    # Publication à clé stable (voir upload_s3.publish_s3) : le manifeste donne
+    # le fichier daté publié et ses dates, l'item pointe vers la clé stable
+    manifest_pattern = r'^(?P<variable>.+)_QUOT_SIM2_(?P<version>latest|previous|historical)\.json$'
+    for key in all_keys:
+        match = re.match(manifest_pattern, Path(key).name)
+        if not match or str(Path(key).parent) != S3_PREFIX.strip('/'):
+            continue
+        manifest = json.loads(s3.get_object(Bucket=S3_BUCKET, Key=key)['Body'].read())
+        grouped[match.group('variable')][match.group('version')] = {
+            'filename':     manifest['file'],
+            'url':          f"{base_url}/{manifest['key']}",
+            'date_debut':   manifest['date_debut'],
+            'date_fin':     manifest['date_fin'],
+            'date_fin_int': int(manifest['date_fin'])
+        }
+
     if not grouped:
         print("⚠️  Aucun fichier reconnu dans le bucket")
         return []
@@ -492,6 +524,28 @@ def generate_stac_catalog(CATALOG_DIR,
                 ]
             }
 
+            # Store Zarr de la même variable et version (voir zarr_store.write_zarr)
+            zarr_key = f"{S3_PREFIX.strip('/')}/zarr/{variable}_QUOT_SIM2_{version}.zarr"
+            if f"{zarr_key}/.zmetadata" in key_set:
+                item["assets"]["zarr"] = {
+                    "href":  f"{base_url}/{zarr_key}",
+                    "type":  "application/vnd+zarr",
+                    "title": f"{variable}_QUOT_SIM2_{version}.zarr",
+                    "roles": ["data"],
+                    "xarray:open_kwargs": {"engine": "zarr", "consolidated": True}
+                }
+
+            # Index de références du NetCDF (voir reference.generate_references)
+            reference_key = f"{S3_PREFIX.strip('/')}/references/{f['filename']}.json"
+            if reference_key in key_set:
+                item["assets"]["references"] = {
+                    "href":  f"{base_url}/{reference_key}",
+                    "type":  "application/json",
+                    "title": f"{f['filename']}.json",
+                    "description": "Index kerchunk (chunks → plages d'octets) du fichier NetCDF",
+                    "roles": ["index", "references"]
+                }
+
             item_path = items_dir / f"{item_id}.json"
             with open(item_path, 'w', encoding='utf-8') as fp:
                 json.dump(item, fp, ensure_ascii=False, indent=2)
@@ -1,11 +1,18 @@
 import os
-import pandas as pd
+import json
+import time
+import numpy as np
 from pathlib import Path
-import xarray as xr
 from art import tprint
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 from .clean import clean_local
+from .encoding import get_encoding, get_ncrcat_options, PACK_FILL_VALUES
+from .convert import TIME_UNITS
+from .tools import file_checksum, file_fingerprint
+from .state import get_stage_files
+from .metrics import instrument
 
 
 def get_historical_files(files):
@@ -24,6 +31,22 @@ def get_latest_files(files):
     return latest_files
 
 
+def get_historical_outputs(OUTPUT_DIR):
+    return list(OUTPUT_DIR.glob("*historical*.nc"))
+
+def get_previous_outputs(OUTPUT_DIR):
+    return list(OUTPUT_DIR.glob("*previous*.nc"))
+
+
+# Types de merge dans l'ordre de dépendance : (type, filtre des fichiers
+# convertis, fichiers de base dans OUTPUT_DIR)
+MERGE_TYPES = [
+    ('historical', get_historical_files, None),
+    ('previous',   get_previous_files,   get_historical_outputs),
+    ('latest',     get_latest_files,     get_previous_outputs),
+]
+
+
 def get_variables(files):
     variables = [f.stem.split('_QUOT_SIM2')[0] for f in files]
     return variables
@@ -34,11 +57,27 @@ def get_set_variables(files):
     return variables
 
 
-def concatenate_nc_files(files, output_file, cutoff_date=None):
+def get_nc_shape(file, var):
+    """Forme (time, y, x) d'une variable NetCDF, sans lire les données"""
+    import netCDF4
+    with netCDF4.Dataset(file) as nc:
+        return nc.variables[var].shape
+
+
+@instrument(outputs=lambda result, args, kwargs: args[1])
+def concatenate_nc_files(files, output_file, cutoff_date=None, profile=None):
     import subprocess
+
+    options = []
+    if profile is not None:
+        var = Path(files[0]).stem.split('_QUOT_SIM2')[0]
+        shapes = [get_nc_shape(f, var) for f in files]
+        shape = (sum(shape[0] for shape in shapes),) + tuple(shapes[0][1:])
+        options = get_ncrcat_options(profile, shape)
     
     if cutoff_date is None:
-        subprocess.run(['ncrcat', '-h', '-O'] + [str(f) for f in files] + [str(output_file)])
+        subprocess.run(['ncrcat', '-h', '-O'] + options + [str(f) for f in files] + [str(output_file)],
+                       check=True)
     else:
         base_files = files[:-1]
         new_files = files[-1:]
@@ -47,17 +86,553 @@ def concatenate_nc_files(files, output_file, cutoff_date=None):
         
         subprocess.run(
             ['ncrcat', '-h', '-O', '-d', f'time,,{cutoff_exclusive}']
+            + options
             + [str(f) for f in base_files]
-            + [str(output_file)]
+            + [str(output_file)],
+            check=True
         )
         subprocess.run(
             ['ncrcat', '-h', '-A', str(output_file)]
             + [str(f) for f in new_files]
-            + [str(output_file)]
+            + [str(output_file)],
+            check=True
         )
+
+
+def get_nc_times(nc):
+    """Pas de temps d'un NetCDF ouvert, en jours depuis 1970-01-01"""
+    import netCDF4
+    time = nc.variables['time']
+    if time.shape[0] == 0:
+        return np.array([], dtype='float64')
+    dates = netCDF4.num2date(time[:], time.units,
+                             getattr(time, 'calendar', 'standard'))
+    return np.asarray(netCDF4.date2num(dates, TIME_UNITS, 'standard'), dtype='float64')
+
+
+def to_day_number(date):
+    """Date 'YYYY-MM-DD' en jours depuis 1970-01-01"""
+    return (datetime.strptime(date, '%Y-%m-%d') - datetime(1970, 1, 1)).days
+
+
+def get_nc_dtypes(files, var):
+    """Types de stockage de var dans chacun des fichiers"""
+    import netCDF4
+    dtypes = []
+    for file in files:
+        with netCDF4.Dataset(file) as nc:
+            dtypes.append(np.dtype(nc.variables[var].dtype))
+    return dtypes
+
+
+def get_merged_dtype(files, var):
+    """
+    Type de stockage commun de var dans files : l'entier packé le plus large
+    si tous les fichiers sont packés, float32 dès qu'un fichier ne l'est pas.
+    """
+    dtypes = get_nc_dtypes(files, var)
+    if all(dtype.kind == 'i' for dtype in dtypes):
+        return max(dtypes, key=lambda dtype: dtype.itemsize)
+    return np.dtype('float32')
+
+
+def create_nc_like(source_file, output_file, var, profile=None, dtype=None, n_times=None):
+    """
+    Crée un NetCDF vide (time illimité) avec la structure de source_file :
+    attributs globaux, coordonnées x/y, variable crs et variable var avec
+    son type (float32 ou entier packé), sa compression et son chunking.
+    dtype force le type de stockage de var (voir get_merged_dtype) et
+    n_times est la longueur attendue de la série, qui borne le chunk
+    temporel du profil (longueur de source_file par défaut).
+    """
+    import netCDF4
+
+    with netCDF4.Dataset(source_file) as src:
+        nc = netCDF4.Dataset(output_file, 'w', format='NETCDF4')
+        nc.setncatts({k: src.getncattr(k) for k in src.ncattrs()})
+        nc.createDimension('time', None)
+        for dim in ('y', 'x'):
+            nc.createDimension(dim, len(src.dimensions[dim]))
+
+        for name in ('y', 'x', 'crs'):
+            if name not in src.variables:
+                continue
+            src_var = src.variables[name]
+            dst_var = nc.createVariable(name, src_var.dtype, src_var.dimensions)
+            dst_var.setncatts({k: src_var.getncattr(k) for k in src_var.ncattrs()})
+            dst_var[...] = src_var[...]
+
+        src_time = src.variables['time']
+        nc_time = nc.createVariable('time', 'f8', ('time',))
+        nc_time.setncatts({k: src_time.getncattr(k) for k in src_time.ncattrs()})
+        nc_time.units = TIME_UNITS
+        nc_time.calendar = 'standard'
+
+        src_var = src.variables[var]
+        filters = src_var.filters() or {}
+        if profile is not None:
+            n_times = src_var.shape[0] if n_times is None else n_times
+            encoding = get_encoding(profile, (n_times,) + src_var.shape[1:])
+        else:
+            encoding = {'zlib': filters.get('zlib', True),
+                        'complevel': filters.get('complevel', 4),
+                        'shuffle': filters.get('shuffle', False)}
+            chunking = src_var.chunking()
+            if isinstance(chunking, list):
+                encoding['chunksizes'] = chunking
+        attrs = {k: src_var.getncattr(k) for k in src_var.ncattrs()}
+        fill_value = attrs.pop('_FillValue', None)
+        dtype = np.dtype(src_var.dtype) if dtype is None else np.dtype(dtype)
+        if dtype.kind == 'f':
+            attrs.pop('scale_factor', None)
+            attrs.pop('add_offset', None)
+            fill_value = np.float32(np.nan)
+        elif dtype != src_var.dtype:
+            fill_value = PACK_FILL_VALUES[dtype.name]
+        dst_var = nc.createVariable(var, dtype, src_var.dimensions,
+                                    fill_value=fill_value, **encoding)
+        dst_var.setncatts(attrs)
+    return nc
+
+
+def append_nc_files(nc, files, var, until=None, SLAB_DAYS=366):
+    """
+    Ajoute à un NetCDF ouvert les pas de temps de files postérieurs à son
+    dernier pas de temps (et antérieurs à until, en jours depuis 1970-01-01).
+
+    Les données sont copiées par tranches de SLAB_DAYS pas de temps, décodées
+    puis réencodées : les fichiers packés sont ainsi recopiés sans perte.
+
+    Returns:
+        int: Nombre de pas de temps ajoutés.
+    """
+    import netCDF4
+
+    nc_time = nc.variables['time']
+    nc_var = nc.variables[var]
+    appended = 0
+    for file in files:
+        with netCDF4.Dataset(file) as src:
+            times = get_nc_times(src)
+            last = get_nc_times(nc)[-1] if nc_time.shape[0] else -np.inf
+            keep = times > last
+            if until is not None:
+                keep &= times < until
+            index = np.flatnonzero(keep)
+            if len(index) == 0:
+                continue
+            # Les pas de temps retenus forment une plage contiguë (temps croissants)
+            for start in range(index[0], index[-1] + 1, SLAB_DAYS):
+                stop = min(start + SLAB_DAYS, index[-1] + 1)
+                n = nc_time.shape[0]
+                nc_time[n:n + stop - start] = times[start:stop]
+                nc_var[n:n + stop - start] = src.variables[var][start:stop]
+            appended += len(index)
+    return appended
+
+
+@instrument(outputs=lambda result, args, kwargs: args[1])
+def concatenate_nc_native(files, output_file, var, cutoff_date=None, profile=None):
+    """
+    Équivalent natif (netCDF4) de concatenate_nc_files, sans ncrcat.
+
+    Si cutoff_date est donné, les fichiers de base (tous sauf le dernier) sont
+    tronqués avant cette date puis le dernier fichier est ajouté en entier.
+    Les pas de temps déjà présents ne sont jamais dupliqués.
+    """
+    n_times = sum(get_nc_shape(f, var)[0] for f in files)
+    nc = create_nc_like(files[-1], output_file, var, profile,
+                        dtype=get_merged_dtype(files, var), n_times=n_times)
+    try:
+        if cutoff_date is None:
+            append_nc_files(nc, files, var)
+        else:
+            append_nc_files(nc, files[:-1], var, until=to_day_number(cutoff_date))
+            append_nc_files(nc, files[-1:], var)
+    finally:
+        nc.close()
+
+
+def validate_nc_file(file, var):
+    """
+    Vérifie la cohérence temporelle d'un NetCDF mergé avant publication :
+    pas de temps strictement croissants et variable alignée sur time.
+    Les trous dans la série journalière sont signalés sans bloquer.
+
+    Returns:
+        tuple[str, str]: Dates min et max au format YYYYMMDD.
+
+    Raises:
+        ValueError: Si le fichier est vide ou incohérent.
+    """
+    import netCDF4
+
+    with netCDF4.Dataset(file) as nc:
+        times = get_nc_times(nc)
+        n_var = nc.variables[var].shape[0]
+    if len(times) == 0:
+        raise ValueError(f"{Path(file).name} : aucun pas de temps")
+    if n_var != len(times):
+        raise ValueError(f"{Path(file).name} : {n_var} pas de temps pour {var}, {len(times)} pour time")
+    steps = np.diff(times)
+    if np.any(steps <= 0):
+        raise ValueError(f"{Path(file).name} : pas de temps non croissants ou dupliqués")
+    gaps = int(np.sum(steps > 1))
+    if gaps:
+        print(f"   ⚠️  {gaps} trou(s) dans la série journalière")
+
+    epoch = datetime(1970, 1, 1)
+    min_date = (epoch + timedelta(days=float(times[0]))).strftime('%Y%m%d')
+    max_date = (epoch + timedelta(days=float(times[-1]))).strftime('%Y%m%d')
+    return min_date, max_date
+
+
+def get_merge_failure_key(OUTPUT_DIR, var, file_type):
+    """
+    Chemin sous lequel l'échec du merge d'une variable est enregistré dans
+    l'état (le nom du fichier mergé dépend des dates, inconnues avant le merge).
+    Ex: OUTPUT_DIR/T_QUOT_SIM2_latest.nc
+    """
+    return Path(OUTPUT_DIR) / f"{var}_QUOT_SIM2_{file_type}.nc"
+
+
+def record_merge(state, OUTPUT_DIR, var, file_type, var_new, started_at,
+                 output_file=None, error=None):
+    """
+    Enregistre dans l'état un merge réussi (output_file, avec ses nouveaux
+    fichiers en entrée) ou son échec (error). Sans effet si state est None.
+    """
+    if state is None:
+        return
+    duration = time.time() - started_at
+    if error is not None:
+        state.record_failure(get_merge_failure_key(OUTPUT_DIR, var, file_type), 'merge',
+                             var_new, error, started_at, duration)
+    elif not state.is_fresh(output_file, var_new):
+        state.record(output_file, 'merge', var_new, started_at, duration)
+
+
+def get_output_file(OUTPUT_DIR, var, file_type):
+    """Fichier mergé existant le plus récent pour une variable et un type, ou None"""
+    files = sorted(OUTPUT_DIR.glob(f"{var}_QUOT_SIM2_{file_type}-*.nc"))
+    return files[-1] if files else None
+
+
+def read_nc_days(nc, var, times, SLAB_DAYS=366):
+    """
+    Valeurs décodées de var aux pas de temps times (jours depuis 1970-01-01,
+    tous présents dans nc), en float64 avec NaN pour les valeurs manquantes.
+    """
+    nc_times = get_nc_times(nc)
+    index = np.searchsorted(nc_times, times)
+    values = []
+    # Lecture par tranches de la plage couvrant les jours demandés (temps croissants)
+    for start in range(index[0], index[-1] + 1, SLAB_DAYS):
+        stop = min(start + SLAB_DAYS, index[-1] + 1)
+        values.append(np.ma.filled(nc.variables[var][start:stop].astype('float64'), np.nan))
+    return np.concatenate(values)[index - index[0]]
+
+
+def overlap_matches(output_file, new_files, var):
+    """
+    Indique si les pas de temps de new_files déjà présents dans output_file
+    y ont les mêmes valeurs : un jour révisé dans les nouvelles données
+    impose une reconstruction, l'ajout ne portant que sur les jours suivants.
+    """
+    import netCDF4
+
+    with netCDF4.Dataset(output_file) as nc:
+        times = get_nc_times(nc)
+        for file in new_files:
+            with netCDF4.Dataset(file) as src:
+                new_times = get_nc_times(src)
+                common = new_times[np.isin(new_times, times)]
+                if len(common) == 0:
+                    continue
+                if not np.array_equal(read_nc_days(nc, var, common),
+                                      read_nc_days(src, var, common), equal_nan=True):
+                    return False
+    return True
+
+
+def can_append(output_file, base_files, new_files, manifest=None):
+    """
+    Indique si output_file peut être complété par new_files : il est tel
+    que l'a laissé le dernier merge terminé (taille et mtime du manifeste,
+    ce qui écarte un ajout interrompu), ses fichiers de base n'ont pas
+    changé depuis son écriture, les nouvelles données prolongent la série
+    sans trou, dans un type de stockage compatible, et ne révisent aucun
+    des jours déjà présents (voir overlap_matches).
+    """
+    import netCDF4
+
+    if output_file is None or manifest is None:
+        return False
+    output = file_fingerprint(output_file)
+    if (output['name'], output['size'], output['mtime']) != (
+            manifest['output']['name'], manifest['output']['size'], manifest['output']['mtime']):
+        return False
+    mtime = output_file.stat().st_mtime
+    if any(Path(f).stat().st_mtime > mtime for f in base_files):
+        return False
+    var = output_file.name.split('_QUOT_SIM2')[0]
+    if get_merged_dtype([output_file] + list(new_files), var) != get_merged_dtype([output_file], var):
+        return False
+    with netCDF4.Dataset(output_file) as nc:
+        times = get_nc_times(nc)
+    if len(times) == 0:
+        return False
+    with netCDF4.Dataset(new_files[0]) as nc:
+        new_times = get_nc_times(nc)
+    if len(new_times) == 0 or new_times[0] > times[-1] + 1:
+        return False
+    return overlap_matches(output_file, new_files, var)
+
+
+@instrument(inputs=lambda args, kwargs: args[1],
+            outputs=lambda result, args, kwargs: args[0])
+def append_nc_in_place(output_file, new_files, var):
+    """
+    Ajoute à output_file, ouvert en mode append, les pas de temps de
+    new_files postérieurs à son dernier pas de temps. Les jours déjà
+    présents ne sont pas réécrits (can_append vérifie qu'ils sont inchangés).
+    """
+    import netCDF4
+    with netCDF4.Dataset(output_file, 'a') as nc:
+        return append_nc_files(nc, new_files, var)
         
 
-def merge_by_type(file_type, source_getter, base_getter, CONVERT_DIR, OUTPUT_DIR, converted_files):
+def get_manifest_path(OUTPUT_DIR, var, file_type):
+    """Manifeste du merge d'une variable et d'un type (un fichier par merge, sans conflit entre workers)"""
+    return OUTPUT_DIR / "merge_manifest" / f"{var}_QUOT_SIM2_{file_type}.json"
+
+
+def load_manifest(OUTPUT_DIR, var, file_type):
+    manifest_path = get_manifest_path(OUTPUT_DIR, var, file_type)
+    if manifest_path.exists():
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    return None
+
+
+def get_merge_base(OUTPUT_DIR, var, file_type):
+    """
+    Nom du fichier mergé de base (historical pour previous, previous pour
+    latest) du dernier merge, ou "" sans manifeste ou sans base. Un
+    changement de base signale un merge reconstruit, et non complété par
+    ajout de nouveaux jours. Seule la base est retenue : le nom des nouveaux
+    fichiers convertis (ex: latest, renouvelé chaque jour) n'y entre pas.
+    Ex: 'T_QUOT_SIM2_previous-19580801-20260930.nc'
+    """
+    types = [merge_type for merge_type, _, _ in MERGE_TYPES]
+    if types.index(file_type) == 0:
+        return ""
+    base_type = types[types.index(file_type) - 1]
+    manifest = load_manifest(Path(OUTPUT_DIR), var, file_type)
+    for entry in (manifest or {}).get('inputs', []):
+        if f"_QUOT_SIM2_{base_type}-" in entry['name']:
+            return entry['name']
+    return ""
+
+
+def get_merge_build(OUTPUT_DIR, var, file_type):
+    """
+    Identifiant de la dernière reconstruction complète d'un fichier mergé
+    (voir save_manifest), ou "" sans manifeste. Ex: '2026-10-11T06:12:03.512345'
+    """
+    manifest = load_manifest(Path(OUTPUT_DIR), var, file_type)
+    return (manifest or {}).get('build', "")
+
+
+def fingerprint_files(files, manifest=None):
+    """
+    Empreintes (nom, taille, mtime, checksum) d'une liste de fichiers.
+    Le checksum d'un fichier dont la taille et la mtime n'ont pas changé
+    depuis le manifeste est repris tel quel, sans relire le fichier.
+    """
+    known = {entry['name']: entry for entry in (manifest or {}).get('inputs', [])}
+    fingerprints = []
+    for file in files:
+        fingerprint = file_fingerprint(file)
+        previous = known.get(fingerprint['name'])
+        if (previous and previous['size'] == fingerprint['size']
+                and previous['mtime'] == fingerprint['mtime']):
+            fingerprint['checksum'] = previous['checksum']
+        else:
+            fingerprint['checksum'] = file_checksum(file)
+        fingerprints.append(fingerprint)
+    return fingerprints
+
+
+def is_up_to_date(manifest, input_files, OUTPUT_DIR, options=None):
+    """
+    Indique si le merge décrit par le manifeste est toujours valide : le
+    fichier mergé est intact, il a été produit avec les mêmes options
+    (profil d'encodage, moteur) et les entrées sont les mêmes. Une entrée
+    dont seule la mtime a changé est comparée sur son checksum.
+    """
+    if manifest is None:
+        return False
+    if manifest.get('options') != options:
+        return False
+    output_file = OUTPUT_DIR / manifest['output']['name']
+    if not output_file.exists():
+        return False
+    output = file_fingerprint(output_file)
+    if (output['size'], output['mtime']) != (manifest['output']['size'], manifest['output']['mtime']):
+        return False
+
+    if [Path(f).name for f in input_files] != [entry['name'] for entry in manifest['inputs']]:
+        return False
+    for file, entry in zip(input_files, manifest['inputs']):
+        fingerprint = file_fingerprint(file)
+        if fingerprint['size'] != entry['size']:
+            return False
+        if fingerprint['mtime'] != entry['mtime'] and file_checksum(file) != entry['checksum']:
+            return False
+    return True
+
+
+def write_manifest(OUTPUT_DIR, var, file_type, manifest):
+    """Écrit un manifeste de merge de façon atomique"""
+    manifest_path = get_manifest_path(OUTPUT_DIR, var, file_type)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def save_manifest(OUTPUT_DIR, var, file_type, input_files, output_file, manifest=None,
+                  options=None, appended=False):
+    """
+    Enregistre un merge terminé. 'build' identifie la dernière reconstruction
+    complète du fichier mergé : il est conservé quand de nouveaux jours sont
+    seulement ajoutés, et change à chaque reconstruction (nouvelle base ou
+    jours révisés). Les agrégats et stores Zarr le comparent pour savoir
+    s'ils peuvent être complétés (voir get_merge_build).
+    """
+    merged_at = datetime.now().isoformat()
+    build = (manifest or {}).get('build') if appended else None
+    write_manifest(OUTPUT_DIR, var, file_type, {
+        'output': file_fingerprint(output_file),
+        'inputs': fingerprint_files(input_files, manifest),
+        'options': options,
+        'build': build or merged_at,
+        'merged_at': merged_at
+    })
+
+
+def refresh_manifest(OUTPUT_DIR, var, file_type, input_files, manifest):
+    """
+    Met à jour la mtime des entrées d'un manifeste valide dont seule la mtime
+    a changé (checksum identique, voir is_up_to_date) : leur checksum n'est
+    ainsi pas recalculé à chaque run.
+    """
+    changed = False
+    for file, entry in zip(input_files, manifest['inputs']):
+        mtime = file_fingerprint(file)['mtime']
+        if mtime != entry['mtime']:
+            entry['mtime'] = mtime
+            changed = True
+    if changed:
+        write_manifest(OUTPUT_DIR, var, file_type, manifest)
+
+
+def merge_variable(file_type, var, var_new, base_getter, OUTPUT_DIR,
+                   profile=None, engine='native', force=False):
+    """
+    Fusionne les fichiers d'une variable pour un type donné et renomme le
+    résultat avec sa plage temporelle effective.
+
+    Les fichiers de base sont relus dans OUTPUT_DIR au moment de l'appel :
+    le merge latest d'une variable voit ainsi le previous qui vient d'être
+    produit pour cette même variable.
+
+    Le merge est ignoré si ses entrées et ses options (profile, engine) n'ont
+    pas changé depuis le dernier merge enregistré dans OUTPUT_DIR/merge_manifest/
+    (sauf si force=True).
+
+    Returns:
+        Path: Fichier NetCDF mergé.
+              Ex: OUTPUT_DIR/T_QUOT_SIM2_latest-19580801-20260215.nc
+    """
+    base_files = base_getter(OUTPUT_DIR) if base_getter else []
+    var_base = [f for f, v in zip(base_files, get_variables(base_files)) if v == var]
+
+    cutoff_date = None
+    if file_type == 'latest' and var_base:
+        cutoff_raw = var_new[0].stem.split('latest-')[1].split('-')[0]
+        cutoff_date = f"{cutoff_raw[:4]}-{cutoff_raw[4:6]}-{cutoff_raw[6:8]}"
+        print(f"   ✂️  Troncature previous avant {cutoff_date}")
+
+    var_files = var_base + var_new
+
+    options = {'profile': profile, 'engine': engine}
+    manifest = load_manifest(OUTPUT_DIR, var, file_type)
+    if not force and is_up_to_date(manifest, var_files, OUTPUT_DIR, options):
+        refresh_manifest(OUTPUT_DIR, var, file_type, var_files, manifest)
+        output_file = OUTPUT_DIR / manifest['output']['name']
+        print(f"\n⏭️  {var} {file_type} : entrées inchangées, merge ignoré")
+        print(f"   → {output_file.name}")
+        return output_file
+
+    if file_type == "historical":
+        print(f"\n🧩 Merge {len(var_base)} historical NetCDF")
+    else:
+        print(f"\n🧩 Merge {len(var_base)} previous NetCDF and {len(var_new)} {file_type} NetCDF")
+    print(f"   → variable: {var}")
+    
+    tmp_file = OUTPUT_DIR / f"{var}_QUOT_SIM2_{file_type}_tmp.nc"
+    existing_file = get_output_file(OUTPUT_DIR, var, file_type)
+    min_date = None
+    appended = False
+
+    if engine == 'native' and file_type != 'historical':
+        # Ajout en place : seuls les nouveaux jours sont écrits. Si l'ajout
+        # ou la validation échoue, le fichier (dont la longueur d'origine
+        # n'est plus garantie) est supprimé puis reconstruit entièrement.
+        n_times = None
+        try:
+            if can_append(existing_file, var_base, var_new, manifest):
+                n_times = get_nc_shape(existing_file, var)[0]
+                added = append_nc_in_place(existing_file, var_new, var)
+                min_date, max_date = validate_nc_file(existing_file, var)
+                print(f"   ➕ {added} pas de temps ajouté(s) à {existing_file.name}")
+                tmp_file = existing_file
+                appended = True
+        except Exception as e:
+            print(f"   ⚠️  Ajout impossible ({e}), reconstruction complète")
+            min_date = None
+            if n_times is not None:
+                print(f"   🗑️  {existing_file.name} ({n_times} pas de temps avant l'ajout) supprimé")
+                existing_file.unlink()
+
+    if min_date is None:
+        if engine == 'nco' and len(set(get_nc_dtypes(var_files, var))) > 1:
+            # Packing int16/int32/float32 selon les fichiers : ncrcat ne sait
+            # pas les concaténer, le merge natif les réencode au type commun
+            print(f"   ⚠️  Types de stockage différents, merge natif au lieu de ncrcat")
+            concatenate_nc_native(var_files, tmp_file, var,
+                                  cutoff_date=cutoff_date, profile=profile)
+        elif engine == 'native':
+            concatenate_nc_native(var_files, tmp_file, var,
+                                  cutoff_date=cutoff_date, profile=profile)
+        else:
+            concatenate_nc_files(var_files, tmp_file, cutoff_date=cutoff_date,
+                                 profile=profile)
+        min_date, max_date = validate_nc_file(tmp_file, var)
+
+    output_file = OUTPUT_DIR / f"{var}_QUOT_SIM2_{file_type}-{min_date}-{max_date}.nc"
+    os.replace(tmp_file, output_file)
+    save_manifest(OUTPUT_DIR, var, file_type, var_files, output_file, manifest, options,
+                  appended)
+    print(f"   💾 {output_file.name}")
+    return output_file
+
+
+def merge_by_type(file_type, source_getter, base_getter, CONVERT_DIR, OUTPUT_DIR, converted_files,
+                  profile=None, engine='native', force=False, state=None):
     """
     Fusionne les fichiers NetCDF d'un type donné (historical, previous, latest).
 
@@ -74,15 +649,29 @@ def merge_by_type(file_type, source_getter, base_getter, CONVERT_DIR, OUTPUT_DIR
         CONVERT_DIR (Path):           Dossier contenant tous les fichiers NetCDF convertis.
         OUTPUT_DIR (Path):            Dossier de sortie pour les fichiers mergés.
         converted_files (list[Path]): Fichiers NetCDF nouvellement convertis à intégrer.
+        profile (str, optional):      Profil d'encodage (chunking + compression) du
+                                      fichier mergé. Si None, layout des fichiers d'entrée
+                                      (natif) ou produit par ncrcat (nco).
+        engine (str):                 Moteur de concaténation : 'native' (netCDF4, ajout
+                                      des nouveaux pas de temps) ou 'nco' (ncrcat).
+        force (bool):                 Refait les merges même si leurs entrées sont inchangées.
+        state (StateStore, optional): État du pipeline, où chaque merge est enregistré
+                                      (fichier mergé, ou échec).
 
     Returns:
         list[Path] | None: Fichiers NetCDF mergés, ou None si aucun fichier du type trouvé.
                            Ex: [OUTPUT_DIR/T_QUOT_SIM2_historical-19580101-19991231.nc, ...]
 
     Notes:
-        - Utilise ncrcat (NetCDF Operators) pour la concaténation temporelle.
+        - Moteur 'native' : si le fichier mergé existant est toujours valide (fichiers
+          de base inchangés, pas de trou, jours communs non révisés), seuls les
+          nouveaux pas de temps y sont ajoutés en place, sinon il est reconstruit
+          entièrement. Un ajout qui échoue entraîne la suppression du fichier et
+          sa reconstruction.
+        - Moteur 'nco' : utilise ncrcat (NetCDF Operators) pour la concaténation temporelle.
         - Le fichier de sortie est nommé avec les dates min/max réelles de la série.
-        - Passe par un fichier temporaire _tmp.nc renommé après vérification des dates.
+        - Une reconstruction passe par un fichier temporaire _tmp.nc renommé après
+          validation des dates.
     """
     
     converted_type_files = source_getter(converted_files)
@@ -97,7 +686,6 @@ def merge_by_type(file_type, source_getter, base_getter, CONVERT_DIR, OUTPUT_DIR
     variables_to_update = get_variables(files_to_update)
 
     base_files = base_getter(OUTPUT_DIR) if base_getter else []
-    base_variables = get_variables(base_files)
 
     unique_vars = get_set_variables(files_to_update)
     print(f"   → {len(unique_vars)} variable(s): {', '.join(unique_vars)}")
@@ -106,66 +694,121 @@ def merge_by_type(file_type, source_getter, base_getter, CONVERT_DIR, OUTPUT_DIR
     merged_files = []
     for i, var in enumerate(unique_vars, 1):
         print(f"\n[{i}/{len(unique_vars)}]")
-    
-        var_base = [f for f, v in zip(base_files, base_variables) if v == var]
         var_new = [f for f, v in zip(files_to_update, variables_to_update) if v == var]
-
-        cutoff_date = None
-        if file_type == 'latest' and var_base:
-            cutoff_raw = var_new[0].stem.split('latest-')[1].split('-')[0]
-            cutoff_date = f"{cutoff_raw[:4]}-{cutoff_raw[4:6]}-{cutoff_raw[6:8]}"
-            print(f"   ✂️  Troncature previous avant {cutoff_date}")
-
-        var_files = var_base + var_new
-
-        if file_type == "historical":
-            print(f"\n🧩 Merge {len(var_base)} historical NetCDF")
-        else:
-            print(f"\n🧩 Merge {len(var_base)} previous NetCDF and {len(var_new)} {file_type} NetCDF")
-        print(f"   → variable: {var}")
-        
-        tmp_file = OUTPUT_DIR / f"{var}_QUOT_SIM2_{file_type}_tmp.nc"
-        concatenate_nc_files(var_files, tmp_file, cutoff_date=cutoff_date)
-
-        ds = xr.open_dataset(tmp_file)
-        min_date = ds.time.min().dt.strftime('%Y%m%d').values
-        max_date = ds.time.max().dt.strftime('%Y%m%d').values
-        ds.close()
-
-        output_file = OUTPUT_DIR / f"{var}_QUOT_SIM2_{file_type}-{min_date}-{max_date}.nc"
-        tmp_file.rename(output_file)
+        started_at = time.time()
+        try:
+            output_file = merge_variable(file_type, var, var_new, base_getter,
+                                         OUTPUT_DIR, profile, engine, force)
+        except Exception as e:
+            record_merge(state, OUTPUT_DIR, var, file_type, var_new, started_at, error=e)
+            raise
+        record_merge(state, OUTPUT_DIR, var, file_type, var_new, started_at, output_file)
         merged_files.append(output_file)
-        print(f"   💾 {output_file.name}")
         
     return merged_files
 
 
-def merge_historical(CONVERT_DIR, OUTPUT_DIR, converted_files):
+def merge_historical(CONVERT_DIR, OUTPUT_DIR, converted_files, profile=None,
+                     engine='native', force=False, state=None):
     print(f"\nMERGE HISTORICAL")
     merged_files = merge_by_type('historical', get_historical_files,
                                  None,
                                  CONVERT_DIR, OUTPUT_DIR,
-                                 converted_files)
+                                 converted_files, profile, engine, force, state)
     return merged_files
 
-def merge_previous(CONVERT_DIR, OUTPUT_DIR, converted_files):
+def merge_previous(CONVERT_DIR, OUTPUT_DIR, converted_files, profile=None,
+                   engine='native', force=False, state=None):
     print(f"\nMERGE PREVIOUS")
     merged_files = merge_by_type('previous', get_previous_files,
-                                 lambda d: list(d.glob("*historical*.nc")),
+                                 get_historical_outputs,
                                  CONVERT_DIR, OUTPUT_DIR,
-                                 converted_files)
+                                 converted_files, profile, engine, force, state)
     return merged_files
     
-def merge_latest(CONVERT_DIR, OUTPUT_DIR, converted_files):
+def merge_latest(CONVERT_DIR, OUTPUT_DIR, converted_files, profile=None,
+                 engine='native', force=False, state=None):
     print(f"\nMERGE LATEST")
     merged_files = merge_by_type('latest', get_latest_files,
-                                 lambda d: list(d.glob("*previous*.nc")),
+                                 get_previous_outputs,
                                  CONVERT_DIR, OUTPUT_DIR,
-                                 converted_files)
+                                 converted_files, profile, engine, force, state)
     return merged_files
 
+
+def plan_merges(CONVERT_DIR, converted_files):
+    """
+    Chaîne de merges à effectuer pour chaque variable, dans l'ordre
+    historical → previous → latest.
+
+    Returns:
+        dict: {variable: [(file_type, base_getter, var_new), ...]}
+    """
+    plans = {}
+    for file_type, source_getter, base_getter in MERGE_TYPES:
+        converted_type_files = source_getter(converted_files)
+        if len(converted_type_files) == 0:
+            continue
+        all_files = source_getter(list(CONVERT_DIR.glob("*.nc")))
+        all_variables = get_variables(all_files)
+        for var in get_set_variables(converted_type_files):
+            var_new = [f for f, v in zip(all_files, all_variables) if v == var]
+            plans.setdefault(var, []).append((file_type, base_getter, var_new))
+    return plans
+
+
+def merge_parallel(CONVERT_DIR, OUTPUT_DIR, converted_files, profile=None,
+                   engine='native', workers=4, force=False, state=None):
+    """
+    Fusionne les variables en parallèle (processus), en respectant pour
+    chacune la dépendance historical → previous → latest : le merge suivant
+    d'une variable est lancé dès que le précédent est terminé, sans attendre
+    les autres variables.
+
+    Returns:
+        list[Path]: Fichiers mergés, ordonnés par type puis par variable.
+    """
+    plans = plan_merges(CONVERT_DIR, converted_files)
+    total = sum(len(steps) for steps in plans.values())
+    print(f"\nMERGE PARALLÈLE ({workers} worker(s))")
+    print(f"   → {len(plans)} variable(s), {total} merge(s)")
+
+    results = {file_type: {} for file_type, _, _ in MERGE_TYPES}
+    done_count = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        def submit(var):
+            file_type, base_getter, var_new = plans[var].pop(0)
+            future = executor.submit(merge_variable, file_type, var, var_new,
+                                     base_getter, OUTPUT_DIR, profile, engine, force)
+            return future, (var, file_type, var_new, time.time())
+
+        running = dict(submit(var) for var in sorted(plans))
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                var, file_type, var_new, started_at = running.pop(future)
+                try:
+                    output_file = future.result()
+                except Exception as e:
+                    record_merge(state, OUTPUT_DIR, var, file_type, var_new,
+                                 started_at, error=e)
+                    raise
+                record_merge(state, OUTPUT_DIR, var, file_type, var_new,
+                             started_at, output_file)
+                results[file_type][var] = output_file
+                done_count += 1
+                print(f"\n[{done_count}/{total}] ✅ {var} {file_type}")
+                if plans[var]:
+                    new_future, key = submit(var)
+                    running[new_future] = key
+
+    return [results[file_type][var]
+            for file_type, _, _ in MERGE_TYPES
+            for var in sorted(results[file_type])]
+
     
-def merge(CONVERT_DIR, OUTPUT_DIR, converted_files=None):
+def merge(CONVERT_DIR, OUTPUT_DIR, converted_files=None, profile=None,
+          engine='native', workers=1, force=False, state=None):
     """
     Orchestre la fusion des fichiers NetCDF par type (historical, previous, latest).
 
@@ -177,7 +820,21 @@ def merge(CONVERT_DIR, OUTPUT_DIR, converted_files=None):
         OUTPUT_DIR (str | Path):           Dossier de sortie pour les fichiers mergés.
                                            Créé automatiquement s'il n'existe pas.
         converted_files (list[Path], optional): Fichiers NetCDF à intégrer.
-                                                Si None, traite tous les *.nc de CONVERT_DIR.
+                                                Si None, traite tous les NetCDF convertis
+                                                (état, ou *.nc de CONVERT_DIR).
+        profile (str, optional):           Profil d'encodage des fichiers mergés
+                                           ('map', 'timeseries', 'balanced').
+        engine (str):                      Moteur de concaténation : 'native' (netCDF4,
+                                           défaut) ou 'nco' (ncrcat).
+        workers (int):                     Nombre de merges simultanés (processus), chaque
+                                           variable enchaînant ses merges dès que possible.
+                                           Défaut: 1 (séquentiel, type par type).
+        force (bool):                      Refait tous les merges, y compris ceux dont les
+                                           entrées n'ont pas changé depuis le dernier run.
+        state (StateStore, optional):      État du pipeline, où les fichiers mergés (ou les
+                                           échecs) sont enregistrés (les manifestes de merge
+                                           restent la référence pour savoir si un merge est
+                                           à refaire).
 
     Returns:
         list[Path]: Liste de tous les fichiers NetCDF mergés (historical + previous + latest).
@@ -190,16 +847,23 @@ def merge(CONVERT_DIR, OUTPUT_DIR, converted_files=None):
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
     if converted_files is None:
-        converted_files = list(Path(CONVERT_DIR).glob("*.nc"))
-
-    merged_historical_files = merge_historical(CONVERT_DIR, OUTPUT_DIR,
-                                               converted_files)
-    merged_previous_files = merge_previous(CONVERT_DIR, OUTPUT_DIR,
-                                           converted_files)
-    merged_latest_files = merge_latest(CONVERT_DIR, OUTPUT_DIR,
-                                       converted_files)
-    merged_files = merged_historical_files + merged_previous_files + merged_latest_files 
-    
+        converted_files = get_stage_files(state, 'convert', CONVERT_DIR, "*.nc")
+
+    if workers > 1:
+        merged_files = merge_parallel(CONVERT_DIR, OUTPUT_DIR, converted_files,
+                                      profile, engine, workers, force, state)
+    else:
+        merged_historical_files = merge_historical(CONVERT_DIR, OUTPUT_DIR,
+                                                   converted_files, profile, engine, force,
+                                                   state)
+        merged_previous_files = merge_previous(CONVERT_DIR, OUTPUT_DIR,
+                                               converted_files, profile, engine, force,
+                                               state)
+        merged_latest_files = merge_latest(CONVERT_DIR, OUTPUT_DIR,
+                                           converted_files, profile, engine, force,
+                                           state)
+        merged_files = merged_historical_files + merged_previous_files + merged_latest_files 
+
     print(f"\nRÉSUMÉ")
     print(f"   - {len(merged_files)} fichier(s) mergés")
     print(f"   - 📁 Dossier: {os.path.abspath(OUTPUT_DIR)}")
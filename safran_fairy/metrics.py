@@ -0,0 +1,387 @@
+import os
+import json
+import time
+import resource
+import tempfile
+import threading
+import functools
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+
+
+# Fichier (JSON lines) où chaque appel instrumenté ajoute ses mesures. Le
+# chemin passe par l'environnement : les processus des pools en héritent.
+METRICS_SPOOL_ENV = 'SAFRAN_FAIRY_METRICS_SPOOL'
+
+# Appels les plus lents gardés par fonction dans le rapport
+SLOWEST_CALLS = 5
+
+# Préfixe des métriques Prometheus
+PROMETHEUS_PREFIX = 'safran_fairy'
+
+
+def get_size(obj) -> int:
+    """
+    Taille en octets d'un fichier, d'une liste de fichiers, ou nombre
+    d'octets déjà calculé. Les chemins inexistants comptent pour 0.
+    """
+    if obj is None or isinstance(obj, bool):
+        return 0
+    if isinstance(obj, int):
+        return obj
+    if isinstance(obj, (str, os.PathLike)):
+        path = Path(obj)
+        return path.stat().st_size if path.is_file() else 0
+    if isinstance(obj, (list, tuple, set)):
+        return sum(get_size(item) for item in obj)
+    return 0
+
+
+def get_name(obj):
+    """Nom du premier fichier d'un argument (libellé d'un appel dans le rapport)"""
+    if isinstance(obj, (list, tuple)) and obj:
+        obj = obj[0]
+    if isinstance(obj, (str, os.PathLike)):
+        return Path(obj).name
+    return None
+
+
+def reset_peak_rss() -> bool:
+    """Remet à zéro le pic de mémoire résidente (VmHWM) du processus (Linux ≥ 4.0)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss() -> int:
+    """
+    Pic de mémoire résidente du processus en octets, depuis le dernier
+    reset_peak_rss() (ou depuis son démarrage si le reset est impossible).
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_children_cpu_time() -> float:
+    """Temps CPU des processus enfants terminés (workers des pools, ncrcat)"""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def get_cpu_time() -> float:
+    """
+    Temps CPU de l'appelant : du thread s'il s'exécute dans un pool de
+    threads (uploads), sinon du processus et de ses enfants terminés.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return time.thread_time()
+    return time.process_time() + get_children_cpu_time()
+
+
+def append_record(spool, record: dict):
+    """Ajoute une mesure au spool, en une seule écriture (O_APPEND)"""
+    fd = os.open(spool, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(record) + '\n').encode())
+    finally:
+        os.close(fd)
+
+
+def read_records(spool, offset: int = 0) -> list:
+    """Mesures ajoutées au spool depuis offset"""
+    if not os.path.exists(spool):
+        return []
+    with open(spool, 'rb') as f:
+        f.seek(offset)
+        return [json.loads(line) for line in f.read().decode().splitlines() if line.strip()]
+
+
+def first_argument(args, kwargs):
+    return args[0] if args else None
+
+
+def returned_value(result, args, kwargs):
+    return result
+
+
+def instrument(inputs=first_argument, outputs=returned_value):
+    """
+    Décorateur mesurant chaque appel d'une fonction par fichier : durée,
+    temps CPU, pic de mémoire et octets lus et produits.
+
+    Sans run instrumenté (RunMetrics), la fonction est appelée directement.
+    Sinon chaque appel ajoute une ligne au spool du run, y compris depuis
+    un worker d'un pool de processus.
+
+    Args:
+        inputs (callable):   (args, kwargs) → fichier(s) lu(s) ou nombre d'octets.
+                             Défaut: le premier argument.
+        outputs (callable):  (résultat, args, kwargs) → fichier(s) produit(s) ou
+                             nombre d'octets. Défaut: la valeur de retour.
+
+    Notes:
+        Le pic de mémoire est celui du processus pendant l'appel ; dans un
+        pool de threads (uploads) il inclut les autres appels en cours.
+        La mémoire des sous-processus (ncrcat) n'est pas comptée.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            spool = os.environ.get(METRICS_SPOOL_ENV)
+            if not spool:
+                return func(*args, **kwargs)
+
+            try:
+                input_files = inputs(args, kwargs)
+                bytes_in = get_size(input_files)
+            except Exception:
+                input_files, bytes_in = None, 0
+            if threading.current_thread() is threading.main_thread():
+                reset_peak_rss()
+            started_at = time.time()
+            wall_start = time.perf_counter()
+            cpu_start = get_cpu_time()
+
+            result, status = None, 'failed'
+            try:
+                result = func(*args, **kwargs)
+                status = 'done'
+                return result
+            finally:
+                try:
+                    output_files = outputs(result, args, kwargs) if status == 'done' else None
+                    bytes_out = get_size(output_files)
+                except Exception:
+                    output_files, bytes_out = None, 0
+                append_record(spool, {
+                    'function': func.__name__,
+                    'file': get_name(input_files) or get_name(output_files),
+                    'status': status,
+                    'started_at': started_at,
+                    'wall': time.perf_counter() - wall_start,
+                    'cpu': get_cpu_time() - cpu_start,
+                    'peak_rss': get_peak_rss(),
+                    'bytes_in': bytes_in,
+                    'bytes_out': bytes_out,
+                    'pid': os.getpid(),
+                })
+        return wrapper
+    return decorator
+
+
+def summarize_calls(calls: list) -> dict:
+    """
+    Agrège les mesures par fonction : nombre d'appels, durée et CPU cumulés,
+    pic de mémoire, octets lus et produits, débits, appels les plus lents.
+    """
+    functions = {}
+    for call in calls:
+        entry = functions.setdefault(call['function'], {
+            'calls': 0, 'failed': 0, 'wall': 0.0, 'cpu': 0.0, 'peak_rss': 0,
+            'bytes_in': 0, 'bytes_out': 0, 'slowest': []})
+        entry['calls'] += 1
+        entry['failed'] += call['status'] != 'done'
+        entry['wall'] += call['wall']
+        entry['cpu'] += call['cpu']
+        entry['peak_rss'] = max(entry['peak_rss'], call['peak_rss'])
+        entry['bytes_in'] += call['bytes_in']
+        entry['bytes_out'] += call['bytes_out']
+        entry['slowest'].append(call)
+
+    for entry in functions.values():
+        entry['mb_per_s_in'] = entry['bytes_in'] / 1024**2 / entry['wall'] if entry['wall'] else None
+        entry['mb_per_s_out'] = entry['bytes_out'] / 1024**2 / entry['wall'] if entry['wall'] else None
+        entry['slowest'] = [{'file': call['file'], 'wall': round(call['wall'], 3)}
+                            for call in sorted(entry['slowest'], key=lambda call: -call['wall'])[:SLOWEST_CALLS]]
+    return functions
+
+
+def format_bytes(size: int) -> str:
+    """Ex: 1536 → '1.5 Ko', 3*1024**3 → '3.0 Go'"""
+    for unit in ['o', 'Ko', 'Mo', 'Go']:
+        if size < 1024 or unit == 'Go':
+            return f"{size:.0f} {unit}" if unit == 'o' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class RunMetrics:
+    """
+    Mesures d'un run du pipeline : durée, temps CPU, pic de mémoire et
+    volumes lus et produits de chaque étape de main.py, détaillés par
+    fonction instrumentée (voir instrument).
+
+    À la fin du run, write_report écrit un rapport JSON et write_prometheus
+    un fichier texte pour le collecteur textfile du node exporter.
+
+    Args:
+        options (dict, optional): Options du run, recopiées dans le rapport.
+                                  Ex: vars(args)
+
+    Notes:
+        Le temps CPU d'une étape inclut celui des workers de ses pools de
+        processus (comptés à leur arrêt, en fin d'étape). Son pic de mémoire
+        est le maximum du processus principal et des appels instrumentés.
+    """
+
+    def __init__(self, options: dict = None):
+        self.options = options or {}
+        self.started_at = time.time()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time() + get_children_cpu_time()
+        self.stages = []
+
+        fd, self.spool = tempfile.mkstemp(prefix='safran-fairy-metrics-', suffix='.jsonl')
+        os.close(fd)
+        os.environ[METRICS_SPOOL_ENV] = self.spool
+
+    def close(self):
+        """Supprime le spool : les appels suivants ne sont plus mesurés"""
+        if os.environ.get(METRICS_SPOOL_ENV) == self.spool:
+            del os.environ[METRICS_SPOOL_ENV]
+        if os.path.exists(self.spool):
+            os.remove(self.spool)
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Mesure une étape. Ex:
+            with metrics.stage('download'):
+                downloaded_files = download(...)
+        """
+        offset = os.path.getsize(self.spool)
+        reset_peak_rss()
+        started_at = time.time()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time() + get_children_cpu_time()
+
+        status = 'failed'
+        try:
+            yield
+            status = 'done'
+        finally:
+            calls = read_records(self.spool, offset)
+            functions = summarize_calls(calls)
+            stage = {
+                'stage': name,
+                'status': status,
+                'started_at': datetime.fromtimestamp(started_at).isoformat(),
+                'wall': time.perf_counter() - wall_start,
+                'cpu': time.process_time() + get_children_cpu_time() - cpu_start,
+                'peak_rss': max([get_peak_rss()] + [call['peak_rss'] for call in calls]),
+                'bytes_in': sum(entry['bytes_in'] for entry in functions.values()),
+                'bytes_out': sum(entry['bytes_out'] for entry in functions.values()),
+                'functions': functions,
+            }
+            self.stages.append(stage)
+            print(f"\n⏱️  {name} : {stage['wall']:.1f}s, CPU {stage['cpu']:.1f}s, "
+                  f"pic mémoire {format_bytes(stage['peak_rss'])}, "
+                  f"lu {format_bytes(stage['bytes_in'])}, produit {format_bytes(stage['bytes_out'])}")
+
+    def get_report(self, status: str) -> dict:
+        """Rapport du run : totaux et mesures de chaque étape"""
+        return {
+            'status': status,
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat(),
+            'finished_at': datetime.now().isoformat(),
+            'wall': time.perf_counter() - self.wall_start,
+            'cpu': time.process_time() + get_children_cpu_time() - self.cpu_start,
+            'peak_rss': max([stage['peak_rss'] for stage in self.stages], default=get_peak_rss()),
+            'bytes_in': sum(stage['bytes_in'] for stage in self.stages),
+            'bytes_out': sum(stage['bytes_out'] for stage in self.stages),
+            'options': self.options,
+            'stages': self.stages,
+        }
+
+    def write_report(self, REPORT_FILE, status: str):
+        """
+        Écrit le rapport JSON du run (remplacé à chaque run).
+
+        Args:
+            REPORT_FILE (str):  Fichier de sortie. Ex: /var/lib/safran-fairy/run_report.json
+            status (str):       'success' ou 'failed'.
+
+        Returns:
+            dict: Rapport écrit (voir get_report).
+        """
+        report = self.get_report(status)
+        try:
+            write_atomic(REPORT_FILE, json.dumps(report, indent=2, default=str))
+            print(f"\n📊 Rapport du run : {REPORT_FILE}")
+        except OSError as e:
+            print(f"\n⚠️  Rapport du run non écrit ({REPORT_FILE}) : {e}")
+        return report
+
+    def write_prometheus(self, PROMETHEUS_FILE, status: str):
+        """
+        Écrit les métriques du run au format texte Prometheus, pour le
+        collecteur textfile du node exporter (fichier remplacé atomiquement).
+
+        Args:
+            PROMETHEUS_FILE (str): Fichier .prom du dossier du collecteur.
+                                   Ex: /var/lib/node_exporter/textfile_collector/safran_fairy.prom
+            status (str):          'success' ou 'failed'.
+        """
+        report = self.get_report(status)
+        metrics = {}
+
+        def add(name, help_text, value, **labels):
+            if value is None:
+                return
+            samples = metrics.setdefault(name, (help_text, []))[1]
+            label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+            samples.append(f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}} {value}"
+                           if labels else f"{PROMETHEUS_PREFIX}_{name} {value}")
+
+        add('run_success', "1 si le dernier run a réussi, 0 sinon", int(status == 'success'))
+        add('run_timestamp_seconds', "Fin du dernier run (timestamp Unix)", round(time.time()))
+        add('run_duration_seconds', "Durée du dernier run", round(report['wall'], 3))
+        add('run_cpu_seconds', "Temps CPU du dernier run (workers inclus)", round(report['cpu'], 3))
+        add('run_peak_rss_bytes', "Pic de mémoire résidente du dernier run", report['peak_rss'])
+        for stage in report['stages']:
+            labels = {'stage': stage['stage']}
+            add('stage_success', "1 si l'étape a réussi, 0 sinon", int(stage['status'] == 'done'), **labels)
+            add('stage_duration_seconds', "Durée de l'étape", round(stage['wall'], 3), **labels)
+            add('stage_cpu_seconds', "Temps CPU de l'étape (workers inclus)", round(stage['cpu'], 3), **labels)
+            add('stage_peak_rss_bytes', "Pic de mémoire résidente de l'étape", stage['peak_rss'], **labels)
+            add('stage_input_bytes', "Octets lus par les fonctions de l'étape", stage['bytes_in'], **labels)
+            add('stage_output_bytes', "Octets produits par les fonctions de l'étape", stage['bytes_out'], **labels)
+            for function, entry in stage['functions'].items():
+                labels = {'stage': stage['stage'], 'function': function}
+                add('function_calls', "Appels d'une fonction par fichier", entry['calls'], **labels)
+                add('function_failures', "Appels en échec d'une fonction par fichier", entry['failed'], **labels)
+                add('function_duration_seconds', "Durée cumulée des appels", round(entry['wall'], 3), **labels)
+                add('function_cpu_seconds', "Temps CPU cumulé des appels", round(entry['cpu'], 3), **labels)
+                add('function_peak_rss_bytes', "Pic de mémoire d'un appel", entry['peak_rss'], **labels)
+                add('function_input_bytes', "Octets lus par les appels", entry['bytes_in'], **labels)
+                add('function_output_bytes', "Octets produits par les appels", entry['bytes_out'], **labels)
+
+        lines = []
+        for name, (help_text, samples) in metrics.items():
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge")
+            lines.extend(samples)
+        try:
+            write_atomic(PROMETHEUS_FILE, '\n'.join(lines) + '\n')
+            print(f"📈 Métriques Prometheus : {PROMETHEUS_FILE}")
+        except OSError as e:
+            print(f"⚠️  Métriques Prometheus non écrites ({PROMETHEUS_FILE}) : {e}")
+
+
+def write_atomic(path, content: str):
+    """Écrit un fichier texte via un fichier temporaire renommé (jamais lu à moitié)"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(f".{path.name}.tmp")
+    with open(tmp_file, 'w') as f:
+        f.write(content)
+    os.replace(tmp_file, path)
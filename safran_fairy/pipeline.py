@@ -0,0 +1,332 @@
+import time
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from art import tprint
+
+from .decompress import decompress_file, get_decompressed_file
+from .split import split_file, get_split_failure_key
+from .convert import create_netcdf, create_netcdf_streaming, get_max_workers, get_converted_file
+from .merge import MERGE_TYPES, get_variables, merge_variable, get_merge_failure_key
+from .state import get_stage_files
+
+
+# Étapes du graphe, de l'amont vers l'aval. Quand plusieurs tâches sont
+# prêtes, les plus en aval passent en premier : les chaînes commencées se
+# terminent (et libèrent le disque) avant d'en ouvrir de nouvelles.
+STAGES = ['decompress', 'split', 'convert', 'merge', 'upload']
+
+
+class TaskGraph:
+    """
+    Graphe de tâches exécuté au fil de l'eau : chaque tâche est soumise dès
+    que ses dépendances sont terminées, dans la limite de workers de son
+    étape, sans attendre la fin de l'étape précédente pour les autres fichiers.
+
+    Args:
+        executors (dict): Pool d'exécution de chaque étape. Ex: {'split': ProcessPoolExecutor, ...}
+        limits (dict):    Nombre maximal de tâches simultanées par étape. Ex: {'convert': 2, ...}
+
+    Notes:
+        Une tâche peut en ajouter d'autres à sa fin (on_done) : les conversions
+        d'une archive ne sont connues qu'une fois l'archive découpée.
+        La première erreur interrompt le graphe : elle est transmise à la
+        tâche (on_error, pour l'enregistrer dans l'état), les tâches en attente
+        sont annulées et l'exception est propagée.
+    """
+
+    def __init__(self, executors: dict, limits: dict):
+        self.executors = executors
+        self.limits = limits
+        self.tasks = {}
+        self.pending = []
+        self.done = set()
+        self.running = {}
+        self.timings = {}
+        self.completed = 0
+        self.stage_times = {stage: 0.0 for stage in STAGES}
+        self.stage_counts = {stage: 0 for stage in STAGES}
+
+    def add(self, key, stage, func, *args, deps=(), on_done=None, on_error=None, label=None):
+        """Ajoute une tâche, identifiée par key, dépendant des tâches deps"""
+        self.tasks[key] = {'stage': stage, 'func': func, 'args': args,
+                           'deps': set(deps), 'on_done': on_done, 'on_error': on_error,
+                           'label': label or str(key)}
+        self.pending.append(key)
+
+    def skip(self, key):
+        """Considère la tâche key comme faite (sortie déjà à jour), sans l'exécuter"""
+        self.done.add(key)
+
+    def running_count(self, stage):
+        return sum(1 for key, _ in self.running.values() if self.tasks[key]['stage'] == stage)
+
+    def submit_ready(self):
+        """Soumet les tâches prêtes, les étapes les plus en aval d'abord"""
+        ready = [key for key in self.pending if self.tasks[key]['deps'] <= self.done]
+        ready.sort(key=lambda key: -STAGES.index(self.tasks[key]['stage']))
+        for key in ready:
+            task = self.tasks[key]
+            if self.running_count(task['stage']) >= self.limits.get(task['stage'], 1):
+                continue
+            future = self.executors[task['stage']].submit(task['func'], *task['args'])
+            self.running[future] = (key, time.time())
+            self.pending.remove(key)
+
+    def run(self):
+        """Exécute le graphe jusqu'à la dernière tâche"""
+        while self.pending or self.running:
+            self.submit_ready()
+            if not self.running:
+                blocked = ', '.join(self.tasks[key]['label'] for key in self.pending)
+                raise RuntimeError(f"Dépendances jamais satisfaites : {blocked}")
+
+            finished, _ = wait(self.running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key, started_at = self.running.pop(future)
+                task = self.tasks[key]
+                elapsed = time.time() - started_at
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"\n❌ {task['stage']} {task['label']}")
+                    if task['on_error'] is not None:
+                        task['on_error'](e, started_at, elapsed)
+                    for executor in self.executors.values():
+                        executor.shutdown(wait=True, cancel_futures=True)
+                    raise
+                self.done.add(key)
+                self.completed += 1
+                self.timings[key] = (started_at, elapsed)
+                self.stage_times[task['stage']] += elapsed
+                self.stage_counts[task['stage']] += 1
+                print(f"\n[{self.completed}/{len(self.tasks)}] ✅ {task['stage']} {task['label']} "
+                      f"({round(elapsed, 1)}s)")
+                if task['on_done'] is not None:
+                    task['on_done'](result)
+
+
+def merge_variable_task(file_type, var, var_files, CONVERT_DIR, OUTPUT_DIR,
+                        profile=None, engine='native', force=False):
+    """
+    Merge d'une variable pour un type, lancé par le graphe dès que ses
+    conversions (et le merge du type précédent) sont terminées.
+
+    Les fichiers historical de la variable sont relus dans CONVERT_DIR, comme
+    dans merge_by_type : le merge inclut les décennies converties lors des
+    runs précédents. Pour previous et latest, seuls les fichiers convertis par
+    ce run sont fusionnés (les anciennes versions ne sont supprimées de
+    CONVERT_DIR qu'en fin de graphe).
+    """
+    if file_type == 'historical':
+        source_getter = dict((t, getter) for t, getter, _ in MERGE_TYPES)[file_type]
+        all_files = source_getter(list(Path(CONVERT_DIR).glob("*.nc")))
+        var_files = [f for f, v in zip(all_files, get_variables(all_files)) if v == var]
+    base_getter = dict((t, getter) for t, _, getter in MERGE_TYPES)[file_type]
+    return merge_variable(file_type, var, sorted(var_files), base_getter, Path(OUTPUT_DIR),
+                          profile, engine, force)
+
+
+def run_pipeline(DOWNLOAD_DIR, RAW_DIR, SPLIT_DIR, CONVERT_DIR, OUTPUT_DIR,
+                 METADATA_VARIABLES_FILE, downloaded_files=None, stream=False,
+                 streaming=False, profile=None, quantize=None, engine='native',
+                 workers=1, force=False, upload=None, upload_workers=4,
+                 stage_workers=None, state=None):
+    """
+    Traitement complet (decompress → split → convert → merge → upload) sous
+    forme de graphe de tâches : chaque archive et chaque variable avance
+    seule dans la chaîne, au lieu d'attendre la fin de chaque étape pour
+    tous les fichiers.
+
+    Args:
+        DOWNLOAD_DIR, RAW_DIR, SPLIT_DIR, CONVERT_DIR, OUTPUT_DIR: Dossiers des étapes.
+        METADATA_VARIABLES_FILE (Path):  CSV des métadonnées des variables.
+        downloaded_files (list, optional): Archives .csv.gz à traiter. Si None, toutes
+                                           les archives téléchargées (état, ou *.csv.gz
+                                           de DOWNLOAD_DIR).
+        stream (bool):                   Découpe directement les .csv.gz (pas de décompression).
+        streaming (bool):                Conversion par fenêtres temporelles (mémoire bornée).
+        profile, quantize, engine:       Voir convert() et merge().
+        workers (int):                   Nombre de processus partagés par les étapes de calcul.
+        force (bool):                    Refait les merges même si leurs entrées sont inchangées.
+        upload (callable, optional):     Fonction d'upload d'une liste de fichiers mergés,
+                                         retournant les fichiers non uploadés. Chaque fichier
+                                         est uploadé dès la fin de son merge. Si None, pas d'upload.
+        upload_workers (int):            Nombre d'uploads simultanés (threads).
+        stage_workers (dict, optional):  Tâches simultanées par étape, à la place des valeurs
+                                         par défaut. Ex: {'convert': 2, 'merge': 4}
+        state (StateStore, optional):    État du pipeline : les fichiers à jour (CSV, Parquet,
+                                         NetCDF convertis) ne sont pas reproduits, et chaque
+                                         fichier produit y est enregistré.
+
+    Returns:
+        tuple: (fichiers mergés, fichiers non uploadés)
+
+    Notes:
+        Les conversions sont limitées selon la mémoire disponible (voir
+        convert.get_max_workers). Les merges d'une variable sont lancés une
+        fois toutes les archives découpées (la liste de ses fichiers est alors
+        connue), en respectant historical → previous → latest.
+        Le nettoyage des anciennes versions (clean_local) reste à la charge de
+        l'appelant, une fois le graphe terminé.
+    """
+    tprint("pipeline", "small")
+
+    for directory in (RAW_DIR, SPLIT_DIR, CONVERT_DIR, OUTPUT_DIR):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+    CONVERT_DIR = Path(CONVERT_DIR)
+    OUTPUT_DIR = Path(OUTPUT_DIR)
+
+    if downloaded_files is None:
+        downloaded_files = get_stage_files(state, 'download', DOWNLOAD_DIR, "*.csv.gz")
+    if not downloaded_files:
+        print("\n⚠️  Aucune archive à traiter")
+        return [], []
+
+    workers = max(1, workers)
+    limits = {'decompress': workers, 'split': workers, 'convert': workers,
+              'merge': workers, 'upload': max(1, upload_workers)}
+    limits.update(stage_workers or {})
+    convert_file = create_netcdf_streaming if streaming else create_netcdf
+
+    print(f"   → {len(downloaded_files)} archive(s), {workers} processus, "
+          f"{limits['upload']} upload(s) simultané(s)")
+
+    merged_files = []
+    not_uploaded = []
+    convert_keys = {}          # (variable, type) → tâches de conversion
+    splits_left = [len(downloaded_files)]
+    convert_limited = [False]
+
+    with ProcessPoolExecutor(max_workers=workers) as process_pool, \
+            ThreadPoolExecutor(max_workers=limits['upload']) as thread_pool:
+        executors = {stage: process_pool for stage in STAGES}
+        executors['upload'] = thread_pool
+        graph = TaskGraph(executors, limits)
+
+        def add_uploads(key, output_file, var_files):
+            # Merge ignoré (manifeste) : le fichier et son enregistrement sont inchangés
+            if state is None or not state.is_fresh(output_file, var_files):
+                record(key, [output_file], 'merge', var_files)
+            merged_files.append(output_file)
+            if upload is not None:
+                graph.add(('upload', output_file.name), 'upload', upload, [output_file],
+                          on_done=not_uploaded.extend, label=output_file.name)
+
+        def add_merges():
+            # Chaîne historical → previous → latest de chaque variable
+            previous_merge = {}
+            for file_type, _, _ in MERGE_TYPES:
+                for (var, var_type), keys in sorted(convert_keys.items()):
+                    if var_type != file_type:
+                        continue
+                    var_files = [CONVERT_DIR / key[1].replace('.parquet', '.nc') for key in keys]
+                    deps = list(keys) + ([previous_merge[var]] if var in previous_merge else [])
+                    key = ('merge', var, file_type)
+                    graph.add(key, 'merge', merge_variable_task, file_type, var, var_files,
+                              CONVERT_DIR, OUTPUT_DIR, profile, engine, force,
+                              deps=deps,
+                              on_done=lambda output_file, key=key, var_files=var_files:
+                                  add_uploads(key, output_file, var_files),
+                              on_error=lambda e, *timing, var=var, file_type=file_type,
+                                  var_files=var_files: record_failure(
+                                      get_merge_failure_key(OUTPUT_DIR, var, file_type),
+                                      'merge', var_files, e, *timing),
+                              label=f"{var} {file_type}")
+                    previous_merge[var] = key
+
+        def record(key, output_files, stage, inputs):
+            # Durée de la tâche répartie entre ses fichiers (split : un par variable)
+            if state is not None:
+                started_at, elapsed = graph.timings[key]
+                for output_file in output_files:
+                    state.record(output_file, stage, inputs, started_at,
+                                 elapsed / len(output_files))
+
+        def record_failure(output_file, stage, inputs, error, started_at, elapsed):
+            if state is not None:
+                state.record_failure(output_file, stage, inputs, error, started_at, elapsed)
+
+        def add_converts(parquet_files):
+            parquet_files = [Path(f) for f in parquet_files]
+            if not convert_limited[0] and parquet_files:
+                # Mémoire : estimée sur les premiers fichiers découpés
+                graph.limits['convert'] = min(graph.limits['convert'],
+                                              get_max_workers(parquet_files, workers, streaming))
+                convert_limited[0] = True
+            for var, parquet_file in zip(get_variables(parquet_files), parquet_files):
+                file_type = next(t for t, getter, _ in MERGE_TYPES if getter([parquet_file]))
+                key = ('convert', parquet_file.name)
+                convert_keys.setdefault((var, file_type), []).append(key)
+                if (state is not None and not force and state.is_fresh(
+                        get_converted_file(parquet_file, CONVERT_DIR), [parquet_file])):
+                    graph.skip(key)
+                    continue
+                graph.add(key, 'convert', convert_file, parquet_file, CONVERT_DIR,
+                          METADATA_VARIABLES_FILE, profile, quantize,
+                          on_done=lambda output_file, key=key, parquet_file=parquet_file:
+                              record(key, [output_file], 'convert', [parquet_file]),
+                          on_error=lambda e, *timing, parquet_file=parquet_file: record_failure(
+                              get_converted_file(parquet_file, CONVERT_DIR), 'convert',
+                              [parquet_file], e, *timing),
+                          label=parquet_file.name)
+            splits_left[0] -= 1
+            if splits_left[0] == 0:
+                add_merges()
+
+        def on_split(key, input_file, parquet_files):
+            record(key, parquet_files, 'split', [input_file])
+            add_converts(parquet_files)
+
+        def add_split(input_file):
+            if state is not None and not force:
+                _, fresh = state.get_pending([input_file], 'split')
+                if fresh:
+                    print(f"   ⏭️  {Path(input_file).name} déjà découpé")
+                    return add_converts(fresh[input_file])
+            key = ('split', Path(input_file).name)
+            graph.add(key, 'split', split_file, input_file, SPLIT_DIR,
+                      on_done=lambda parquet_files: on_split(key, input_file, parquet_files),
+                      on_error=lambda e, *timing: record_failure(
+                          get_split_failure_key(input_file, SPLIT_DIR), 'split',
+                          [input_file], e, *timing),
+                      label=Path(input_file).name)
+
+        def on_decompress(key, archive, output_file):
+            record(key, [output_file], 'decompress', [archive])
+            add_split(output_file)
+
+        for archive in downloaded_files:
+            archive = Path(archive)
+            if stream:
+                add_split(archive)
+            elif (state is not None and not force and state.is_fresh(
+                    get_decompressed_file(archive, RAW_DIR), [archive])):
+                print(f"   ⏭️  {archive.name} déjà décompressé")
+                add_split(get_decompressed_file(archive, RAW_DIR))
+            else:
+                key = ('decompress', archive.name)
+                graph.add(key, 'decompress', decompress_file, archive, RAW_DIR,
+                          on_done=lambda output_file, key=key, archive=archive:
+                              on_decompress(key, archive, output_file),
+                          on_error=lambda e, *timing, archive=archive: record_failure(
+                              get_decompressed_file(archive, RAW_DIR), 'decompress',
+                              [archive], e, *timing),
+                          label=archive.name)
+
+        started_at = time.time()
+        graph.run()
+        elapsed = time.time() - started_at
+
+    print(f"\n{'='*50}")
+    print("RÉSUMÉ")
+    print(f"{'='*50}")
+    for stage in STAGES:
+        if graph.stage_counts[stage]:
+            print(f"   {stage:<11}: {graph.stage_counts[stage]:>4} tâche(s), "
+                  f"{round(graph.stage_times[stage], 1)}s cumulées")
+    print(f"   ⏱️  Durée totale : {round(elapsed, 1)}s")
+    print(f"   - {len(merged_files)} fichier(s) mergés")
+    if not_uploaded:
+        print(f"   - ⚠️  {len(not_uploaded)} échec(s) d'upload")
+
+    return merged_files, not_uploaded
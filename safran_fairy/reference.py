@@ -0,0 +1,105 @@
+import os
+import json
+from pathlib import Path
+from art import tprint
+
+from .tools import parse_filename
+from .upload_s3 import get_stable_name
+from .metrics import instrument
+
+
+def get_reference_file(OUTPUT_DIR, nc_file):
+    """
+    Index de références d'un NetCDF mergé.
+    Ex: OUTPUT_DIR/references/T_QUOT_SIM2_latest-19580801-20261011.nc.json
+    """
+    return Path(OUTPUT_DIR) / "references" / f"{Path(nc_file).name}.json"
+
+
+@instrument(outputs=lambda result, args, kwargs: args[1])
+def create_reference(nc_file, reference_file, url, INLINE_THRESHOLD=300):
+    """
+    Écrit l'index kerchunk (spécification de références v1) d'un NetCDF4 :
+    chaque chunk HDF5 est associé à (url, offset, longueur) dans le fichier
+    publié, les petits chunks (coordonnées) étant inclus directement.
+
+    Args:
+        nc_file (Path):        Fichier NetCDF local.
+        reference_file (Path): Fichier JSON de sortie.
+        url (str):             URL publique du NetCDF sur S3, lue par les clients.
+        INLINE_THRESHOLD (int): Taille (octets) sous laquelle un chunk est inclus dans le JSON.
+    """
+    from kerchunk.hdf import SingleHdf5ToZarr
+
+    with open(nc_file, 'rb') as f:
+        references = SingleHdf5ToZarr(f, url=url, inline_threshold=INLINE_THRESHOLD).translate()
+
+    reference_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = reference_file.with_suffix('.json.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(references, f, separators=(',', ':'))
+    os.replace(tmp_file, reference_file)
+    return len(references['refs'])
+
+
+def generate_references(OUTPUT_DIR, DATA_URL, merged_files=None, force=False, stable=False):
+    """
+    Index JSON de références (chunks → plages d'octets) des NetCDF mergés,
+    pour une lecture partielle des fichiers publiés sur S3 sans en stocker
+    une seconde copie.
+
+    Args:
+        OUTPUT_DIR (str):              Dossier des fichiers mergés.
+        DATA_URL (str):                URL publique du préfixe des NetCDF sur S3.
+                                       Ex: https://s3-data.meso.umontpellier.fr/riverly-data-lake/data/safran-fairy
+        merged_files (list, optional): Fichiers produits par merge().
+                                       Si None, tous les fichiers mergés de OUTPUT_DIR.
+        force (bool):                  Régénère les index même s'ils sont plus récents que le NetCDF.
+        stable (bool):                 Les NetCDF sont publiés sous leur clé stable
+                                       (voir upload_s3.publish_s3). Ex: T_QUOT_SIM2_latest.nc
+
+    Returns:
+        list: Index des fichiers mergés, créés ou déjà à jour (l'upload en mode
+              diff n'envoie que ceux qui ont changé).
+              Ex: [OUTPUT_DIR/references/T_QUOT_SIM2_latest-19580801-20261011.nc.json, ...]
+
+    Notes:
+        Les index dont le NetCDF n'existe plus dans OUTPUT_DIR (ancienne
+        version supprimée par clean_local) sont supprimés.
+        Un index n'est régénéré que si son NetCDF est plus récent : après un
+        changement de mode de publication (stable), utiliser force=True.
+    """
+    tprint("references", "small")
+    OUTPUT_DIR = Path(OUTPUT_DIR)
+
+    if merged_files is None:
+        merged_files = sorted(OUTPUT_DIR.glob("*_QUOT_SIM2_*.nc"))
+    merged_files = [Path(f) for f in merged_files if parse_filename(Path(f).name)]
+
+    reference_files = []
+    n_created = 0
+    for nc_file in merged_files:
+        reference_file = get_reference_file(OUTPUT_DIR, nc_file)
+        reference_files.append(reference_file)
+        if (not force and reference_file.exists()
+                and reference_file.stat().st_mtime >= nc_file.stat().st_mtime):
+            print(f"   ⏭️  {reference_file.name} à jour")
+            continue
+        published_name = get_stable_name(nc_file.name) if stable else nc_file.name
+        url = f"{DATA_URL.rstrip('/')}/{published_name}"
+        n_refs = create_reference(nc_file, reference_file, url)
+        print(f"   💾 {reference_file.name} ({n_refs} références)")
+        n_created += 1
+
+    # Index orphelins
+    for reference_file in sorted((OUTPUT_DIR / "references").glob("*.nc.json")):
+        if not (OUTPUT_DIR / reference_file.name[:-len('.json')]).exists():
+            print(f"   🗑️ {reference_file.name}")
+            reference_file.unlink()
+
+    print(f"\n{'='*50}")
+    print("RÉSUMÉ")
+    print(f"{'='*50}")
+    print(f"🔗 Index générés : {n_created}/{len(merged_files)}")
+
+    return reference_files
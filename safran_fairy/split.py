@@ -1,10 +1,14 @@
 import os
+import time
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 from art import tprint
 from dotenv import load_dotenv
 
 from .clean import clean_local
+from .state import get_stage_files
+from .metrics import instrument
 
 
 load_dotenv()
@@ -43,12 +47,33 @@ if MODE == "dev":
 
 
 
-def split_file(input_file, SPLIT_DIR, CHUNK_SIZE=500_000):
+def get_base_name(input_file):
+    """
+    Nom de base d'un fichier SIM2, sans extension .csv ni .csv.gz.
+    Ex: QUOT_SIM2_1958-1959.csv.gz → QUOT_SIM2_1958-1959
+    """
+    name = Path(input_file).name
+    for suffix in ('.gz', '.csv'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def get_split_failure_key(input_file, SPLIT_DIR):
+    """
+    Chemin sous lequel l'échec du découpage d'un fichier est enregistré dans
+    l'état (les Parquet produits, un par variable, ne sont pas connus d'avance).
+    Ex: SPLIT_DIR/QUOT_SIM2_1958-1959.parquet
+    """
+    return Path(SPLIT_DIR) / f"{get_base_name(input_file)}.parquet"
+
+
+def split_file_pandas(input_file, SPLIT_DIR, CHUNK_SIZE=500_000):
     print(f"\n✂️ Découpage: {Path(input_file).name}")
     
     SPLIT_DIR = Path(SPLIT_DIR)
     SPLIT_DIR.mkdir(parents=True, exist_ok=True)
-    base_name = Path(input_file).stem
+    base_name = get_base_name(input_file)
     id_cols = ['LAMBX', 'LAMBY', 'DATE']
 
     # Lire uniquement la première ligne pour détecter les colonnes
@@ -80,8 +105,77 @@ def split_file(input_file, SPLIT_DIR, CHUNK_SIZE=500_000):
     return splited_files
 
 
+def split_file_arrow(input_file, SPLIT_DIR, BLOCK_SIZE=64*1024*1024):
+    """
+    Découpe un CSV (ou .csv.gz) avec le lecteur CSV streaming de pyarrow.
+
+    Le CSV est lu par blocs en multithread avec des types explicites, et
+    chaque RecordBatch est découpé par sélection de colonnes (sans copie)
+    vers le ParquetWriter de chaque variable.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pv
+    import pyarrow.parquet as pq
+
+    print(f"\n✂️ Découpage: {Path(input_file).name}")
+
+    SPLIT_DIR = Path(SPLIT_DIR)
+    SPLIT_DIR.mkdir(parents=True, exist_ok=True)
+    base_name = get_base_name(input_file)
+    id_cols = ['LAMBX', 'LAMBY', 'DATE']
+
+    # Lire uniquement la première ligne pour détecter les colonnes
+    first_row = pd.read_csv(input_file, sep=";", nrows=0)
+    variables = [col for col in first_row.columns if col not in id_cols]
+    print(f"   → {len(variables)} variables détectées: {', '.join(variables)}")
+
+    column_types = {col: pa.int64() for col in id_cols}
+    column_types.update({var: pa.float64() for var in variables})
+
+    reader = pv.open_csv(
+        pa.input_stream(str(input_file)),
+        read_options=pv.ReadOptions(block_size=BLOCK_SIZE, use_threads=True),
+        parse_options=pv.ParseOptions(delimiter=';'),
+        convert_options=pv.ConvertOptions(column_types=column_types))
+
+    # Préparer un writer parquet par variable
+    output_files = {var: SPLIT_DIR / f"{var}_{base_name}.parquet" for var in variables}
+    writers = {var: pq.ParquetWriter(output_files[var],
+                                     pa.schema([reader.schema.field(c) for c in id_cols + [var]]),
+                                     compression='snappy')
+               for var in variables}
+
+    for batch in reader:
+        for var in variables:
+            writers[var].write_batch(batch.select(id_cols + [var]))
+
+    for var, writer in writers.items():
+        writer.close()
+        print(f"   💾 {output_files[var].name}")
+
+    splited_files = list(output_files.values())
+    print(f"   ✅ {len(splited_files)} fichiers créés dans {SPLIT_DIR}")
+    return splited_files
+
+
+SPLIT_ENGINES = {
+    'arrow': split_file_arrow,
+    'pandas': split_file_pandas,
+}
 
-def split(RAW_DIR, SPLIT_DIR, decompressed_files=None):
+
+@instrument()
+def split_file(input_file, SPLIT_DIR, engine='arrow'):
+    """Découpe un fichier CSV avec le moteur choisi ('arrow' ou 'pandas')."""
+    if engine not in SPLIT_ENGINES:
+        raise ValueError(f"Moteur de découpage inconnu: {engine} "
+                         f"(choix: {', '.join(SPLIT_ENGINES)})")
+    return SPLIT_ENGINES[engine](input_file, SPLIT_DIR)
+
+
+
+def split(RAW_DIR, SPLIT_DIR, decompressed_files=None, stream=False,
+          engine='arrow', workers=1, state=None, force=False):
     """
     Découpe les fichiers CSV en plusieurs fichiers Parquet, un par variable.
 
@@ -89,11 +183,23 @@ def split(RAW_DIR, SPLIT_DIR, decompressed_files=None):
     ou de la liste fournie, puis nettoie les fichiers obsolètes dans SPLIT_DIR.
 
     Args:
-        RAW_DIR (str | Path):          Dossier contenant les fichiers CSV décompressés.
+        RAW_DIR (str | Path):          Dossier contenant les fichiers CSV décompressés,
+                                       ou les archives .csv.gz en mode stream.
         SPLIT_DIR (str | Path):        Dossier de sortie pour les fichiers Parquet.
                                        Créé automatiquement s'il n'existe pas.
         decompressed_files (list[Path], optional): Liste de fichiers CSV à traiter.
-                                                   Si None, traite tous les *.csv de RAW_DIR.
+                                                   Si None, traite tous les CSV décompressés
+                                                   (état, ou *.csv de RAW_DIR ; archives
+                                                   .csv.gz en mode stream).
+        stream (bool):                 Lit directement les archives .csv.gz, chunk par chunk,
+                                       sans passer par un CSV décompressé sur disque.
+        engine (str):                  Moteur de lecture CSV : 'arrow' (pyarrow.csv, multithread)
+                                       ou 'pandas' (parseur C de pandas, par chunks).
+        workers (int):                 Nombre de fichiers découpés en parallèle (processus).
+                                       Défaut: 1 (séquentiel).
+        state (StateStore, optional):  État du pipeline : les fichiers dont tous les Parquet
+                                       sont à jour ne sont pas redécoupés.
+        force (bool):                  Redécoupe même les fichiers à jour.
 
     Returns:
         list[list[Path]]: Liste de listes — une sous-liste de fichiers Parquet par CSV traité.
@@ -104,15 +210,57 @@ def split(RAW_DIR, SPLIT_DIR, decompressed_files=None):
     Path(SPLIT_DIR).mkdir(parents=True, exist_ok=True)
     
     if decompressed_files is None:
-        decompressed_files = list(Path(RAW_DIR).glob("*.csv"))
+        pattern = "*.csv.gz" if stream else "*.csv"
+        decompressed_files = get_stage_files(state, 'download' if stream else 'decompress',
+                                             RAW_DIR, pattern)
+
+    print("SPLIT (stream .csv.gz)" if stream else "SPLIT")
 
-    print("SPLIT")
+    fresh = {}
+    if state is not None:
+        decompressed_files, fresh = state.get_pending(decompressed_files, 'split', force=force)
+        if fresh:
+            print(f"   ⏭️  {len(fresh)} fichier(s) déjà découpé(s)")
 
     splited_files = []
-    for i, file in enumerate(decompressed_files, 1):
-        print(f"\n[{i}/{len(decompressed_files)}]")
-        output_files = split_file(file, SPLIT_DIR)
-        splited_files.append(output_files)
+    if workers > 1 and len(decompressed_files) > 1:
+        # Les fichiers sont indépendants : un processus par fichier,
+        # résultats remis dans l'ordre d'entrée
+        splited_files = [None] * len(decompressed_files)
+        with ProcessPoolExecutor(max_workers=min(workers, len(decompressed_files))) as executor:
+            futures = {executor.submit(split_file, file, SPLIT_DIR, engine): i
+                       for i, file in enumerate(decompressed_files)}
+            for done, future in enumerate(as_completed(futures), 1):
+                i = futures[future]
+                try:
+                    splited_files[i] = future.result()
+                except Exception as e:
+                    if state is not None:
+                        state.record_failure(get_split_failure_key(decompressed_files[i], SPLIT_DIR),
+                                             'split', [decompressed_files[i]], e)
+                    raise
+                print(f"\n[{done}/{len(decompressed_files)}] ✅ {Path(decompressed_files[i]).name}")
+                if state is not None:
+                    for output_file in splited_files[i]:
+                        state.record(output_file, 'split', [decompressed_files[i]])
+    else:
+        for i, file in enumerate(decompressed_files, 1):
+            print(f"\n[{i}/{len(decompressed_files)}]")
+            started_at = time.time()
+            try:
+                output_files = split_file(file, SPLIT_DIR, engine=engine)
+            except Exception as e:
+                if state is not None:
+                    state.record_failure(get_split_failure_key(file, SPLIT_DIR), 'split',
+                                         [file], e, started_at, time.time() - started_at)
+                raise
+            if state is not None:
+                # Durée du découpage répartie entre les fichiers produits
+                duration = (time.time() - started_at) / max(1, len(output_files))
+                for output_file in output_files:
+                    state.record(output_file, 'split', [file], started_at, duration)
+            splited_files.append(output_files)
+    splited_files += list(fresh.values())
         
     print("\nRÉSUMÉ")
     print(f"   - {len(splited_files)} fichier(s) découpé(s)")
@@ -0,0 +1,330 @@
+import os
+import json
+import sqlite3
+from pathlib import Path
+from datetime import datetime
+
+from .tools import file_checksum, file_fingerprint
+
+
+# Étapes suivies, dans l'ordre du pipeline (ordre d'affichage des statistiques)
+STATE_STAGES = ['download', 'decompress', 'split', 'convert', 'merge']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    path         TEXT PRIMARY KEY,
+    stage        TEXT NOT NULL,
+    status       TEXT NOT NULL,
+    size         INTEGER,
+    mtime        REAL,
+    checksum     TEXT,
+    started_at   TEXT,
+    finished_at  TEXT,
+    duration     REAL,
+    processed_at TEXT,
+    error        TEXT
+);
+CREATE INDEX IF NOT EXISTS artifacts_stage ON artifacts (stage, status);
+
+CREATE TABLE IF NOT EXISTS inputs (
+    artifact TEXT NOT NULL REFERENCES artifacts (path) ON DELETE CASCADE,
+    input    TEXT NOT NULL,
+    size     INTEGER,
+    mtime    REAL,
+    PRIMARY KEY (artifact, input)
+);
+CREATE INDEX IF NOT EXISTS inputs_input ON inputs (input);
+
+CREATE TABLE IF NOT EXISTS downloads (
+    resource_id   TEXT PRIMARY KEY,
+    filename      TEXT NOT NULL,
+    last_modified TEXT,
+    downloaded_at TEXT,
+    size_bytes    INTEGER
+);
+"""
+
+
+def get_key(path):
+    """Clé d'un fichier dans la base : chemin absolu"""
+    return os.path.abspath(path)
+
+
+class StateStore:
+    """
+    État persistant du pipeline (SQLite) : chaque fichier produit par une
+    étape y est enregistré avec ses entrées, sa taille, sa date de
+    modification, son checksum éventuel, ses temps d'exécution et son statut.
+
+    Une étape interroge la base pour savoir ce qui est à refaire : un fichier
+    est à jour s'il a été produit avec succès, n'a pas été modifié depuis et
+    si ses entrées sont celles enregistrées (taille + mtime). Un run
+    interrompu reprend ainsi là où il s'était arrêté.
+
+    Args:
+        STATE_DB (str):   Fichier SQLite, créé au premier appel.
+                          Ex: /var/lib/safran-fairy/pipeline_state.sqlite
+
+    Notes:
+        La base remplace download_state.json, importé automatiquement
+        (voir import_json). Les écritures se font depuis le processus
+        principal : les workers ne font que produire les fichiers.
+    """
+
+    def __init__(self, STATE_DB: str):
+        self.path = STATE_DB
+        Path(STATE_DB).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(STATE_DB, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    # ─── Fichiers produits ──────────────────────────────────────────────────
+
+    def record(self, path, stage: str, inputs=(), started_at: float = None,
+               duration: float = None, status: str = 'done', checksum: bool = False,
+               error: str = None):
+        """
+        Enregistre (ou remplace) un fichier produit par une étape.
+
+        Args:
+            path (Path):         Fichier produit.
+            stage (str):         Étape. Ex: 'convert'
+            inputs (list):       Fichiers d'entrée (leur taille et mtime sont enregistrées).
+            started_at (float):  Début de la production (timestamp).
+            duration (float):    Durée de la production, en secondes (part de la tâche
+                                 quand elle produit plusieurs fichiers).
+            status (str):        'done' ou 'failed'.
+            checksum (bool):     Calcule le MD5 du fichier (archives téléchargées).
+            error (str):         Message d'erreur d'un échec.
+        """
+        fingerprint = file_fingerprint(path) if Path(path).exists() else {'size': None, 'mtime': None}
+        with self.db:
+            self.db.execute("DELETE FROM artifacts WHERE path = ?", (get_key(path),))
+            self.db.execute(
+                "INSERT INTO artifacts (path, stage, status, size, mtime, checksum, "
+                "started_at, finished_at, duration, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (get_key(path), stage, status, fingerprint['size'], fingerprint['mtime'],
+                 file_checksum(path) if checksum and status == 'done' else None,
+                 datetime.fromtimestamp(started_at).isoformat() if started_at else None,
+                 datetime.now().isoformat(), duration, error))
+            for input_file in inputs:
+                if not Path(input_file).exists():
+                    continue
+                input_fingerprint = file_fingerprint(input_file)
+                self.db.execute(
+                    "INSERT OR REPLACE INTO inputs (artifact, input, size, mtime) VALUES (?, ?, ?, ?)",
+                    (get_key(path), get_key(input_file),
+                     input_fingerprint['size'], input_fingerprint['mtime']))
+            if status == 'done' and inputs:
+                # Un succès efface les échecs de l'étape sur les mêmes entrées
+                # (ex: échec d'un split enregistré sous un nom sans variable)
+                keys = [get_key(f) for f in inputs]
+                self.db.execute(
+                    f"DELETE FROM artifacts WHERE stage = ? AND status = 'failed' AND path IN "
+                    f"(SELECT artifact FROM inputs WHERE input IN ({', '.join('?' * len(keys))}))",
+                    (stage, *keys))
+
+    def record_failure(self, path, stage: str, inputs=(), error=None,
+                       started_at: float = None, duration: float = None):
+        """
+        Enregistre l'échec d'une étape pour le fichier qu'elle devait produire
+        (status 'failed'), pour le distinguer d'un fichier jamais produit. Il
+        est remplacé par le prochain succès (même fichier, ou mêmes entrées).
+
+        Args:
+            path (Path):         Fichier attendu. Ex: CONVERT_DIR/T_QUOT_SIM2_1958-1959.nc
+            stage (str):         Étape. Ex: 'convert'
+            inputs (list):       Fichiers d'entrée de la tâche.
+            error (Exception | str): Erreur rencontrée.
+        """
+        message = f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else error
+        self.record(path, stage, inputs, started_at, duration, status='failed', error=message)
+
+    def is_fresh(self, path, inputs=()) -> bool:
+        """
+        Indique si un fichier est à jour : produit avec succès, inchangé depuis
+        (taille + mtime), et produit à partir des mêmes entrées, elles aussi inchangées.
+        """
+        row = self.db.execute("SELECT * FROM artifacts WHERE path = ?", (get_key(path),)).fetchone()
+        if row is None or row['status'] != 'done' or not Path(path).exists():
+            return False
+        fingerprint = file_fingerprint(path)
+        if (fingerprint['size'], fingerprint['mtime']) != (row['size'], row['mtime']):
+            return False
+
+        recorded = {r['input']: r for r in self.db.execute(
+            "SELECT * FROM inputs WHERE artifact = ?", (get_key(path),))}
+        if set(recorded) != {get_key(f) for f in inputs}:
+            return False
+        for input_file in inputs:
+            if not Path(input_file).exists():
+                return False
+            input_fingerprint = file_fingerprint(input_file)
+            entry = recorded[get_key(input_file)]
+            if (input_fingerprint['size'], input_fingerprint['mtime']) != (entry['size'], entry['mtime']):
+                return False
+        return True
+
+    def get_outputs(self, stage: str, input_file) -> list:
+        """Fichiers produits par une étape à partir d'une entrée. Ex: les Parquet d'un CSV"""
+        rows = self.db.execute(
+            "SELECT a.path FROM artifacts a JOIN inputs i ON i.artifact = a.path "
+            "WHERE a.stage = ? AND i.input = ? ORDER BY a.path",
+            (stage, get_key(input_file)))
+        return [Path(row['path']) for row in rows]
+
+    def get_artifacts(self, stage: str, status: str = 'done') -> list:
+        """Fichiers existants produits par une étape. Ex: tous les Parquet du split"""
+        rows = self.db.execute(
+            "SELECT path FROM artifacts WHERE stage = ? AND status = ? ORDER BY path",
+            (stage, status))
+        return [Path(row['path']) for row in rows if Path(row['path']).exists()]
+
+    def get_unprocessed(self, stage: str = 'download') -> list:
+        """
+        Fichiers d'une étape pas encore traités jusqu'au merge (voir
+        mark_processed). Ex: archive téléchargée lors d'un run interrompu.
+        """
+        rows = self.db.execute(
+            "SELECT path FROM artifacts WHERE stage = ? AND status = 'done' "
+            "AND processed_at IS NULL ORDER BY path", (stage,))
+        return [Path(row['path']) for row in rows if Path(row['path']).exists()]
+
+    def mark_processed(self, paths):
+        """Marque des fichiers comme traités jusqu'au bout du pipeline"""
+        now = datetime.now().isoformat()
+        with self.db:
+            self.db.executemany("UPDATE artifacts SET processed_at = ? WHERE path = ?",
+                                [(now, get_key(p)) for p in paths])
+
+    def prune(self) -> int:
+        """
+        Oublie les fichiers supprimés du disque (ex: par clean_local). Les
+        échecs, sans fichier, sont gardés tant que leurs entrées existent.
+        """
+        rows = self.db.execute("SELECT path, status FROM artifacts").fetchall()
+        missing = []
+        for row in rows:
+            if Path(row['path']).exists():
+                continue
+            if row['status'] == 'failed':
+                inputs = self.db.execute("SELECT input FROM inputs WHERE artifact = ?",
+                                         (row['path'],)).fetchall()
+                if all(Path(r['input']).exists() for r in inputs):
+                    continue
+            missing.append((row['path'],))
+        with self.db:
+            self.db.executemany("DELETE FROM artifacts WHERE path = ?", missing)
+        return len(missing)
+
+    def get_pending(self, input_files, stage: str, get_output=None, force: bool = False) -> tuple:
+        """
+        Sépare des entrées entre celles à (re)traiter et celles dont les
+        sorties sont à jour.
+
+        Args:
+            input_files (list):      Entrées de l'étape.
+            stage (str):             Étape productrice des sorties. Ex: 'split'
+            get_output (callable):   Sortie attendue d'une entrée, si elle est connue
+                                     d'avance. Sinon, sorties enregistrées (get_outputs).
+            force (bool):            Retraite toutes les entrées.
+
+        Returns:
+            tuple: (entrées à traiter, {entrée: sorties à jour})
+        """
+        pending, fresh = [], {}
+        for input_file in input_files:
+            outputs = ([get_output(input_file)] if get_output
+                       else self.get_outputs(stage, input_file))
+            if (not force and outputs
+                    and all(self.is_fresh(output, [input_file]) for output in outputs)):
+                fresh[input_file] = outputs
+            else:
+                pending.append(input_file)
+        return pending, fresh
+
+    # ─── Téléchargements ────────────────────────────────────────────────────
+
+    def load_downloads(self) -> dict:
+        """
+        État des téléchargements, au format de download_state.json.
+        Ex: {'<resource_id>': {'filename': ..., 'last_modified': ..., ...}}
+        """
+        return {row['resource_id']: {key: row[key] for key in row.keys() if key != 'resource_id'}
+                for row in self.db.execute("SELECT * FROM downloads")}
+
+    def save_download(self, resource_id: str, result: dict):
+        """Enregistre un téléchargement réussi (résultat de download.download_file)"""
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO downloads (resource_id, filename, last_modified, "
+                "downloaded_at, size_bytes) VALUES (?, ?, ?, ?, ?)",
+                (resource_id, result['filename'], result.get('last_modified'),
+                 result.get('downloaded_at'), result.get('size_bytes')))
+
+    def import_json(self, STATE_FILE, DOWNLOAD_DIR):
+        """
+        Reprend un ancien download_state.json si la base ne connaît encore
+        aucun téléchargement. Les archives présentes sont enregistrées comme
+        déjà traitées.
+        """
+        if not STATE_FILE or not os.path.exists(STATE_FILE):
+            return 0
+        if self.db.execute("SELECT COUNT(*) FROM downloads").fetchone()[0]:
+            return 0
+        with open(STATE_FILE, 'r') as f:
+            state = json.load(f)
+        for resource_id, result in state.items():
+            self.save_download(resource_id, result)
+            archive = Path(DOWNLOAD_DIR) / result['filename']
+            if archive.exists():
+                self.record(archive, 'download')
+                self.mark_processed([archive])
+        print(f"   ↪️  {len(state)} téléchargement(s) repris de {STATE_FILE}")
+        return len(state)
+
+    # ─── Statistiques ───────────────────────────────────────────────────────
+
+    def stats(self) -> list:
+        """Nombre, taille totale et dernière production des fichiers de chaque étape"""
+        return self.db.execute(
+            "SELECT stage, COUNT(*) AS files, COALESCE(SUM(size), 0) AS size, "
+            "MAX(finished_at) AS last_update, "
+            "SUM(status = 'failed') AS failed, SUM(duration) AS duration "
+            "FROM artifacts GROUP BY stage").fetchall()
+
+
+def get_stage_files(state, stage, directory, pattern):
+    """
+    Fichiers produits par une étape, d'après l'état, ou glob de directory si
+    l'état n'en connaît aucun (première utilisation de la base).
+    """
+    files = state.get_artifacts(stage) if state is not None else []
+    if not files:
+        files = sorted(Path(directory).glob(pattern))
+    return files
+
+
+def print_stats(STATE_DB):
+    """Affiche les statistiques des données, en une requête sur l'état du pipeline"""
+    if not os.path.exists(STATE_DB):
+        print("  Aucune donnée")
+        return
+    state = StateStore(STATE_DB)
+    rows = {row['stage']: row for row in state.stats()}
+    state.close()
+
+    print(f"{'Étape':<12}{'Fichiers':>10}{'Taille':>12}{'Durée':>10}  Dernière mise à jour")
+    for stage in STATE_STAGES + sorted(set(rows) - set(STATE_STAGES)):
+        if stage not in rows:
+            continue
+        row = rows[stage]
+        failed = f" ({row['failed']} échec(s))" if row['failed'] else ""
+        duration = f"{round(row['duration'] or 0)}s"
+        print(f"{stage:<12}{row['files']:>10}{row['size'] / 1024**3:>10.2f}Go{duration:>10}  "
+              f"{(row['last_update'] or '')[:19]}{failed}")
@@ -3,11 +3,32 @@ import re
 
 def parse_filename(name: str) -> dict | None:
     """
-    Parse un nom de fichier SIM2.
+    Parse un nom de fichier SIM2 (quotidien, ou agrégat mensuel/annuel).
     Ex: PRENEI_QUOT_SIM2_historical-19580801-20191231.nc
+        PRENEI_MENS_SIM2_latest-19580801-20261011.nc
     """
-    pattern = r'^(?P<variable>.+)_QUOT_SIM2_(?P<version>latest|previous|historical)-(?P<date_debut>\d{8})-(?P<date_fin>\d{8})\.nc$'
+    pattern = r'^(?P<variable>.+)_(?P<frequency>QUOT|MENS|ANNU)_SIM2_(?P<version>latest|previous|historical)-(?P<date_debut>\d{8})-(?P<date_fin>\d{8})\.nc$'
     match = re.match(pattern, name)
     if not match:
         return None
     return match.groupdict()
+
+
+def file_checksum(path, algorithm='md5', CHUNK_SIZE=8*1024*1024):
+    """Empreinte hexadécimale du contenu d'un fichier, lu par blocs"""
+    import hashlib
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    """
+    Empreinte rapide d'un fichier (nom, taille, date de modification).
+    Ex: {'name': 'T_QUOT_SIM2_1958-1959.nc', 'size': 123456, 'mtime': 1771234567.0}
+    """
+    from pathlib import Path
+    stat = Path(path).stat()
+    return {'name': Path(path).name, 'size': stat.st_size, 'mtime': stat.st_mtime}
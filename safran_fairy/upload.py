@@ -1,11 +1,9 @@
 import os
 import requests
-import json
-import time
 from pathlib import Path
 from art import tprint
 
-from .dataverse_tools import get_existing_files, delete_file_by_name
+from .dataverse_tools import DataverseClient
 
 
 def upload(dataset_DOI: str,
@@ -14,8 +12,26 @@ def upload(dataset_DOI: str,
            directory_labels: list = None,
            overwrite: bool = False,
            RDG_BASE_URL: str = os.getenv("RDG_BASE_URL"),
-           RDG_API_TOKEN: str = os.getenv("RDG_API_TOKEN")):
+           RDG_API_TOKEN: str = os.getenv("RDG_API_TOKEN"),
+           workers: int = 4,
+           client: DataverseClient = None):
+    """
+    Upload des fichiers dans un dataset Dataverse.
 
+    La liste des fichiers du dataset est lue une seule fois (voir
+    dataverse_tools.DataverseClient). Dataverse sérialisant les modifications
+    d'un dataset, les fichiers sont envoyés un par un ; avec overwrite, les
+    fichiers déjà présents sont remplacés (/replace), l'ancienne version
+    restant en place si le remplacement échoue.
+
+    Args:
+        workers (int):                      Nombre de requêtes simultanées du client créé
+                                            (suppressions, voir DataverseClient).
+        client (DataverseClient, optional): Client partagé (session et liste en cache).
+
+    Returns:
+        list: Fichiers non uploadés (vide si tout est passé).
+    """
     tprint("upload", "small")
     
     if file_paths is None:
@@ -23,77 +39,67 @@ def upload(dataset_DOI: str,
     if not file_paths:
         print("\n⚠️  Aucun fichier à uploader")
         return []
+    if client is None:
+        client = DataverseClient(dataset_DOI, RDG_BASE_URL, RDG_API_TOKEN, workers)
     
     print("\nUPLOAD DATAVERSE")
     print(f"   Dataset: {dataset_DOI}")
     print(f"   Fichiers: {len(file_paths)}")
 
-    file_categories = [[f.stem.split('_QUOT_SIM2_')[0],
-                        f.stem.split('_QUOT_SIM2_')[1].split('-')[0]]
+    file_categories = [[Path(f).stem.split('_QUOT_SIM2_')[0],
+                        Path(f).stem.split('_QUOT_SIM2_')[1].split('-')[0]]
                        for f in file_paths]
     
     # Récupérer la liste des fichiers existants
-    existing_files = get_existing_files(dataset_DOI, RDG_BASE_URL, RDG_API_TOKEN)
+    existing_files = client.get_existing_files()
     if existing_files:
         print(f"   Fichiers existants: {len(existing_files)}")
     
-    url = f"{RDG_BASE_URL}/api/datasets/:persistentId/add?persistentId={dataset_DOI}"
-    headers = {'X-Dataverse-key': RDG_API_TOKEN}
     not_uploaded = []
     skipped = []
+    to_upload = []
+    to_replace = []
     
     for i, file_path in enumerate(file_paths):
         path_obj = Path(file_path)
         
-        print(f"\n📤 [{i+1}/{len(file_paths)}] {path_obj.name}")
-        
         # Vérifier si le fichier existe déjà
         if path_obj.name in existing_files:
             if overwrite:
-                # Supprimer l'ancien fichier
-                delete_file_by_name(dataset_DOI, path_obj.name, RDG_BASE_URL, RDG_API_TOKEN)
+                to_replace.append(path_obj.name)
             else:
-                # Skip
-                print(f"   ⏭️  Fichier déjà présent, ignoré")
                 skipped.append(file_path)
                 continue
         
-        directory_label = directory_labels[i] if directory_labels else None
-        categories = file_categories[i] if file_categories else None
-        
-        if directory_label:
-            print(f"   → Dossier: {directory_label}")
-        if categories:
-            print(f"   🏷️  Catégories: {', '.join(categories)}")
-        
         json_data = {"description": "", "restrict": "false", "tabIngest": "true"}
-        if directory_label:
-            json_data["directoryLabel"] = directory_label
-        if categories:
-            json_data["categories"] = categories
-        
+        if directory_labels:
+            json_data["directoryLabel"] = directory_labels[i]
+        if file_categories:
+            json_data["categories"] = file_categories[i]
+        to_upload.append((file_path, json_data))
+
+    if skipped:
+        print(f"\n⏭️  {len(skipped)} fichier(s) déjà présent(s), ignoré(s)")
+
+    if to_replace:
+        print(f"\n🔁 Remplacement de {len(to_replace)} fichier(s)")
+
+    for i, (file_path, json_data) in enumerate(to_upload):
+        print(f"\n📤 [{i+1}/{len(to_upload)}] {Path(file_path).name}")
+        if "directoryLabel" in json_data:
+            print(f"   → Dossier: {json_data['directoryLabel']}")
+        print(f"   🏷️  Catégories: {', '.join(json_data['categories'])}")
         try:
-            start_time = time.time()
-            with open(file_path, 'rb') as f:
-                files = {
-                    'file': (path_obj.name, f),
-                    'jsonData': (None, json.dumps(json_data), 'application/json')
-                }
-                response = requests.post(url, headers=headers, files=files)
-            
-            elapsed_time = time.time() - start_time
-            file_size = os.path.getsize(file_path) / (1024**2)
-            upload_speed = file_size / elapsed_time
-            
-            if response.status_code not in [200, 201]:
-                not_uploaded.append(file_path)
-                print(f"   ❌ Échec: {response.status_code} - {response.text}")
+            if Path(file_path).name in to_replace:
+                size, elapsed_time = client.replace_file(Path(file_path).name, file_path, json_data)
             else:
-                print(f"   ✅ Upload: {round(file_size, 2)} MB en {round(elapsed_time, 2)}s @ {round(upload_speed, 2)} MB/s")
-        
+                size, elapsed_time = client.add_file(file_path, json_data)
+            file_size = size / (1024**2)
+            upload_speed = file_size / max(elapsed_time, 1e-6)
+            print(f"   ✅ Upload: {round(file_size, 2)} MB en {round(elapsed_time, 2)}s @ {round(upload_speed, 2)} MB/s")
         except Exception as e:
             not_uploaded.append(file_path)
-            print(f"   ❌ Erreur: {str(e)}")
+            print(f"   ❌ Échec: {str(e)}")
     
     print("\nRÉSUMÉ")
     uploaded_count = len(file_paths) - len(not_uploaded) - len(skipped)
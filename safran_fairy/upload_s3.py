@@ -1,13 +1,19 @@
 import os
+import hashlib
 import requests
 import json
 import time
 from pathlib import Path
+from datetime import datetime, timezone
 from art import tprint
 import boto3
 import mimetypes
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from .tools import parse_filename
+from .metrics import instrument
 
     
 def apply_s3_bucket_policy(S3_BUCKET: str,
@@ -95,6 +101,167 @@ def get_content_type(filename: str) -> str:
     return content_type or "application/octet-stream"
 
 
+def get_s3_client(S3_ACCESS_KEY: str = None,
+                  S3_SECRET_KEY: str = None,
+                  S3_ENDPOINT: str = None,
+                  S3_REGION: str = None,
+                  MAX_POOL_CONNECTIONS: int = 10):
+    """
+    Client S3 partageable entre threads (les clients boto3 sont thread-safe).
+    MAX_POOL_CONNECTIONS doit couvrir fichiers simultanés x parts par fichier.
+    """
+    return boto3.client('s3',
+                        aws_access_key_id=S3_ACCESS_KEY,
+                        aws_secret_access_key=S3_SECRET_KEY,
+                        endpoint_url=S3_ENDPOINT,
+                        region_name=S3_REGION,
+                        config=Config(max_pool_connections=MAX_POOL_CONNECTIONS,
+                                      retries={'max_attempts': 5, 'mode': 'standard'}))
+
+
+def get_transfer_config(MULTIPART_CHUNK_SIZE: int = 64*1024*1024,
+                        MAX_CONCURRENCY: int = 4):
+    """
+    Configuration des transferts multipart : les fichiers plus gros que
+    MULTIPART_CHUNK_SIZE sont envoyés en parts de cette taille, MAX_CONCURRENCY
+    parts en parallèle par fichier.
+    """
+    return TransferConfig(multipart_threshold=MULTIPART_CHUNK_SIZE,
+                          multipart_chunksize=MULTIPART_CHUNK_SIZE,
+                          max_concurrency=MAX_CONCURRENCY,
+                          use_threads=True)
+
+
+def list_s3_objects(s3, S3_BUCKET: str, S3_PREFIX: str = "") -> dict:
+    """
+    Objets d'un préfixe, en une seule pagination.
+    Ex: {'data/safran-fairy/T_QUOT_SIM2_latest-19580801-20261011.nc':
+             {'size': 1234567, 'etag': '9b2cf535f27731c974343645a3985328-3'}, ...}
+    """
+    objects = {}
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=S3_PREFIX):
+        for obj in page.get('Contents', []):
+            objects[obj['Key']] = {'size': obj['Size'], 'etag': obj['ETag'].strip('"')}
+    return objects
+
+
+class S3Inventory:
+    """
+    Inventaire des objets d'un bucket, listé une fois par run (un préfixe ou
+    plusieurs) puis tenu à jour en mémoire par les uploads et suppressions.
+    Passé à upload_s3, publish_s3, clean_s3, delete_s3_files,
+    generate_stac_catalog et generate_index, il évite de relister le bucket.
+
+    Ex: inventory = S3Inventory(s3, "riverly-data-lake", ["data/safran-fairy", "stac-data/safran-fairy"])
+        inventory.keys("data/safran-fairy", extension=".nc")
+    """
+
+    def __init__(self, s3, S3_BUCKET: str, S3_PREFIXES: list = ("",)):
+        self.s3 = s3
+        self.bucket = S3_BUCKET
+        self.prefixes = [prefix.strip("/") for prefix in S3_PREFIXES]
+        self.objects = {}
+        for prefix in self.prefixes:
+            self.objects.update(list_s3_objects(s3, S3_BUCKET, prefix))
+        print(f"🗂️  Inventaire S3 : {len(self.objects)} objet(s) dans {S3_BUCKET}/"
+              f"{{{', '.join(self.prefixes)}}}")
+
+    def covers(self, S3_PREFIX: str = "") -> bool:
+        """Indique si le préfixe est inclus dans les préfixes inventoriés"""
+        return any(S3_PREFIX.strip("/").startswith(prefix) for prefix in self.prefixes)
+
+    def keys(self, S3_PREFIX: str = "", extension: str = None) -> list:
+        """Clés du préfixe (triées), filtrées éventuellement par extension"""
+        S3_PREFIX = S3_PREFIX.strip("/")
+        return sorted(key for key in self.objects
+                      if key.startswith(S3_PREFIX)
+                      and (extension is None or key.endswith(extension)))
+
+    def get(self, key: str) -> dict | None:
+        return self.objects.get(key)
+
+    def add(self, key: str, size: int, etag: str = None):
+        """Enregistre un objet uploadé (etag None : inconnu, jamais considéré identique)"""
+        self.objects[key] = {'size': size, 'etag': etag}
+
+    def remove(self, keys: list):
+        for key in keys:
+            self.objects.pop(key, None)
+
+
+def delete_s3_keys(s3, S3_BUCKET: str, keys: list, inventory: S3Inventory = None,
+                   BATCH_SIZE: int = 1000) -> list:
+    """
+    Supprime des clés par lots de BATCH_SIZE (DeleteObjects, 1000 clés max).
+
+    Returns:
+        list: Clés effectivement supprimées.
+    """
+    deleted = []
+    for i in range(0, len(keys), BATCH_SIZE):
+        batch = keys[i:i+BATCH_SIZE]
+        response = s3.delete_objects(Bucket=S3_BUCKET,
+                                     Delete={'Objects': [{'Key': key} for key in batch],
+                                             'Quiet': False})
+        deleted.extend(obj['Key'] for obj in response.get('Deleted', []))
+        for error in response.get('Errors', []):
+            print(f"   ❌ {error['Key']} : {error.get('Message', error.get('Code'))}")
+    if inventory is not None:
+        inventory.remove(deleted)
+    return deleted
+
+
+def get_local_etag(local_path, MULTIPART_CHUNK_SIZE: int = 64*1024*1024) -> str:
+    """
+    ETag qu'aurait l'objet S3 après upload_file avec la même taille de part :
+    MD5 du fichier en dessous du seuil multipart, sinon MD5 de la concaténation
+    des MD5 de chaque part suivi de '-<nombre de parts>'.
+    """
+    if os.path.getsize(local_path) < MULTIPART_CHUNK_SIZE:
+        digest = hashlib.md5()
+        with open(local_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(8*1024*1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    part_digests = []
+    with open(local_path, 'rb') as f:
+        for part in iter(lambda: f.read(MULTIPART_CHUNK_SIZE), b''):
+            part_digests.append(hashlib.md5(part).digest())
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+def is_identical(local_path, remote: dict, MULTIPART_CHUNK_SIZE: int = 64*1024*1024) -> bool:
+    """
+    Indique si le fichier local est identique à l'objet distant (taille puis
+    ETag). Le MD5 n'est calculé que si les tailles sont égales.
+    """
+    if remote is None or os.path.getsize(local_path) != remote['size']:
+        return False
+    return get_local_etag(local_path, MULTIPART_CHUNK_SIZE) == remote['etag']
+
+
+@instrument(inputs=lambda args, kwargs: args[1],
+            outputs=lambda result, args, kwargs: result[0])
+def upload_file(s3, local_path, S3_BUCKET: str, s3_key: str, transfer_config=None):
+    """
+    Upload un fichier (multipart au-delà du seuil de transfer_config).
+
+    Returns:
+        tuple: (taille en octets, durée en secondes, ETag de l'objet uploadé)
+    """
+    file_size = os.path.getsize(local_path)
+    start_time = time.time()
+    s3.upload_file(str(local_path), S3_BUCKET, s3_key,
+                   ExtraArgs={'ContentType': get_content_type(str(local_path))},
+                   Config=transfer_config)
+    elapsed = time.time() - start_time
+    # upload_file ne retourne pas l'ETag : relu sur l'objet (simple ou multipart)
+    etag = s3.head_object(Bucket=S3_BUCKET, Key=s3_key)['ETag'].strip('"')
+    return file_size, elapsed, etag
+
+
 def upload_s3(local_paths: list,
               S3_BUCKET: str,
               s3_paths: list = None,
@@ -102,40 +269,305 @@ def upload_s3(local_paths: list,
               S3_ACCESS_KEY: str = None,
               S3_SECRET_KEY: str = None,
               S3_ENDPOINT: str = None,
-              S3_REGION: str = None) -> list:
-    """Upload une liste de fichiers sur S3."""
-
-    s3 = boto3.client('s3',
-                      aws_access_key_id=S3_ACCESS_KEY,
-                      aws_secret_access_key=S3_SECRET_KEY,
-                      endpoint_url=S3_ENDPOINT,
-                      region_name=S3_REGION)
+              S3_REGION: str = None,
+              workers: int = 4,
+              MULTIPART_CHUNK_SIZE: int = 64*1024*1024,
+              MAX_CONCURRENCY: int = 4,
+              diff: bool = False,
+              s3=None,
+              inventory: S3Inventory = None) -> list:
+    """
+    Upload une liste de fichiers sur S3, plusieurs fichiers en parallèle.
+
+    Args:
+        local_paths (list):         Fichiers locaux à uploader.
+        S3_BUCKET (str):            Nom du bucket.
+        s3_paths (list, optional):  Chemins S3 (relatifs à S3_PREFIX) de chaque fichier.
+                                    Si None, les local_paths.
+        S3_PREFIX (str):            Préfixe des clés. Ex: "data/safran-fairy"
+        workers (int):              Nombre de fichiers uploadés simultanément.
+        MULTIPART_CHUNK_SIZE (int): Taille des parts multipart (et seuil du multipart), en octets.
+        MAX_CONCURRENCY (int):      Nombre de parts envoyées en parallèle par fichier.
+        diff (bool):                N'uploade que les fichiers absents ou différents sur S3 :
+                                    le préfixe est listé une fois, puis taille et ETag (MD5
+                                    ou ETag multipart calculé avec MULTIPART_CHUNK_SIZE)
+                                    sont comparés.
+        s3 (optional):              Client boto3 partagé (voir get_s3_client). Si None, un client
+                                    est créé avec un pool de workers x MAX_CONCURRENCY connexions.
+        inventory (S3Inventory, optional): Inventaire du bucket : utilisé par le mode diff à la
+                                    place d'un listing, et mis à jour avec les objets uploadés
+                                    (taille et ETag : un second upload_s3 du même fichier dans
+                                    le run est ignoré).
+
+    Returns:
+        list: Fichiers non uploadés (vide si tout est passé).
+
+    Notes:
+        Un objet uploadé avec une autre taille de part (ou chiffré SSE-KMS)
+        a un ETag différent : il est alors simplement ré-uploadé.
+        Testable sans S3 réel : moto (mock_aws, ou moto_server avec
+        S3_ENDPOINT=http://localhost:5000) ou MinIO via S3_ENDPOINT.
+    """
+    workers = max(1, workers)
+    if s3 is None:
+        s3 = get_s3_client(S3_ACCESS_KEY, S3_SECRET_KEY, S3_ENDPOINT, S3_REGION,
+                           MAX_POOL_CONNECTIONS=workers * MAX_CONCURRENCY + 2)
+    transfer_config = get_transfer_config(MULTIPART_CHUNK_SIZE, MAX_CONCURRENCY)
 
     # Si pas de s3_paths, on utilise les local_paths
     if s3_paths is None:
         s3_paths = local_paths
 
-    not_uploaded = []
-    for i, (local_path, s3_path) in enumerate(zip(local_paths, s3_paths)):
-        # s3_key = f"{S3_PREFIX}/{s3_path}".lstrip("/")
-        s3_key = "/".join([S3_PREFIX.strip("/"), str(s3_path).strip("/")])
-        print(f"\n📤 [{i+1}/{len(local_paths)}] {s3_key}")
-        try:
-            file_size = os.path.getsize(local_path) / (1024**2)
-            start_time = time.time()
-            s3.upload_file(
-                local_path, S3_BUCKET, s3_key,
-                ExtraArgs={'ContentType': get_content_type(local_path)}
-            )
-            elapsed = time.time() - start_time
-            print(f"   ✅ {round(file_size, 2)} MB @ {round(file_size/elapsed, 2)} MB/s")
-        except Exception as e:
-            print(f"   ❌ {str(e)}")
-            not_uploaded.append(local_path)
+    s3_keys = ["/".join([S3_PREFIX.strip("/"), str(s3_path).strip("/")]).lstrip("/")
+               for s3_path in s3_paths]
+
+    skipped = []
+    if diff and local_paths:
+        if inventory is not None and inventory.covers(S3_PREFIX):
+            remote_objects = inventory.objects
+        else:
+            remote_objects = list_s3_objects(s3, S3_BUCKET, S3_PREFIX.strip("/"))
+        to_upload = [(local_path, s3_key) for local_path, s3_key in zip(local_paths, s3_keys)
+                     if not is_identical(local_path, remote_objects.get(s3_key), MULTIPART_CHUNK_SIZE)]
+        uploading = {local_path for local_path, _ in to_upload}
+        skipped = [local_path for local_path in local_paths if local_path not in uploading]
+        if skipped:
+            print(f"⏭️  {len(skipped)}/{len(local_paths)} fichier(s) identique(s) sur S3, ignoré(s)")
+        local_paths, s3_keys = [p for p, _ in to_upload], [k for _, k in to_upload]
 
+    not_uploaded = []
+    total_bytes = 0
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(upload_file, s3, local_path, S3_BUCKET, s3_key,
+                                   transfer_config): (local_path, s3_key)
+                   for local_path, s3_key in zip(local_paths, s3_keys)}
+        for i, future in enumerate(as_completed(futures)):
+            local_path, s3_key = futures[future]
+            try:
+                file_size, elapsed, etag = future.result()
+                total_bytes += file_size
+                if inventory is not None:
+                    inventory.add(s3_key, file_size, etag)
+                size_mb = file_size / (1024**2)
+                print(f"📤 [{i+1}/{len(local_paths)}] {s3_key}")
+                print(f"   ✅ {round(size_mb, 2)} MB @ {round(size_mb/max(elapsed, 1e-6), 2)} MB/s")
+            except Exception as e:
+                print(f"📤 [{i+1}/{len(local_paths)}] {s3_key}")
+                print(f"   ❌ {str(e)}")
+                not_uploaded.append(local_path)
+
+    elapsed = time.time() - start_time
+    total_mb = total_bytes / (1024**2)
     print(f"\nRÉSUMÉ — {len(local_paths)-len(not_uploaded)}/{len(local_paths)} uploadés")
+    if skipped:
+        print(f"   ⏭️  {len(skipped)} fichier(s) identique(s) ignoré(s)")
+    if local_paths:
+        print(f"   📊 {round(total_mb, 2)} MB en {round(elapsed, 2)}s "
+              f"@ {round(total_mb/max(elapsed, 1e-6), 2)} MB/s ({workers} fichier(s) en parallèle)")
     return not_uploaded
 
+def get_stable_name(filename: str) -> str | None:
+    """
+    Nom stable (sans dates) d'un fichier SIM2, ou None si non reconnu.
+    Ex: T_QUOT_SIM2_latest-19580801-20261011.nc → T_QUOT_SIM2_latest.nc
+    """
+    parsed = parse_filename(filename)
+    if not parsed:
+        return None
+    return f"{parsed['variable']}_{parsed['frequency']}_SIM2_{parsed['version']}.nc"
+
+
+def get_part_digests(local_path, PART_SIZE: int) -> list:
+    """MD5 (hex) de chaque part de PART_SIZE octets du fichier"""
+    digests = []
+    with open(local_path, 'rb') as f:
+        for part in iter(lambda: f.read(PART_SIZE), b''):
+            digests.append(hashlib.md5(part).hexdigest())
+    return digests
+
+
+def read_publish_manifest(s3, S3_BUCKET: str, manifest_key: str) -> dict | None:
+    """Manifeste de publication d'une clé stable, ou None s'il n'existe pas"""
+    try:
+        response = s3.get_object(Bucket=S3_BUCKET, Key=manifest_key)
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(response['Body'].read())
+
+
+@instrument(inputs=lambda args, kwargs: args[1],
+            outputs=lambda result, args, kwargs: result[1])
+def upload_delta(s3, local_path, S3_BUCKET: str, s3_key: str, digests: list,
+                 previous: dict, PART_SIZE: int) -> tuple:
+    """
+    Réécrit s3_key en multipart : les parts identiques à l'objet déjà publié
+    (même MD5 au même rang) sont copiées côté serveur (UploadPartCopy), seules
+    les autres sont envoyées.
+
+    Returns:
+        tuple: (ETag du nouvel objet, octets envoyés, octets copiés côté serveur)
+    """
+    file_size = os.path.getsize(local_path)
+    upload = s3.create_multipart_upload(Bucket=S3_BUCKET, Key=s3_key,
+                                        ContentType=get_content_type(str(local_path)))
+    upload_id = upload['UploadId']
+    parts = []
+    sent_bytes = copied_bytes = 0
+    try:
+        with open(local_path, 'rb') as f:
+            for i, digest in enumerate(digests):
+                start = i * PART_SIZE
+                end = min(start + PART_SIZE, file_size) - 1
+                if i < len(previous['parts']) and previous['parts'][i] == digest:
+                    # CopySourceIfMatch : échoue si l'objet a changé depuis le manifeste
+                    response = s3.upload_part_copy(
+                        Bucket=S3_BUCKET, Key=s3_key, UploadId=upload_id, PartNumber=i+1,
+                        CopySource={'Bucket': S3_BUCKET, 'Key': s3_key},
+                        CopySourceRange=f"bytes={start}-{end}",
+                        CopySourceIfMatch=previous['etag'])
+                    etag = response['CopyPartResult']['ETag']
+                    copied_bytes += end - start + 1
+                else:
+                    f.seek(start)
+                    response = s3.upload_part(Bucket=S3_BUCKET, Key=s3_key, UploadId=upload_id,
+                                              PartNumber=i+1, Body=f.read(end - start + 1))
+                    etag = response['ETag']
+                    sent_bytes += end - start + 1
+                parts.append({'PartNumber': i+1, 'ETag': etag})
+        response = s3.complete_multipart_upload(Bucket=S3_BUCKET, Key=s3_key, UploadId=upload_id,
+                                                MultipartUpload={'Parts': parts})
+    except Exception:
+        s3.abort_multipart_upload(Bucket=S3_BUCKET, Key=s3_key, UploadId=upload_id)
+        raise
+    return response['ETag'].strip('"'), sent_bytes, copied_bytes
+
+
+def publish_file(s3, local_path, S3_BUCKET: str, S3_PREFIX: str,
+                 PART_SIZE: int, transfer_config=None) -> tuple:
+    """
+    Publie un fichier daté sous sa clé stable et met à jour son manifeste.
+
+    Returns:
+        tuple: (clé stable, octets envoyés, octets copiés côté serveur)
+               Ex: ('data/safran-fairy/T_QUOT_SIM2_latest.nc', 16777216, 1946157056)
+    """
+    local_path = Path(local_path)
+    parsed = parse_filename(local_path.name)
+    stable_name = get_stable_name(local_path.name)
+    s3_key = "/".join([S3_PREFIX.strip("/"), stable_name]).lstrip("/")
+    manifest_key = s3_key[:-len('.nc')] + ".json"
+
+    file_size = local_path.stat().st_size
+    digests = get_part_digests(local_path, PART_SIZE)
+    previous = read_publish_manifest(s3, S3_BUCKET, manifest_key)
+
+    if (previous and previous['part_size'] == PART_SIZE
+            and previous['size'] == file_size and previous['parts'] == digests):
+        etag, sent_bytes, copied_bytes = previous['etag'], 0, 0
+    elif (previous and previous['part_size'] == PART_SIZE
+            and file_size >= PART_SIZE and any(d in previous['parts'] for d in digests)):
+        etag, sent_bytes, copied_bytes = upload_delta(s3, local_path, S3_BUCKET, s3_key,
+                                                      digests, previous, PART_SIZE)
+    else:
+        _, _, etag = upload_file(s3, local_path, S3_BUCKET, s3_key, transfer_config)
+        sent_bytes, copied_bytes = file_size, 0
+
+    manifest = {
+        'file':         local_path.name,
+        'key':          s3_key,
+        'variable':     parsed['variable'],
+        'version':      parsed['version'],
+        'date_debut':   parsed['date_debut'],
+        'date_fin':     parsed['date_fin'],
+        'size':         file_size,
+        'etag':         etag,
+        'part_size':    PART_SIZE,
+        'parts':        digests,
+        'published_at': datetime.now(timezone.utc).isoformat()
+    }
+    s3.put_object(Bucket=S3_BUCKET, Key=manifest_key, Body=json.dumps(manifest).encode(),
+                  ContentType="application/json")
+    return s3_key, sent_bytes, copied_bytes
+
+
+def publish_s3(local_paths: list,
+               S3_BUCKET: str,
+               S3_PREFIX: str = "",
+               S3_ACCESS_KEY: str = None,
+               S3_SECRET_KEY: str = None,
+               S3_ENDPOINT: str = None,
+               S3_REGION: str = None,
+               workers: int = 4,
+               PART_SIZE: int = 16*1024*1024,
+               MAX_CONCURRENCY: int = 4,
+               s3=None,
+               inventory: S3Inventory = None) -> list:
+    """
+    Publie des fichiers datés sous une clé stable par variable et version,
+    avec un manifeste JSON (plage de dates, MD5 des parts) à côté.
+    Ex: T_QUOT_SIM2_latest-19580801-20261011.nc → data/safran-fairy/T_QUOT_SIM2_latest.nc
+                                                 + data/safran-fairy/T_QUOT_SIM2_latest.json
+
+    Le merge latest ajoute ses jours en fin de fichier : d'un jour à l'autre,
+    la plupart des parts de PART_SIZE octets sont inchangées et sont copiées
+    côté serveur (UploadPartCopy) depuis l'objet déjà publié. Seules les
+    parts modifiées (nouveaux chunks, métadonnées HDF5) sont envoyées.
+
+    Args:
+        local_paths (list): Fichiers SIM2 datés (voir tools.parse_filename).
+        S3_BUCKET (str):    Nom du bucket.
+        S3_PREFIX (str):    Préfixe des clés. Ex: "data/safran-fairy"
+        workers (int):      Nombre de fichiers publiés simultanément.
+        PART_SIZE (int):    Taille des parts (≥ 5 Mio, minimum S3), en octets.
+        MAX_CONCURRENCY (int): Parts envoyées en parallèle lors d'un upload complet.
+        s3 (optional):      Client boto3 partagé (voir get_s3_client).
+        inventory (S3Inventory, optional): Inventaire du bucket, mis à jour avec
+                            les clés stables et leurs manifestes.
+
+    Returns:
+        list: Fichiers non publiés (vide si tout est passé).
+    """
+    workers = max(1, workers)
+    if s3 is None:
+        s3 = get_s3_client(S3_ACCESS_KEY, S3_SECRET_KEY, S3_ENDPOINT, S3_REGION,
+                           MAX_POOL_CONNECTIONS=workers * MAX_CONCURRENCY + 2)
+    transfer_config = get_transfer_config(PART_SIZE, MAX_CONCURRENCY)
+
+    local_paths = [p for p in local_paths if get_stable_name(Path(p).name)]
+    not_published = []
+    total_sent = total_copied = 0
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(publish_file, s3, local_path, S3_BUCKET, S3_PREFIX,
+                                   PART_SIZE, transfer_config): local_path
+                   for local_path in local_paths}
+        for i, future in enumerate(as_completed(futures)):
+            local_path = futures[future]
+            print(f"📤 [{i+1}/{len(local_paths)}] {Path(local_path).name}")
+            try:
+                s3_key, sent_bytes, copied_bytes = future.result()
+                total_sent += sent_bytes
+                total_copied += copied_bytes
+                if inventory is not None:
+                    inventory.add(s3_key, os.path.getsize(local_path))
+                    inventory.add(s3_key[:-len('.nc')] + ".json", 0)
+                if sent_bytes == 0 and copied_bytes == 0:
+                    print(f"   ⏭️  {s3_key} identique")
+                else:
+                    print(f"   ✅ {s3_key} — {round(sent_bytes/1024**2, 2)} MB envoyés, "
+                          f"{round(copied_bytes/1024**2, 2)} MB copiés côté serveur")
+            except Exception as e:
+                print(f"   ❌ {str(e)}")
+                not_published.append(local_path)
+
+    elapsed = time.time() - start_time
+    print(f"\nRÉSUMÉ — {len(local_paths)-len(not_published)}/{len(local_paths)} publiés")
+    print(f"   📊 {round(total_sent/1024**2, 2)} MB envoyés, "
+          f"{round(total_copied/1024**2, 2)} MB copiés côté serveur en {round(elapsed, 2)}s")
+    return not_published
+
+
 # def upload_s3(S3_BUCKET: str,
 #               S3_PREFIX: str,
 #               file_paths: list = None,
@@ -238,12 +670,17 @@ def delete_s3_files(keys: list,
                     S3_ACCESS_KEY: str = os.getenv("S3_ACCESS_KEY"),
                     S3_SECRET_KEY: str = os.getenv("S3_SECRET_KEY"),
                     S3_ENDPOINT: str = os.getenv("S3_ENDPOINT"),
-                    S3_REGION: str = os.getenv("S3_REGION", "eu-west-1")):
-    s3 = boto3.client('s3',
-                      aws_access_key_id=S3_ACCESS_KEY,
-                      aws_secret_access_key=S3_SECRET_KEY,
-                      endpoint_url=S3_ENDPOINT,
-                      region_name=S3_REGION)
-    for key in keys:
-        s3.delete_object(Bucket=S3_BUCKET, Key=key)
+                    S3_REGION: str = os.getenv("S3_REGION", "eu-west-1"),
+                    s3=None,
+                    inventory: S3Inventory = None):
+    """Supprime des clés par lots de 1000 (voir delete_s3_keys)"""
+    if s3 is None:
+        s3 = boto3.client('s3',
+                          aws_access_key_id=S3_ACCESS_KEY,
+                          aws_secret_access_key=S3_SECRET_KEY,
+                          endpoint_url=S3_ENDPOINT,
+                          region_name=S3_REGION)
+    deleted = delete_s3_keys(s3, S3_BUCKET, list(keys), inventory)
+    for key in deleted:
         print(f"🗑️  {key}")
+    return deleted
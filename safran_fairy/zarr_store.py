@@ -0,0 +1,244 @@
+import shutil
+import pandas as pd
+from pathlib import Path
+import xarray as xr
+from art import tprint
+
+from .convert import TIME_UNITS
+from .encoding import get_chunksizes
+from .merge import get_merge_base, get_merge_build
+from .tools import parse_filename
+from .upload_s3 import delete_s3_keys, list_s3_objects
+from .metrics import instrument
+
+
+# Format Zarr v2 + métadonnées consolidées (.zmetadata) : lisible par la
+# plupart des clients (xarray, zarr-python 2 et 3, GDAL, R) en une requête.
+ZARR_FORMAT = 2
+
+# Chunks (time, y, x) des stores si aucun profil d'encodage n'est donné :
+# une carte journalière ou une chronique ponctuelle = quelques objets S3.
+ZARR_DEFAULT_PROFILE = 'balanced'
+
+
+def get_zarr_store(ZARR_DIR, var, version):
+    """
+    Store Zarr d'une variable et d'une version. Le nom ne contient pas les
+    dates : le store est complété en place et ses objets gardent leur clé S3.
+    Ex: ZARR_DIR/T_QUOT_SIM2_latest.zarr
+    """
+    return Path(ZARR_DIR) / f"{var}_QUOT_SIM2_{version}.zarr"
+
+
+def get_zarr_encoding(ds, var, profile=None):
+    """
+    Encodage Zarr : chunks du profil (bornés par la grille, time non borné
+    pour permettre les ajouts) et packing entier repris du NetCDF source.
+    """
+    shape = (ds.sizes['time'],) + ds[var].shape[1:]
+    chunks = get_chunksizes(profile or ZARR_DEFAULT_PROFILE, shape)
+    time_chunk = get_chunksizes(profile or ZARR_DEFAULT_PROFILE, (float('inf'),) + shape[1:])[0]
+    encoding = {var: {'chunks': (time_chunk,) + chunks[1:]},
+                'time': {'units': TIME_UNITS, 'calendar': 'standard', 'dtype': 'float64'}}
+    for key in ('dtype', 'scale_factor', 'add_offset', '_FillValue'):
+        if key in ds[var].encoding:
+            encoding[var][key] = ds[var].encoding[key]
+    return encoding
+
+
+def get_store_files(store) -> dict:
+    """
+    Fichiers d'un store avec leur taille et mtime (ns), pour repérer ceux
+    qu'une écriture crée ou modifie.
+    Ex: {ZARR_DIR/T_QUOT_SIM2_latest.zarr/T/9.0.0: (1234, 1771234567123456789), ...}
+    """
+    if not Path(store).exists():
+        return {}
+    return {f: (f.stat().st_size, f.stat().st_mtime_ns)
+            for f in Path(store).rglob('*') if f.is_file()}
+
+
+def get_year_slabs(ds, start=None):
+    """Tranches annuelles de ds à partir de start (exclu), pour borner la mémoire"""
+    times = pd.to_datetime(ds['time'].values)
+    if start is not None:
+        times = times[times > start]
+    for year in sorted(set(times.year)):
+        year_times = times[times.year == year]
+        yield ds.sel(time=slice(year_times[0], year_times[-1]))
+
+
+@instrument()
+def write_zarr_store(source_file, var, version, ZARR_DIR, OUTPUT_DIR,
+                     profile=None, force=False):
+    """
+    Écrit ou complète le store Zarr d'un fichier mergé.
+
+    Le store existant est complété par les seuls jours postérieurs à sa
+    dernière date (append sur time) ; il est réécrit entièrement si le
+    merge a été reconstruit, sur une autre base ou sur la même (jours
+    révisés, voir merge.get_merge_build), ou si sa date de début diffère.
+
+    Args:
+        source_file (Path):  Fichier mergé. Ex: OUTPUT_DIR/T_QUOT_SIM2_latest-19580801-20261011.nc
+        var (str):           Nom de la variable. Ex: 'T'
+        version (str):       'historical', 'previous' ou 'latest'.
+        ZARR_DIR (Path):     Dossier des stores Zarr.
+        OUTPUT_DIR (Path):   Dossier des fichiers mergés (manifestes de merge).
+        profile (str, optional): Profil d'encodage donnant les chunks. Défaut: 'balanced'.
+        force (bool):        Réécrit le store entièrement.
+
+    Returns:
+        list: Fichiers du store créés ou modifiés par cet appel (à uploader).
+              Liste vide si le store était déjà à jour.
+    """
+    store = get_zarr_store(ZARR_DIR, var, version)
+    source_base = get_merge_base(OUTPUT_DIR, var, version)
+    source_build = get_merge_build(OUTPUT_DIR, var, version)
+
+    with xr.open_dataset(source_file) as ds:
+        dates = pd.to_datetime(ds['time'].values[[0, -1]])
+        attrs = {**ds.attrs,
+                 'source_file': Path(source_file).name,
+                 'source_base': source_base,
+                 'source_build': source_build,
+                 'source_start': dates[0].strftime('%Y%m%d'),
+                 'source_end': dates[1].strftime('%Y%m%d')}
+
+        existing_end = None
+        if store.exists() and not force:
+            try:
+                with xr.open_zarr(store) as existing:
+                    if (existing.attrs.get('source_start') == attrs['source_start']
+                            and existing.attrs.get('source_base') == source_base
+                            and existing.attrs.get('source_build') == source_build):
+                        existing_end = pd.Timestamp(existing['time'].values[-1])
+            except Exception as e:
+                print(f"   ⚠️  Store illisible, réécriture : {e}")
+
+        if existing_end is not None and existing_end >= dates[1]:
+            print(f"   ⏭️  {store.name} à jour")
+            return []
+
+        if existing_end is None:
+            # Les objets S3 absents du nouveau store sont supprimés après
+            # l'upload (voir clean_zarr_s3)
+            shutil.rmtree(store, ignore_errors=True)
+            encoding = get_zarr_encoding(ds, var, profile)
+            print(f"   🧱 {store.name} : écriture complète")
+        else:
+            encoding = None
+            print(f"   ➕ {store.name} : ajout depuis {existing_end.strftime('%Y-%m-%d')}")
+
+        before = get_store_files(store)
+        for slab in get_year_slabs(ds, existing_end):
+            slab = slab.load()
+            slab.attrs = attrs
+            if encoding is not None:
+                for name in slab.variables:
+                    slab[name].encoding = {}
+                slab.to_zarr(store, mode='w', encoding=encoding,
+                             zarr_format=ZARR_FORMAT, consolidated=True)
+                encoding = None
+            else:
+                for name in slab.variables:
+                    slab[name].encoding = {}
+                slab.to_zarr(store, mode='a', append_dim='time',
+                             zarr_format=ZARR_FORMAT, consolidated=True)
+
+    changed_files = [f for f, signature in get_store_files(store).items()
+                     if before.get(f) != signature]
+    print(f"   💾 {store.name} ({len(changed_files)} objet(s) modifié(s))")
+    return changed_files
+
+
+def write_zarr(OUTPUT_DIR, ZARR_DIR, merged_files=None, profile=None, force=False):
+    """
+    Produit un store Zarr chunké par variable et par version à partir des
+    fichiers mergés, pour un accès par requêtes HTTP partielles depuis S3.
+
+    Args:
+        OUTPUT_DIR (str):              Dossier des fichiers mergés.
+        ZARR_DIR (str):                Dossier de sortie des stores Zarr.
+        merged_files (list, optional): Fichiers produits par merge().
+                                       Si None, tous les fichiers mergés de OUTPUT_DIR.
+        profile (str, optional):       Profil d'encodage donnant les chunks Zarr.
+        force (bool):                  Réécrit tous les stores.
+
+    Returns:
+        list: Fichiers des stores créés ou modifiés, à synchroniser sur S3.
+              Ex: [ZARR_DIR/T_QUOT_SIM2_latest.zarr/T/9.0.0, ...]
+    """
+    tprint("zarr", "small")
+    OUTPUT_DIR = Path(OUTPUT_DIR)
+    ZARR_DIR = Path(ZARR_DIR)
+    ZARR_DIR.mkdir(parents=True, exist_ok=True)
+
+    if merged_files is None:
+        merged_files = sorted(OUTPUT_DIR.glob("*_QUOT_SIM2_*.nc"))
+
+    # Fichier le plus récent par (variable, version)
+    sources = {}
+    for file in merged_files:
+        parsed = parse_filename(Path(file).name)
+        if not parsed or parsed['frequency'] != 'QUOT':
+            continue
+        key = (parsed['variable'], parsed['version'])
+        if key not in sources or parsed['date_fin'] > parse_filename(sources[key].name)['date_fin']:
+            sources[key] = Path(file)
+
+    if not sources:
+        print("\n⚠️  Aucun fichier mergé à convertir en Zarr")
+        return []
+
+    changed_files = []
+    for (var, version), source_file in sorted(sources.items()):
+        print(f"\n📦 {source_file.name}")
+        changed_files.extend(write_zarr_store(source_file, var, version, ZARR_DIR,
+                                              OUTPUT_DIR, profile, force))
+
+    print(f"\n{'='*50}")
+    print("RÉSUMÉ")
+    print(f"{'='*50}")
+    print(f"📦 Stores Zarr       : {len(sources)}")
+    print(f"💾 Objets à uploader : {len(changed_files)}")
+
+    return changed_files
+
+
+def clean_zarr_s3(ZARR_DIR, S3_BUCKET: str, S3_PREFIX: str, s3, inventory=None) -> list:
+    """
+    Supprime de S3 les objets des stores Zarr qui n'existent plus dans le
+    store local (ex: chunks au-delà de la nouvelle longueur après une
+    réécriture complète). Seuls les stores présents dans ZARR_DIR, toujours
+    complets localement, sont comparés.
+
+    Args:
+        ZARR_DIR (Path):               Dossier des stores Zarr.
+        S3_BUCKET (str):               Bucket S3.
+        S3_PREFIX (str):               Préfixe des stores sur S3. Ex: "data/safran-fairy/zarr"
+        s3:                            Client boto3.
+        inventory (S3Inventory, optional): Inventaire du bucket (sinon listé).
+
+    Returns:
+        list: Clés supprimées.
+    """
+    S3_PREFIX = S3_PREFIX.strip("/")
+    orphans = []
+    for store in sorted(Path(ZARR_DIR).glob("*.zarr")):
+        store_prefix = f"{S3_PREFIX}/{store.name}/"
+        if inventory is not None and inventory.covers(store_prefix):
+            keys = inventory.keys(store_prefix)
+        else:
+            keys = list(list_s3_objects(s3, S3_BUCKET, store_prefix))
+        local_keys = {f"{S3_PREFIX}/{f.relative_to(ZARR_DIR).as_posix()}"
+                      for f in get_store_files(store)}
+        store_orphans = [key for key in keys
+                         if key.startswith(store_prefix) and key not in local_keys]
+        if store_orphans:
+            print(f"   🗑️  {store.name} : {len(store_orphans)} objet(s) obsolète(s)")
+            orphans.extend(store_orphans)
+
+    if not orphans:
+        return []
+    return delete_s3_keys(s3, S3_BUCKET, orphans, inventory)
@@ -0,0 +1,145 @@
+"""
+Tests du client Dataverse (liste en cache, remplacement, reprise sur verrou)
+contre un serveur HTTP local qui simule l'API d'un dataset.
+
+    python -m pytest tests
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from safran_fairy import dataverse_tools
+from safran_fairy.dataverse_tools import DataverseClient
+
+
+DOI = "doi:10.00000/TEST"
+
+
+class DatasetStub:
+    """Dataset simulé : ses fichiers, les requêtes reçues et les verrous à renvoyer"""
+
+    def __init__(self, files):
+        self.files = {data_file['filename']: data_file for data_file in files}
+        self.requests = []
+        self.locked_posts = 0
+        self.next_id = 1000
+
+
+def make_handler(dataset):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            dataset.requests.append(('GET', self.path, None))
+            files = [{'dataFile': data_file} for data_file in dataset.files.values()]
+            self.reply(200, {'data': {'latestVersion': {'files': files}}})
+
+        def do_DELETE(self):
+            dataset.requests.append(('DELETE', self.path, None))
+            file_id = int(self.path.rstrip('/').split('/')[-1])
+            dataset.files = {name: f for name, f in dataset.files.items() if f['id'] != file_id}
+            self.send_response(204)
+            self.end_headers()
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            dataset.requests.append(('POST', self.path, body))
+            if dataset.locked_posts:
+                dataset.locked_posts -= 1
+                return self.reply(409, {'status': 'ERROR',
+                                        'message': 'Dataset cannot be edited due to dataset lock.'})
+            filename = body.split(b'filename="')[1].split(b'"')[0].decode()
+            if '/replace' in self.path:
+                file_id = int(self.path.split('/')[-2])
+                dataset.files = {name: f for name, f in dataset.files.items() if f['id'] != file_id}
+            dataset.next_id += 1
+            data_file = {'id': dataset.next_id, 'filename': filename}
+            dataset.files[filename] = data_file
+            self.reply(200, {'status': 'OK', 'data': {'files': [{'dataFile': data_file}]}})
+
+    return Handler
+
+
+@pytest.fixture
+def dataset():
+    return DatasetStub([{'id': 1, 'filename': 'T_QUOT_SIM2_latest-19580801-20261010.nc'},
+                        {'id': 2, 'filename': 'PRENEI_QUOT_SIM2_latest-19580801-20261010.nc'}])
+
+
+@pytest.fixture
+def client(dataset, monkeypatch):
+    # Pas d'attente entre les reprises sur verrou
+    monkeypatch.setattr(dataverse_tools.time, 'sleep', lambda seconds: None)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(dataset))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield DataverseClient(DOI, f"http://127.0.0.1:{server.server_address[1]}", "token",
+                          workers=2, RETRIES=3)
+    server.shutdown()
+    server.server_close()
+
+
+def get_requests(dataset, method):
+    return [request for request in dataset.requests if request[0] == method]
+
+
+def test_list_files_is_cached(client, dataset, tmp_path):
+    assert client.get_existing_files() == set(dataset.files)
+    assert client.delete_file('PRENEI_QUOT_SIM2_latest-19580801-20261010.nc')
+    new_file = tmp_path / 'T_QUOT_SIM2_latest-19580801-20261011.nc'
+    new_file.write_bytes(b'netcdf')
+    client.add_file(new_file, {'description': 'T'})
+
+    # Liste tenue à jour par la suppression et l'ajout, sans relire le dataset
+    assert client.get_existing_files() == {'T_QUOT_SIM2_latest-19580801-20261010.nc',
+                                           'T_QUOT_SIM2_latest-19580801-20261011.nc'}
+    assert len(get_requests(dataset, 'GET')) == 1
+
+    client.invalidate()
+    assert client.get_existing_files() == set(dataset.files)
+    assert len(get_requests(dataset, 'GET')) == 2
+
+
+def test_replace_file_forces_replace(client, dataset, tmp_path):
+    new_file = tmp_path / 'T_QUOT_SIM2_latest-19580801-20261011.nc'
+    new_file.write_bytes(b'netcdf')
+    size, _ = client.replace_file('T_QUOT_SIM2_latest-19580801-20261010.nc', new_file,
+                                  {'description': 'T'})
+
+    assert size == len(b'netcdf')
+    (_, path, body), = get_requests(dataset, 'POST')
+    assert path == '/api/files/1/replace'
+    json_data = json.loads(body.split(b'application/json\r\n\r\n')[1].split(b'\r\n--')[0])
+    assert json_data == {'description': 'T', 'forceReplace': True}
+    assert client.get_existing_files() == {'T_QUOT_SIM2_latest-19580801-20261011.nc',
+                                           'PRENEI_QUOT_SIM2_latest-19580801-20261010.nc'}
+    assert not get_requests(dataset, 'DELETE')
+
+
+def test_post_retries_while_dataset_is_locked(client, dataset, tmp_path):
+    new_file = tmp_path / 'ETP_QUOT_SIM2_latest-19580801-20261011.nc'
+    new_file.write_bytes(b'netcdf')
+
+    dataset.locked_posts = 2
+    client.add_file(new_file, {'description': 'ETP'})
+    assert len(get_requests(dataset, 'POST')) == 3
+    assert new_file.name in client.get_existing_files()
+
+    # Verrou persistant : abandon après RETRIES reprises
+    dataset.locked_posts = 10
+    with pytest.raises(RuntimeError, match='409'):
+        client.add_file(new_file, {'description': 'ETP'})
+    assert len(get_requests(dataset, 'POST')) == 3 + 4
@@ -0,0 +1,128 @@
+"""
+Tests des transferts S3 (diff par ETag, suppression par lots, publication
+par UploadPartCopy) sur un bucket simulé par moto.
+
+    pip install pytest moto
+    python -m pytest tests
+"""
+import os
+import json
+
+import pytest
+
+moto = pytest.importorskip("moto")
+import boto3
+
+from safran_fairy.upload_s3 import (S3Inventory, delete_s3_keys, get_local_etag,
+                                    publish_s3, upload_s3)
+
+
+S3_BUCKET = "safran-test"
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "eu-west-1")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="eu-west-1")
+        client.create_bucket(Bucket=S3_BUCKET,
+                             CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+        yield client
+
+
+def write_file(path, size, seed=0):
+    path.write_bytes(bytes((i + seed) % 251 for i in range(1024)) * (size // 1024))
+    return path
+
+
+def test_upload_diff_skips_identical_files(s3, tmp_path):
+    small = write_file(tmp_path / "small.nc", 64 * 1024)
+    large = write_file(tmp_path / "large.nc", 12 * MB)
+    options = dict(S3_PREFIX="data", s3=s3, MULTIPART_CHUNK_SIZE=5 * MB)
+
+    assert upload_s3([small, large], S3_BUCKET, ["small.nc", "large.nc"], **options) == []
+    head = s3.head_object(Bucket=S3_BUCKET, Key="data/large.nc")
+    assert head['ETag'].strip('"') == get_local_etag(large, 5 * MB)
+    assert head['ETag'].strip('"').endswith("-3")
+
+    # Fichiers inchangés : rien n'est envoyé
+    uploaded = []
+    put_object, create_multipart_upload = s3.put_object, s3.create_multipart_upload
+    s3.put_object = lambda **kwargs: uploaded.append(kwargs['Key']) or put_object(**kwargs)
+    s3.create_multipart_upload = (lambda **kwargs: uploaded.append(kwargs['Key'])
+                                  or create_multipart_upload(**kwargs))
+    assert upload_s3([small, large], S3_BUCKET, ["small.nc", "large.nc"],
+                     diff=True, **options) == []
+    assert uploaded == []
+
+    # Fichier modifié (même taille) : seul lui est renvoyé
+    write_file(small, 64 * 1024, seed=1)
+    assert upload_s3([small, large], S3_BUCKET, ["small.nc", "large.nc"],
+                     diff=True, **options) == []
+    assert uploaded == ["data/small.nc"]
+
+
+def test_upload_records_etag_in_inventory(s3, tmp_path):
+    local_file = write_file(tmp_path / "T.nc", 64 * 1024)
+    inventory = S3Inventory(s3, S3_BUCKET, ["data"])
+
+    upload_s3([local_file], S3_BUCKET, ["T.nc"], S3_PREFIX="data", s3=s3, inventory=inventory)
+    remote = inventory.get("data/T.nc")
+    assert remote == {'size': 64 * 1024, 'etag': get_local_etag(local_file)}
+
+    # Le second upload du run est ignoré grâce à l'ETag de l'inventaire
+    s3.list_objects_v2 = None
+    s3.upload_file = None
+    assert upload_s3([local_file], S3_BUCKET, ["T.nc"], S3_PREFIX="data", s3=s3,
+                     inventory=inventory, diff=True) == []
+
+
+def test_delete_s3_keys_batches_beyond_1000(s3):
+    keys = [f"data/file_{i:04d}.nc" for i in range(2500)]
+    for key in keys:
+        s3.put_object(Bucket=S3_BUCKET, Key=key, Body=b"")
+    inventory = S3Inventory(s3, S3_BUCKET, ["data"])
+
+    batches = []
+    delete_objects = s3.delete_objects
+    s3.delete_objects = lambda **kwargs: (batches.append(len(kwargs['Delete']['Objects']))
+                                          or delete_objects(**kwargs))
+    deleted = delete_s3_keys(s3, S3_BUCKET, keys, inventory)
+
+    assert batches == [1000, 1000, 500]
+    assert sorted(deleted) == keys
+    assert s3.list_objects_v2(Bucket=S3_BUCKET).get('KeyCount') == 0
+    assert inventory.keys("data") == []
+
+
+def test_publish_copies_unchanged_parts(s3, tmp_path):
+    PART_SIZE = 5 * MB
+    name = "T_QUOT_SIM2_latest-19580801-20261010.nc"
+    first = write_file(tmp_path / name, 3 * PART_SIZE)
+    assert publish_s3([first], S3_BUCKET, "data", s3=s3, PART_SIZE=PART_SIZE) == []
+
+    # Jour suivant : mêmes données, une part ajoutée en fin de fichier
+    first.unlink()
+    second = tmp_path / "T_QUOT_SIM2_latest-19580801-20261011.nc"
+    with open(second, 'wb') as f:
+        f.write(bytes((i % 251) for i in range(1024)) * (3 * PART_SIZE // 1024))
+        f.write(os.urandom(MB))
+
+    copies = []
+    upload_part_copy = s3.upload_part_copy
+    s3.upload_part_copy = lambda **kwargs: (copies.append(kwargs['PartNumber'])
+                                            or upload_part_copy(**kwargs))
+    assert publish_s3([second], S3_BUCKET, "data", s3=s3, PART_SIZE=PART_SIZE) == []
+
+    assert copies == [1, 2, 3]
+    body = s3.get_object(Bucket=S3_BUCKET, Key="data/T_QUOT_SIM2_latest.nc")['Body'].read()
+    assert body == second.read_bytes()
+    manifest = json.loads(s3.get_object(Bucket=S3_BUCKET,
+                                        Key="data/T_QUOT_SIM2_latest.json")['Body'].read())
+    assert manifest['file'] == second.name
+    assert manifest['date_fin'] == "20261011"
+    assert manifest['etag'] == s3.head_object(Bucket=S3_BUCKET,
+                                              Key="data/T_QUOT_SIM2_latest.nc")['ETag'].strip('"')